@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import base64
+import json
+import math
+import struct
+from urllib.parse import urlparse, parse_qs
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+class FakeElevenLabs:
+    """
+    Local stand-in for the ElevenLabs stream-input WebSocket API.
+
+    Speaks the same protocol as wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream-input:
+    BOS ({"text": " ", "voice_settings": ...}), text chunks, keep-alive spaces, EOS ({"text": ""}),
+    base64 PCM frames back and a closing {"isFinal": true}. Latency knobs emulate the real service:
+      handshake_delay:   added before the WebSocket upgrade (TLS + auth cost)
+      first_byte_delay:  per context, before the first audio frame
+      realtime_factor:   how much faster than real time audio is generated (paced, not dumped)
+    """
+    def __init__(self, host="127.0.0.1", port=0, handshake_delay=0.08, first_byte_delay=0.15,
+                 realtime_factor=4.0, chunk_ms=250, chars_per_second=15.0, sample_rate=24000):
+        self.host = host
+        self.port = port
+        self.handshake_delay = handshake_delay
+        self.first_byte_delay = first_byte_delay
+        self.realtime_factor = realtime_factor
+        self.chunk_ms = chunk_ms
+        self.chars_per_second = chars_per_second
+        self.sample_rate = sample_rate
+        self.server = None
+        self.stats = {"connections": 0, "contexts": 0, "keepalives": 0, "timeouts": 0, "audio_bytes": 0}
+
+        # One canned chunk of a 220Hz tone, reused for every frame
+        samples = int( sample_rate * chunk_ms / 1000 )
+        pcm = struct.pack( f"<{samples}h", *( int( 6000 * math.sin( 2 * math.pi * 220 * i / sample_rate ) ) for i in range( samples ) ) )
+        self.chunk_b64 = base64.b64encode( pcm ).decode( "ascii" )
+        self.chunk_bytes = len( pcm )
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await serve( self._handler, self.host, self.port, process_request=self._process_request )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _process_request(self, connection, request):
+        if self.handshake_delay:
+            await asyncio.sleep( self.handshake_delay )
+        if not request.path.startswith( "/v1/text-to-speech/" ) or "/stream-input" not in request.path:
+            return connection.respond( 404, "Not Found\n" )
+        if not request.headers.get( "xi-api-key" ):
+            return connection.respond( 401, "Missing xi-api-key\n" )
+        return None
+
+    async def _handler(self, websocket):
+        self.stats["connections"] += 1
+        query = parse_qs( urlparse( websocket.request.path ).query )
+        inactivity_timeout = float( query.get( "inactivity_timeout", ["20"] )[0] )
+
+        texts = asyncio.Queue()
+        generator = None
+        try:
+            bos = json.loads( await asyncio.wait_for( websocket.recv(), inactivity_timeout ) )
+            if bos.get( "text" ) != " ":
+                await websocket.close( 1008, "First message must be BOS" )
+                return
+
+            while True:
+                try:
+                    message = await asyncio.wait_for( websocket.recv(), inactivity_timeout )
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    await websocket.close( 1008, "Inactivity timeout" )
+                    return
+                text = json.loads( message ).get( "text" )
+                if text == " ":
+                    self.stats["keepalives"] += 1
+                    continue
+                if generator is None:
+                    self.stats["contexts"] += 1
+                    generator = asyncio.create_task( self._generate( websocket, texts ) )
+                await texts.put( text )
+                if text == "":
+                    await generator
+                    await websocket.close()
+                    return
+        except ConnectionClosed:
+            pass
+        finally:
+            if generator is not None:
+                generator.cancel()
+
+    async def _generate(self, websocket, texts):
+        await asyncio.sleep( self.first_byte_delay )
+        while True:
+            text = await texts.get()
+            if text == "":
+                await websocket.send( json.dumps( {"isFinal": True} ) )
+                return
+            seconds = max( 0.2, len( text.strip() ) / self.chars_per_second )
+            frames = max( 1, int( seconds * 1000 / self.chunk_ms ) )
+            for _ in range( frames ):
+                await websocket.send( json.dumps( {"audio": self.chunk_b64, "isFinal": None} ) )
+                self.stats["audio_bytes"] += self.chunk_bytes
+                await asyncio.sleep( self.chunk_ms / 1000 / self.realtime_factor )
+
+async def _serve_forever(args):
+    server = await FakeElevenLabs( host=args.host, port=args.port, handshake_delay=args.handshake_ms / 1000,
+                                   first_byte_delay=args.first_byte_ms / 1000 ).start()
+    print( f"Fake ElevenLabs listening on {server.url}" )
+    print( f"Run: export ELEVENLABS_WS_URL={server.url}" )
+    await asyncio.Future()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Fake ElevenLabs stream-input server" )
+    parser.add_argument( "--host", default="127.0.0.1" )
+    parser.add_argument( "--port", type=int, default=8765 )
+    parser.add_argument( "--handshake-ms", type=float, default=80 )
+    parser.add_argument( "--first-byte-ms", type=float, default=150 )
+    try:
+        asyncio.run( _serve_forever( parser.parse_args() ) )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,67 @@
+"""
+Recovery rate and cost of turning raw model text into a usable reply.
+
+Compares strict json.loads, the old fence-splitting extract_json and parse_response (repair + schema
+validation) over benchmarks/corpus/malformed_responses.jsonl. The corpus is hand-curated from the
+failure modes seen in practice (fences, prose, truncation, Python literals, trailing commas, ...);
+each case records the voice text and capture flag a correct parse should produce, or null when
+nothing usable can be recovered:
+    python -m benchmarks.llm_parsing --repeat 2000 --verbose
+"""
+import argparse
+import json
+import os
+import time
+from modules.llm.parsing import parse_response
+
+CORPUS = os.path.join( os.path.dirname( __file__ ), "corpus", "malformed_responses.jsonl" )
+
+def strict(content):
+    return json.loads( content )
+
+def fence_split(content):
+    # extract_json() before repair/validation existed
+    if "```json" in content:
+        content = content.split( "```json" )[1].split( "```" )[0].strip()
+    elif "```" in content:
+        content = content.split( "```" )[1].strip()
+    return json.loads( content )
+
+PARSERS = [( "json.loads", strict ), ( "fence-split", fence_split ), ( "parse_response", parse_response )]
+
+def outcome(parser, case):
+    """
+    True when the parser produced exactly what the case expects (a refusal counts when nothing is recoverable).
+    """
+    try:
+        data = parser( case["raw"] )
+        voice = data.get( "voice_output" )
+        text = voice.get( "text" ) if isinstance( voice, dict ) else None
+        capture = ( data.get( "data_management" ) or {} ).get( "will_capture" ) is True
+    except ( ValueError, AttributeError, IndexError, TypeError ):
+        return case["text"] is None
+    return text == case["text"] and capture == case["will_capture"]
+
+def main(args):
+    with open( CORPUS ) as f:
+        cases = [json.loads( line ) for line in f if line.strip()]
+    print( f"{len( cases )} cases, {args.repeat} passes" )
+    for name, parser in PARSERS:
+        results = [outcome( parser, case ) for case in cases]
+        start = time.perf_counter()
+        for _ in range( args.repeat ):
+            for case in cases:
+                try:
+                    parser( case["raw"] )
+                except ( ValueError, IndexError ):
+                    pass
+        per_doc = ( time.perf_counter() - start ) / ( args.repeat * len( cases ) ) * 1e6
+        print( f"{name:<15} correct {sum( results ):3d}/{len( cases )}  {per_doc:7.1f} us/doc" )
+        if args.verbose:
+            print( "                missed: " + ", ".join( c["case"] for c, ok in zip( cases, results ) if not ok ) )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="LLM reply parsing robustness" )
+    parser.add_argument( "--repeat", type=int, default=2000 )
+    parser.add_argument( "--verbose", action="store_true" )
+    main( parser.parse_args() )
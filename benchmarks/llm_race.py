@@ -0,0 +1,62 @@
+"""
+Time to the first voice_output.text character (what TTS waits for): one provider vs racing all vs hedged racing.
+
+Runs offline against modules.llm.mock.MockProvider backends with a long-tail latency profile:
+    python -m benchmarks.llm_race --turns 200 --hedge-ms 450
+"""
+import argparse
+import asyncio
+import time
+from modules.llm.mock import MockProvider
+from modules.llm.parsing import JSONStringStreamer
+from modules.llm.racing import RacingProvider
+from modules.metrics import LatencyHistogram
+
+def make_backends(args, seed):
+    return [
+        MockProvider( "fast-flaky", latency=0.30, jitter=0.08, slow_rate=args.slow_rate, slow_factor=6,
+                      failure_rate=args.failure_rate, seed=seed ),
+        MockProvider( "steady", latency=0.40, jitter=0.05, slow_rate=args.slow_rate / 2, slow_factor=3, seed=seed + 1 ),
+        MockProvider( "slow", latency=0.60, jitter=0.10, seed=seed + 2 ),
+    ]
+
+async def time_to_voice(llm, messages):
+    start = time.perf_counter()
+    streamer = JSONStringStreamer()
+    deltas = llm.stream( "system", messages )
+    try:
+        async for delta in deltas:
+            if streamer.feed( delta ):
+                return time.perf_counter() - start
+    finally:
+        await deltas.aclose()
+    return time.perf_counter() - start
+
+async def run(name, llm, backends, turns):
+    latencies = LatencyHistogram( window=turns )
+    messages = [{"role": "user", "content": "What should I plant next to tomatoes?"}]
+    for _ in range( turns ):
+        latencies.record( await time_to_voice( llm, messages ) )
+    calls = sum( b.calls for b in backends ) / turns
+    print( f"{name:<14} p50 {latencies.percentile( 50 ) * 1000:7.1f}  p95 {latencies.percentile( 95 ) * 1000:7.1f}  "
+           f"p99 {latencies.percentile( 99 ) * 1000:7.1f}  requests/turn {calls:4.2f}" )
+    if isinstance( llm, RacingProvider ):
+        for p in llm.providers:
+            print( f"{'':<14}   {p.name}: {llm.stats[p.name]}" )
+
+async def main(args):
+    print( f"{args.turns} turns, slow_rate {args.slow_rate}, failure_rate {args.failure_rate} (ms to first voice text)" )
+    backends = make_backends( args, 1 )
+    await run( "single", backends[0], backends[:1], args.turns )
+    backends = make_backends( args, 1 )
+    await run( "race-all", RacingProvider( backends ), backends, args.turns )
+    backends = make_backends( args, 1 )
+    await run( "hedged", RacingProvider( backends, hedge_delay=args.hedge_ms / 1000 ), backends, args.turns )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Provider racing / hedging latency" )
+    parser.add_argument( "--turns", type=int, default=200 )
+    parser.add_argument( "--hedge-ms", type=float, default=450 )
+    parser.add_argument( "--slow-rate", type=float, default=0.1 )
+    parser.add_argument( "--failure-rate", type=float, default=0.05 )
+    asyncio.run( main( parser.parse_args() ) )
@@ -0,0 +1,75 @@
+"""
+"What did I say about X": scanning every note (grep) vs the FTS5 index, plus the index's build
+and per-save update cost, on a synthetic brain of N notes (or a copy of a real one with --source).
+    python -m benchmarks.note_search --notes 1000 --sections 8
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from benchmarks.recall import WORDS, synthetic_brain, percentile
+from modules.note_search import NoteSearch
+from modules.semantic_index import note_files
+
+def grep(directory, word):
+    pattern = re.compile( re.escape( word ), re.IGNORECASE )
+    hits = []
+    for name in note_files( directory ):
+        with open( os.path.join( directory, name ), encoding="utf-8" ) as f:
+            hits += [( name, line ) for line in f if pattern.search( line )]
+    return hits
+
+def timed(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn( query )
+        latencies.append( ( time.perf_counter() - start ) * 1000 )
+    return statistics.median( latencies ), percentile( latencies, 0.95 )
+
+def main(args):
+    rng = random.Random( 5 )
+    with tempfile.TemporaryDirectory() as tmp:
+        brain = os.path.join( tmp, "brain" )
+        if args.source:
+            shutil.copytree( args.source, brain, ignore=shutil.ignore_patterns( ".*" ) )
+        else:
+            os.makedirs( brain )
+            synthetic_brain( brain, args.notes, args.sections )
+
+        start = time.perf_counter()
+        index = NoteSearch( brain )
+        indexed = index.sync()
+        print( f"build: {indexed} chunks from {index.files()} notes in {( time.perf_counter() - start ) * 1000:.0f}ms" )
+
+        queries = [rng.choice( WORDS ) for _ in range( args.queries )]
+        p50, p95 = timed( lambda q: grep( brain, q ), queries[:max( 1, args.queries // 10 )] )
+        print( f"grep every note: p50 {p50:.2f}ms, p95 {p95:.2f}ms" )
+        p50, p95 = timed( lambda q: index.search( q, limit=5 ), queries )
+        print( f"index search:    p50 {p50:.2f}ms, p95 {p95:.2f}ms" )
+
+        names = sorted( note_files( brain ) )
+        costs = []
+        for _ in range( args.appends ):
+            name = rng.choice( names )
+            with open( os.path.join( brain, name ), "a", encoding="utf-8" ) as f:
+                f.write( " ".join( rng.choice( WORDS ) for _ in range( 40 ) ) + "\n" )
+            start = time.perf_counter()
+            index.update( name )
+            costs.append( ( time.perf_counter() - start ) * 1000 )
+        print( f"update after a save ({args.appends} appends): p50 {statistics.median( costs ):.2f}ms, "
+               f"p95 {percentile( costs, 0.95 ):.2f}ms" )
+        index.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Full-text note search vs scanning the files" )
+    parser.add_argument( "--notes", type=int, default=500 )
+    parser.add_argument( "--sections", type=int, default=6 )
+    parser.add_argument( "--queries", type=int, default=500 )
+    parser.add_argument( "--appends", type=int, default=100 )
+    parser.add_argument( "--source", help="Copy of an existing brain/ directory instead of synthetic notes" )
+    main( parser.parse_args() )
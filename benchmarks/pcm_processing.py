@@ -0,0 +1,56 @@
+"""
+Per-chunk cost of mapping ElevenLabs PCM to the device layout: audioop vs modules.audio.PcmProcessor.
+
+    python -m benchmarks.pcm_processing --chunks 2000 --chunk-ms 250
+"""
+import argparse
+import math
+import struct
+import time
+import warnings
+from modules.audio import PcmProcessor
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter( "ignore", DeprecationWarning )
+        import audioop
+except ImportError:
+    # Removed in Python 3.13
+    audioop = None
+
+def make_chunk(chunk_ms, rate=24000):
+    samples = int( rate * chunk_ms / 1000 )
+    return struct.pack( f"<{samples}h", *( int( 6000 * math.sin( 2 * math.pi * 220 * i / rate ) ) for i in range( samples ) ) )
+
+def bench(fn, chunk, chunks):
+    fn( chunk )
+    start = time.perf_counter()
+    for _ in range( chunks ):
+        fn( chunk )
+    return ( time.perf_counter() - start ) / chunks * 1e6
+
+def main(args):
+    chunk = make_chunk( args.chunk_ms )
+    cases = []
+    if audioop is not None:
+        cases.append( ( "audioop tostereo", lambda pcm: audioop.tostereo( pcm, 2, 1, 1 ) ) )
+        cases.append( ( "audioop tostereo + ratecv 48k", lambda pcm: audioop.tostereo( audioop.ratecv( pcm, 2, 1, 24000, 48000, None )[0], 2, 1, 1 ) ) )
+        cases.append( ( "audioop tostereo + mul 0.8", lambda pcm: audioop.tostereo( audioop.mul( pcm, 2, 0.8 ), 2, 1, 1 ) ) )
+    else:
+        print( "audioop not available on this Python, numpy only" )
+    cases.append( ( "numpy 2ch", PcmProcessor( channels=2 ).process ) )
+    cases.append( ( "numpy 2ch + resample 48k", PcmProcessor( dst_rate=48000, channels=2 ).process ) )
+    cases.append( ( "numpy 2ch + gain 0.8", PcmProcessor( channels=2, gain=0.8 ).process ) )
+    cases.append( ( "numpy 6ch", PcmProcessor( channels=6 ).process ) )
+    cases.append( ( "numpy 6ch + resample 44.1k", PcmProcessor( dst_rate=44100, channels=6 ).process ) )
+
+    print( f"{len( chunk )} byte chunks ({args.chunk_ms} ms of 24kHz mono), {args.chunks} iterations" )
+    print( f"{'path':<32} {'us/chunk':>10}" )
+    for name, fn in cases:
+        print( f"{name:<32} {bench( fn, chunk, args.chunks ):>10.1f}" )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="PCM channel mapping micro-benchmark" )
+    parser.add_argument( "--chunks", type=int, default=2000 )
+    parser.add_argument( "--chunk-ms", type=float, default=250 )
+    main( parser.parse_args() )
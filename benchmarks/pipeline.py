@@ -0,0 +1,201 @@
+"""
+End-to-end benchmark of main.pipeline, offline and reproducible: a synthesized recording goes
+through the real VAD/ASR path (a scripted backend stands in for the recognizer), MockProvider
+answers with a configurable latency distribution, TTS streams from the fake ElevenLabs server
+into a null sink paced like a sound card, and captures land in a temporary brain/.
+Reports throughput, per-stage turn latency percentiles (from the Tracer) and event-loop lag with
+the stalls that caused it (LoopMonitor); --fail-on-block exits non-zero when the loop was blocked.
+    python -m benchmarks.pipeline --turns 10 --llm-ms 400 --jitter-ms 150 --slow-rate 0.1
+    python -m benchmarks.pipeline --speed 2 --json > run.json
+    python -m benchmarks.pipeline --fail-on-block 50
+
+--speed plays everything that is paced by audio (the recording, synthesis, playback) that many
+times faster than real time; the LLM, ASR and network latencies stay as given.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import wave
+import main as assistant
+from benchmarks.fake_elevenlabs import FakeElevenLabs
+from modules.asr import ASR
+from modules.asr_backends.base import ASRBackend, RecognitionStream
+from modules.context import ConversationContext
+from modules.llm.mock import MockProvider
+from modules.loop_monitor import LoopMonitor
+from modules.playback import NullSink
+from modules.session_store import SessionStore
+from modules.storage import Storage
+from modules.tracing import Tracer
+from modules.tts import TTS, ConnectionPool
+
+UTTERANCES = (
+    "I have an idea for a modular garden planter",
+    "the modules should click together without tools",
+    "maybe sell them as a subscription with seasonal seeds",
+    "what would the pricing look like for a starter kit",
+    "remind me to sketch the irrigation channel tomorrow",
+    "the battery for the sensor should last a whole season",
+)
+
+def synthesize(path, turns, speech_s, gap_s, sample_rate=16000):
+    """
+    Writes a mono 16-bit WAV: `turns` tone bursts of speech_s (syllable-like amplitude modulation)
+    each followed by gap_s of silence, then one more burst for "exit".
+    """
+    silence = bytes( int( sample_rate * gap_s ) * 2 )
+    n = int( sample_rate * speech_s )
+    burst = struct.pack( f"<{n}h", *( int( 7000 * ( 0.6 + 0.4 * math.sin( 2 * math.pi * 4 * i / sample_rate ) )
+                                           * math.sin( 2 * math.pi * 180 * i / sample_rate ) ) for i in range( n ) ) )
+    with wave.open( path, "wb" ) as f:
+        f.setnchannels( 1 )
+        f.setsampwidth( 2 )
+        f.setframerate( sample_rate )
+        f.writeframes( bytes( int( sample_rate * 0.5 ) * 2 ) )
+        for _ in range( turns + 1 ):
+            f.writeframes( burst + silence )
+
+class ScriptedStream(RecognitionStream):
+    def __init__(self, backend):
+        self.backend = backend
+        self.bytes = 0
+
+    def accept(self, pcm: bytes):
+        self.bytes += len( pcm )
+
+    def finish(self) -> str:
+        time.sleep( self.backend.latency )
+        return self.backend.next_transcript()
+
+    def cancel(self):
+        self.backend.cancelled += 1
+
+class ScriptedBackend(ASRBackend):
+    """
+    Recognizer stand-in: every finished utterance takes `latency` seconds and yields the next line.
+    """
+    def __init__(self, transcripts, latency=0.2):
+        self.latency = latency
+        self.cancelled = 0
+        self._lines = iter( transcripts )
+        self._lock = threading.Lock()
+
+    def next_transcript(self) -> str:
+        with self._lock:
+            return next( self._lines, "exit" )
+
+    def open_stream(self, on_partial=None) -> RecognitionStream:
+        return ScriptedStream( self )
+
+async def run(args, tmp):
+    os.environ.setdefault( "ELEVENLABS_API_KEY", "fake-key" )
+    wav = os.path.join( tmp, "script.wav" )
+    synthesize( wav, args.turns, args.speech_s, args.gap_s )
+    transcripts = [line for _, line in zip( range( args.turns ), itertools.cycle( UTTERANCES ) )] + ["exit"]
+
+    server = await FakeElevenLabs( handshake_delay=args.handshake_ms / 1000, first_byte_delay=args.tts_first_byte_ms / 1000,
+                                   realtime_factor=args.realtime_factor, chars_per_second=15.0 * args.speed ).start()
+    sink = NullSink( int( 48000 * args.speed ) )
+    tts = TTS( voice_id="bench-voice", channels=1, pool=ConnectionPool( "fake-key", base_url=server.url ), sink=sink )
+    llm = MockProvider( latency=args.llm_ms / 1000, jitter=args.jitter_ms / 1000, slow_rate=args.slow_rate,
+                        slow_factor=args.slow_factor, chars_per_second=args.llm_cps, text=args.reply,
+                        capture_rate=args.capture_rate, seed=args.seed )
+    backend = ScriptedBackend( transcripts, latency=args.asr_ms / 1000 )
+    asr = ASR( backend=backend, input_wav=wav, input_speed=args.speed )
+    brain = os.path.join( tmp, "brain" )
+    storage = Storage( brain, journal=False )
+    await storage.open()
+    session = None
+    if args.session:
+        session = SessionStore( os.path.join( brain, ".sessions" ) )
+        session.start()
+    tracer = Tracer( "" )
+
+    monitor = LoopMonitor( args.block_ms, verbose=False )
+    monitor.start()
+    start = time.perf_counter()
+    try:
+        await assistant.pipeline( asr, llm, tts, storage, context=ConversationContext( llm ), session=session, tracer=tracer )
+    finally:
+        elapsed = time.perf_counter() - start
+        loop = monitor.close()
+        tts.close()
+        await server.stop()
+
+    finished = sum( tracer.statuses.values() )
+    saved = os.path.getsize( os.path.join( brain, llm.capture_file ) ) if os.path.exists( os.path.join( brain, llm.capture_file ) ) else 0
+    return {
+        "turns": tracer.turns,
+        "statuses": dict( tracer.statuses ),
+        "elapsed_s": round( elapsed, 2 ),
+        "turns_per_min": round( finished / elapsed * 60, 1 ),
+        "llm_calls": llm.calls,
+        "asr_discarded": backend.cancelled,
+        "asr_overruns": asr.overruns,
+        "audio_out_s": round( sink.bytes_written / 48000, 2 ),
+        "saved_bytes": saved,
+        "loop": loop,
+        "intervals": {name: {"n": h.count, **{f"p{p}_ms": round( h.percentile( p ) * 1000, 1 ) for p in ( 50, 95, 99 )}}
+                      for name, h in tracer.histograms.items() if h.count},
+    }
+
+def report(result):
+    print( f"{result['turns']} turns in {result['elapsed_s']}s ({result['turns_per_min']} turns/min): "
+           f"{', '.join( f'{n} {s}' for s, n in result['statuses'].items() )}; {result['llm_calls']} LLM calls, "
+           f"{result['audio_out_s']}s audio played, {result['saved_bytes']} bytes captured" )
+    for name, stats in result["intervals"].items():
+        print( f"  {name:<16} n={stats['n']:<4} p50 {stats['p50_ms']:>7.1f}ms  p95 {stats['p95_ms']:>7.1f}ms  p99 {stats['p99_ms']:>7.1f}ms" )
+    loop = result["loop"]
+    lag = loop["lag"]
+    print( f"event-loop lag: p50 {lag['p50_ms']}ms, p99 {lag['p99_ms']}ms, max {lag['max_ms']}ms; "
+           f"{loop['stalls']} stalls over {loop['threshold_ms']:.0f}ms ({loop['blocked_ms']}ms blocked)" )
+    for stall in loop["worst"][:5]:
+        print( f"  {stall['ms']:>7.1f}ms in {stall['stage']}: {stall['site']}" )
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # The pipeline's own logging would drown the report (and the JSON); --verbose keeps it
+        log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout( io.StringIO() )
+        with log:
+            result = asyncio.run( run( args, tmp ) )
+    if args.json:
+        print( json.dumps( result, indent=2 ) )
+    else:
+        report( result )
+    if args.fail_on_block is not None and result["loop"]["lag"]["max_ms"] > args.fail_on_block:
+        sys.exit( f"event loop blocked for {result['loop']['lag']['max_ms']}ms (limit {args.fail_on_block:.0f}ms)" )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Offline end-to-end pipeline benchmark" )
+    parser.add_argument( "--turns", type=int, default=8 )
+    parser.add_argument( "--speech-s", type=float, default=1.5, help="Length of each spoken utterance" )
+    parser.add_argument( "--gap-s", type=float, default=5.0, help="Silence after each utterance (shorter than a reply = barge-in)" )
+    parser.add_argument( "--speed", type=float, default=1.0, help="Audio pacing, x real time" )
+    parser.add_argument( "--asr-ms", type=float, default=200 )
+    parser.add_argument( "--llm-ms", type=float, default=400, help="LLM time to first token" )
+    parser.add_argument( "--jitter-ms", type=float, default=100 )
+    parser.add_argument( "--slow-rate", type=float, default=0.0, help="Share of LLM calls in the slow tail" )
+    parser.add_argument( "--slow-factor", type=float, default=4.0 )
+    parser.add_argument( "--llm-cps", type=float, default=400.0, help="LLM streaming speed, characters/s" )
+    parser.add_argument( "--reply", default="Got it, I'll keep that in mind." )
+    parser.add_argument( "--capture-rate", type=float, default=0.5, help="Share of replies that save a note" )
+    parser.add_argument( "--handshake-ms", type=float, default=80 )
+    parser.add_argument( "--tts-first-byte-ms", type=float, default=150 )
+    parser.add_argument( "--realtime-factor", type=float, default=4.0, help="Fake TTS generation speed, x real time" )
+    parser.add_argument( "--no-session", dest="session", action="store_false", help="Don't record the session" )
+    parser.add_argument( "--block-ms", type=float, default=50, help="Loop stalls longer than this are recorded with stacks" )
+    parser.add_argument( "--fail-on-block", type=float, metavar="MS", help="Exit 1 if the event loop lagged more than MS" )
+    parser.add_argument( "--seed", type=int, default=1 )
+    parser.add_argument( "--json", action="store_true" )
+    parser.add_argument( "--verbose", action="store_true", help="Show the pipeline's log" )
+    main( parser.parse_args() )
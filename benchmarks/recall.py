@@ -0,0 +1,90 @@
+"""
+Semantic recall cost: building the index over brain/, per-turn search latency and the incremental
+re-index after a save, on a synthetic brain of N notes (or a copy of a real one with --source).
+    python -m benchmarks.recall --notes 500 --sections 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from modules.semantic_index import SemanticIndex
+from modules.storage import Storage
+
+WORDS = ( "garden tomato basil irrigation budget pricing launch customer meeting roadmap invoice travel flight hotel "
+          "recipe pasta sauce workout running knee doctor appointment book chapter novel idea prototype sensor battery "
+          "voice assistant latency server deploy database backup migration schema family birthday gift weekend hiking" ).split()
+
+def synthetic_brain(directory, notes, sections, seed=7):
+    rng = random.Random( seed )
+    for n in range( notes ):
+        with open( os.path.join( directory, f"note_{n:04d}.md" ), "w", encoding="utf-8" ) as f:
+            for s in range( sections ):
+                f.write( f"# {' '.join( rng.sample( WORDS, 2 ) ).title()}\n" )
+                f.write( " ".join( rng.choice( WORDS ) for _ in range( rng.randint( 30, 120 ) ) ) + ".\n\n" )
+
+def percentile(values, p):
+    values = sorted( values )
+    return values[min( len( values ) - 1, int( len( values ) * p ) )]
+
+def main(args):
+    rng = random.Random( 11 )
+    with tempfile.TemporaryDirectory() as tmp:
+        brain = os.path.join( tmp, "brain" )
+        if args.source:
+            shutil.copytree( args.source, brain, ignore=shutil.ignore_patterns( ".*" ) )
+        else:
+            os.makedirs( brain )
+            synthetic_brain( brain, args.notes, args.sections )
+
+        start = time.perf_counter()
+        index = SemanticIndex( brain )
+        embedded = index.sync()
+        build = time.perf_counter() - start
+        print( f"build: {embedded} chunks from {len( index.files )} notes in {build * 1000:.0f}ms "
+               f"({build / max( embedded, 1 ) * 1e6:.0f}us/chunk, {index.embedder.name})" )
+
+        start = time.perf_counter()
+        index.close()
+        index = SemanticIndex( brain )
+        again = index.sync()
+        print( f"restart: {again} chunks re-embedded, {( time.perf_counter() - start ) * 1000:.0f}ms" )
+
+        latencies = []
+        for _ in range( args.queries ):
+            query = " ".join( rng.sample( WORDS, rng.randint( 3, 8 ) ) )
+            start = time.perf_counter()
+            index.search( query, k=3 )
+            latencies.append( ( time.perf_counter() - start ) * 1000 )
+        print( f"search ({args.queries} queries): p50 {statistics.median( latencies ):.2f}ms, "
+               f"p95 {percentile( latencies, 0.95 ):.2f}ms" )
+
+        async def appends():
+            storage = Storage( brain, journal=False )
+            await storage.open()
+            costs = []
+            for _ in range( args.appends ):
+                name = rng.choice( sorted( index.files ) )
+                await storage.save( name, " ".join( rng.choice( WORDS ) for _ in range( 40 ) ) )
+                start = time.perf_counter()
+                index.update( name )
+                costs.append( ( time.perf_counter() - start ) * 1000 )
+            await storage.close()
+            return costs
+        costs = asyncio.run( appends() )
+        live = sum( 1 for row in index.rows if row is not None )
+        print( f"re-index after a save ({args.appends} appends): p50 {statistics.median( costs ):.2f}ms, "
+               f"p95 {percentile( costs, 0.95 ):.2f}ms; {live} live rows, {index.stats['compactions']} compactions" )
+        index.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Semantic index build, search and update cost" )
+    parser.add_argument( "--notes", type=int, default=200 )
+    parser.add_argument( "--sections", type=int, default=6 )
+    parser.add_argument( "--queries", type=int, default=500 )
+    parser.add_argument( "--appends", type=int, default=100 )
+    parser.add_argument( "--source", help="Copy of an existing brain/ directory instead of synthetic notes" )
+    main( parser.parse_args() )
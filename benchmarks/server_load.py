@@ -0,0 +1,338 @@
+"""
+Load test of server.py: N concurrent voice clients hold conversations against one server process
+and the run reports, per step of N, turns per second, response time (end of the client's speech,
+or sending a typed turn, to the first reply audio back) and the server's CPU time, from which the
+number of sessions one core can carry.
+
+By default everything is local and offline: the server runs as a child process with MockProvider,
+a scripted recognizer and a temporary brain/, and TTS streams from the fake ElevenLabs server
+hosted here. --url points the clients at a server started separately instead (no CPU figures).
+    python -m benchmarks.server_load --clients 1,10,25,50 --duration 30
+    python -m benchmarks.server_load --mode text --clients 50,100 --llm-ms 600
+    python -m benchmarks.server_load --url ws://127.0.0.1:8770 --clients 5
+With --url and SERVER_SECRET set (the server's), every client connects with its user's token.
+
+--mode audio streams synthesized speech and silence in real time, like a microphone, so every
+session also exercises the VAD; --mode text sends typed turns and measures the rest of the path.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidStatus
+from benchmarks.fake_elevenlabs import FakeElevenLabs
+from benchmarks.pipeline import UTTERANCES, ScriptedBackend
+from modules.metrics import LatencyHistogram
+
+INPUT_RATE = 16000
+CHUNK_S = 0.1
+
+def speech(seconds, sample_rate=INPUT_RATE):
+    """
+    16-bit mono PCM of a tone burst with syllable-like amplitude modulation (see benchmarks.pipeline).
+    """
+    n = int( sample_rate * seconds )
+    return struct.pack( f"<{n}h", *( int( 7000 * ( 0.6 + 0.4 * math.sin( 2 * math.pi * 4 * i / sample_rate ) )
+                                         * math.sin( 2 * math.pi * 180 * i / sample_rate ) ) for i in range( n ) ) )
+
+def cpu_seconds(pid):
+    """
+    User + system CPU time of a process so far, or None where /proc isn't available.
+    """
+    try:
+        with open( f"/proc/{pid}/stat" ) as f:
+            fields = f.read().rsplit( ")", 1 )[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of stat, 12 and 13 after the ") "
+    return ( int( fields[11] ) + int( fields[12] ) ) / os.sysconf( "SC_CLK_TCK" )
+
+class Client:
+    """
+    One simulated user: says something (or types it), waits for the whole reply, thinks, repeats.
+    """
+    def __init__(self, url, mode, burst, think_s, timeout):
+        self.url = url
+        self.mode = mode
+        self.burst = burst
+        self.think_s = think_s
+        self.timeout = timeout
+        self.responses = []
+        self.turns = 0
+        self.timeouts = 0
+        self.rejected = False
+        self.error = None
+        self._pending = b""
+        self._sent_at = None
+        self._first_audio = None
+        self._turn_done = asyncio.Event()
+
+    async def run(self, stop_at):
+        try:
+            async with connect( self.url, max_size=2 ** 22 ) as websocket:
+                json.loads( await websocket.recv() )
+                tasks = [asyncio.create_task( self._receive( websocket ) )]
+                if self.mode == "audio":
+                    tasks.append( asyncio.create_task( self._microphone( websocket ) ) )
+                    # The server's VAD spends its first second calibrating on the noise floor
+                    await asyncio.sleep( 1.2 )
+                try:
+                    await self._converse( websocket, stop_at )
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    with contextlib.suppress( ConnectionClosed ):
+                        await websocket.send( json.dumps( {"type": "bye"} ) )
+        except InvalidStatus as e:
+            self.error = str( e )
+        except ConnectionClosed as e:
+            # 1013: the server is at max_sessions
+            self.rejected = e.rcvd is not None and e.rcvd.code == 1013
+            self.error = None if self.rejected else str( e )
+        except OSError as e:
+            self.error = str( e )
+
+    async def _converse(self, websocket, stop_at):
+        lines = itertools.cycle( UTTERANCES )
+        while time.perf_counter() < stop_at:
+            self._turn_done.clear()
+            self._first_audio = None
+            if self.mode == "audio":
+                self._sent_at = None
+                self._pending = self.burst
+            else:
+                self._sent_at = time.perf_counter()
+                await websocket.send( json.dumps( {"type": "text", "text": next( lines )} ) )
+            try:
+                await asyncio.wait_for( self._turn_done.wait(), self.timeout )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                continue
+            if self._first_audio is not None and self._sent_at is not None:
+                self.turns += 1
+                self.responses.append( self._first_audio - self._sent_at )
+            await asyncio.sleep( self.think_s )
+
+    async def _microphone(self, websocket):
+        # Real-time 100ms chunks: the utterance when there is one, silence otherwise
+        size = int( INPUT_RATE * CHUNK_S ) * 2
+        silence = bytes( size )
+        due = time.perf_counter()
+        while True:
+            if self._pending:
+                chunk, self._pending = self._pending[:size], self._pending[size:]
+                if not self._pending:
+                    self._sent_at = time.perf_counter()
+            else:
+                chunk = silence
+            await websocket.send( chunk )
+            due += CHUNK_S
+            await asyncio.sleep( max( 0.0, due - time.perf_counter() ) )
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            if isinstance( message, bytes ):
+                if self._first_audio is None and self._sent_at is not None:
+                    self._first_audio = time.perf_counter()
+            elif json.loads( message ).get( "type" ) == "turn":
+                self._turn_done.set()
+
+def client_url(args, url, user):
+    url = f"{url}{'&' if '?' in url else '?'}user={user}"
+    # The child server of the default run listens on loopback without a secret
+    if args.url and os.getenv( "SERVER_SECRET" ):
+        from server import user_token
+        url += f"&token={user_token( os.getenv( 'SERVER_SECRET' ), user )}"
+    return url
+
+async def step(args, url, n, pid):
+    burst = speech( args.speech_s )
+    # One user (and notes directory) per client
+    clients = [Client( client_url( args, url, f"load{i}" ), args.mode, burst, args.think_s, args.timeout ) for i in range( n )]
+    cpu_start, start = cpu_seconds( pid ) if pid else None, time.perf_counter()
+    stop_at = start + args.duration
+    runs = []
+    for client in clients:
+        runs.append( asyncio.create_task( client.run( stop_at ) ) )
+        # Spread the connections (and so the turns) over the first second
+        await asyncio.sleep( 1.0 / n )
+    await asyncio.gather( *runs )
+    elapsed = time.perf_counter() - start
+    cpu = cpu_seconds( pid ) - cpu_start if cpu_start is not None else None
+
+    response = LatencyHistogram( window=1000000 )
+    for client in clients:
+        for value in client.responses:
+            response.record( value )
+    turns = sum( c.turns for c in clients )
+    result = {
+        "clients": n,
+        "connected": sum( 1 for c in clients if not c.rejected and c.error is None ),
+        "rejected": sum( c.rejected for c in clients ),
+        "errors": sorted( { c.error for c in clients if c.error } ),
+        "turns": turns,
+        "timeouts": sum( c.timeouts for c in clients ),
+        "turns_per_s": round( turns / elapsed, 2 ),
+        "response_p50_ms": round( response.percentile( 50 ) * 1000, 1 ) if response.count else None,
+        "response_p95_ms": round( response.percentile( 95 ) * 1000, 1 ) if response.count else None,
+    }
+    if cpu is not None:
+        busy = cpu / elapsed
+        result["server_cpu_pct"] = round( busy * 100, 1 )
+        # Sessions a fully used core would carry at this per-session cost
+        result["sessions_per_core"] = round( result["connected"] / busy, 1 ) if busy > 0 else None
+    return result
+
+def report(result):
+    line = ( f"{result['clients']:>4} clients: {result['turns_per_s']:>6.2f} turns/s, response p50 {result['response_p50_ms']}ms "
+             f"p95 {result['response_p95_ms']}ms" )
+    if "server_cpu_pct" in result:
+        line += f", server CPU {result['server_cpu_pct']}% of a core (~{result['sessions_per_core']} sessions/core)"
+    if result["rejected"] or result["timeouts"] or result["errors"]:
+        line += f"; {result['rejected']} rejected, {result['timeouts']} timed out, errors: {result['errors'] or 'none'}"
+    print( line, flush=True )
+
+def free_port():
+    with socket.socket() as s:
+        s.bind( ( "127.0.0.1", 0 ) )
+        return s.getsockname()[1]
+
+async def wait_for_server(url, process, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit( f"server exited with {process.returncode}, see its log" )
+        try:
+            async with connect( url ) as websocket:
+                await websocket.recv()
+                await websocket.send( json.dumps( {"type": "bye"} ) )
+            return
+        except OSError:
+            await asyncio.sleep( 0.2 )
+    raise SystemExit( f"server not up after {timeout}s" )
+
+async def run(args, tmp):
+    if args.url:
+        return [await step( args, args.url, n, None ) for n in args.clients]
+
+    tts_server = await FakeElevenLabs( handshake_delay=args.handshake_ms / 1000, first_byte_delay=args.tts_first_byte_ms / 1000,
+                                       realtime_factor=args.realtime_factor ).start()
+    port = free_port()
+    log_path = os.path.join( tmp, "server.log" )
+    command = [sys.executable, "-m", "benchmarks.server_load", "--serve", "--port", str( port ), "--tts-url", tts_server.url,
+               "--dir", os.path.join( tmp, "brain" ), "--max-sessions", str( args.max_sessions ), "--tts-pool", str( args.tts_pool ),
+               "--asr-ms", str( args.asr_ms ), "--llm-ms", str( args.llm_ms ), "--jitter-ms", str( args.jitter_ms ),
+               "--llm-cps", str( args.llm_cps ), "--reply", args.reply, "--capture-rate", str( args.capture_rate ),
+               "--seed", str( args.seed )]
+    with open( log_path, "w" ) as log:
+        process = subprocess.Popen( command, stdout=log, stderr=subprocess.STDOUT,
+                                    cwd=os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+    url = f"ws://127.0.0.1:{port}/"
+    results = []
+    try:
+        await wait_for_server( url, process )
+        for n in args.clients:
+            result = await step( args, url, n, process.pid )
+            results.append( result )
+            if not args.json:
+                report( result )
+    finally:
+        process.terminate()
+        try:
+            # Off the loop: the fake TTS server here has to see the server's sockets close
+            await asyncio.to_thread( process.wait, 15 )
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await tts_server.stop()
+        if args.verbose:
+            with open( log_path ) as f:
+                print( f.read() )
+    return results
+
+async def serve_main(args):
+    """
+    The server side of the default run (--serve): server.Server on offline stand-ins.
+    """
+    os.environ.setdefault( "ELEVENLABS_API_KEY", "fake-key" )
+    import server
+    from modules.llm.mock import MockProvider
+    from modules.storage import Storage
+    from modules.tracing import Tracer
+    from modules.tts import ConnectionPool
+
+    llm = MockProvider( latency=args.llm_ms / 1000, jitter=args.jitter_ms / 1000, chars_per_second=args.llm_cps, text=args.reply,
+                        capture_rate=args.capture_rate, seed=args.seed )
+    pool = ConnectionPool( "fake-key", base_url=args.tts_url, size=args.tts_pool )
+    storage = Storage( args.dir, journal=False )
+    await storage.open()
+    tracer = Tracer( "" )
+    backend = ScriptedBackend( itertools.cycle( UTTERANCES ), latency=args.asr_ms / 1000 )
+    instance = server.Server( llm, pool, storage, backend, tracer, voice_id="bench-voice", max_sessions=args.max_sessions )
+    # The parent stops us with SIGTERM (SIGINT may be ignored in a background job)
+    stop = asyncio.get_running_loop().create_future()
+    for signum in ( signal.SIGTERM, signal.SIGINT ):
+        asyncio.get_running_loop().add_signal_handler( signum, lambda: stop.done() or stop.set_result( None ) )
+    try:
+        async with server.listen( instance, "127.0.0.1", args.port ):
+            print( f"[SERVER] Listening on {args.port}", flush=True )
+            await stop
+    finally:
+        await instance.close()
+        await pool.close()
+        await storage.close()
+        print( f"[SERVER] {instance.stats}" )
+        tracer.close()
+
+def main(args):
+    if args.serve:
+        asyncio.run( serve_main( args ) )
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        results = asyncio.run( run( args, tmp ) )
+    if args.json:
+        print( json.dumps( results, indent=2 ) )
+    elif args.url:
+        for result in results:
+            report( result )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Concurrent-session load test of server.py" )
+    parser.add_argument( "--clients", type=lambda s: [int( n ) for n in s.split( "," )], default=[1, 10, 25, 50],
+                         help="Comma-separated session counts, one step each" )
+    parser.add_argument( "--duration", type=float, default=30, help="Seconds per step" )
+    parser.add_argument( "--mode", choices=["audio", "text"], default="audio" )
+    parser.add_argument( "--speech-s", type=float, default=1.5, help="Length of each spoken utterance" )
+    parser.add_argument( "--think-s", type=float, default=2.0, help="Pause after a reply before the next turn" )
+    parser.add_argument( "--timeout", type=float, default=30, help="Seconds to wait for a reply before giving up on the turn" )
+    parser.add_argument( "--url", help="Load an already running server instead of starting one" )
+    parser.add_argument( "--max-sessions", type=int, default=1000 )
+    parser.add_argument( "--tts-pool", type=int, default=8 )
+    parser.add_argument( "--asr-ms", type=float, default=200 )
+    parser.add_argument( "--llm-ms", type=float, default=400, help="LLM time to first token" )
+    parser.add_argument( "--jitter-ms", type=float, default=100 )
+    parser.add_argument( "--llm-cps", type=float, default=400.0, help="LLM streaming speed, characters/s" )
+    parser.add_argument( "--reply", default="Got it, I'll keep that in mind." )
+    parser.add_argument( "--capture-rate", type=float, default=0.5, help="Share of replies that save a note" )
+    parser.add_argument( "--handshake-ms", type=float, default=80 )
+    parser.add_argument( "--tts-first-byte-ms", type=float, default=150 )
+    parser.add_argument( "--realtime-factor", type=float, default=4.0, help="Fake TTS generation speed, x real time" )
+    parser.add_argument( "--seed", type=int, default=1 )
+    parser.add_argument( "--json", action="store_true" )
+    parser.add_argument( "--verbose", action="store_true", help="Print the server's log at the end" )
+    # Internal: the child process of a default run
+    parser.add_argument( "--serve", action="store_true", help=argparse.SUPPRESS )
+    parser.add_argument( "--port", type=int, default=0, help=argparse.SUPPRESS )
+    parser.add_argument( "--tts-url", help=argparse.SUPPRESS )
+    parser.add_argument( "--dir", help=argparse.SUPPRESS )
+    main( parser.parse_args() )
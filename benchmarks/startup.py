@@ -0,0 +1,103 @@
+"""
+Startup cost: what `import main` pulls in (-X importtime) and wall time from launch to "[Startup] Ready to listen".
+
+Import profile: cumulative time of each top-level import of main.py, next to the cost of importing every
+provider SDK up front (what main.py did before the registry). Time-to-listening launches main.py on a
+short silent WAV (no mic needed) and stops it once startup has finished:
+    python -m benchmarks.startup --runs 5 --provider gemini
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+SDKS = ["modules.llm.gemini", "modules.llm.anthropic", "modules.llm.openai"]
+LINE = re.compile( r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)" )
+
+def import_profile(modules):
+    """
+    Runs `python -X importtime -c "import <modules>"`.
+    Returns ({module: cumulative us} for the requested modules, {module: cumulative us} for the first one's direct imports).
+    """
+    code = "import " + ", ".join( modules )
+    result = subprocess.run( [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True )
+    if result.returncode != 0:
+        raise RuntimeError( result.stderr.strip().splitlines()[-1] )
+    totals, children, pending = {}, {}, {}
+    # Children are listed before their parent, one indentation level (two spaces) deeper
+    for line in result.stderr.splitlines():
+        match = LINE.match( line )
+        if not match:
+            continue
+        depth, name, us = len( match.group( 3 ) ), match.group( 4 ), int( match.group( 2 ) )
+        if depth == 3:
+            pending[name] = us
+        elif depth == 1:
+            if name in modules:
+                totals[name] = us
+                if name == modules[0]:
+                    children = pending
+            pending = {}
+    return totals, children
+
+def silent_wav(path, seconds=1.0, rate=16000):
+    with wave.open( path, "wb" ) as f:
+        f.setnchannels( 1 )
+        f.setsampwidth( 2 )
+        f.setframerate( rate )
+        f.writeframes( bytes( int( rate * seconds ) * 2 ) )
+
+def time_to_listening(provider, wav, timeout=60.0):
+    """
+    Seconds from spawning main.py until it reports it is ready to listen, plus its own in-process figure.
+    """
+    env = dict( os.environ, PYTHONUNBUFFERED="1" )
+    # TTS refuses to start without a key; the pre-connect failing in the background doesn't matter here
+    env.setdefault( "ELEVENLABS_API_KEY", "benchmark" )
+    start = time.perf_counter()
+    proc = subprocess.Popen( [sys.executable, "main.py", "--provider", provider, "--input-wav", wav, "--no-tts-cache"],
+                             cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True )
+    try:
+        for line in proc.stdout:
+            if "[Startup] Ready to listen" in line:
+                return time.perf_counter() - start, float( re.search( r"after (\d+)ms", line ).group( 1 ) ) / 1000
+            if time.perf_counter() - start > timeout:
+                break
+        raise RuntimeError( f"main.py did not report startup (exit code {proc.poll()})" )
+    finally:
+        proc.kill()
+        proc.wait()
+
+def main(args):
+    print( "Import profile of main.py (cumulative ms, top-level imports):" )
+    lazy, children = import_profile( ["main"] )
+    for name, us in sorted( children.items(), key=lambda item: -item[1] )[:args.top]:
+        print( f"  {name:<32} {us / 1000:8.1f}" )
+    eager, _ = import_profile( ["main"] + SDKS )
+    lazy_total = sum( lazy.values() ) / 1000
+    eager_total = sum( eager.values() ) / 1000
+    print( f"import main: {lazy_total:.1f}ms lazy, {eager_total:.1f}ms with every provider SDK imported up front" )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join( tmp, "silence.wav" )
+        silent_wav( wav )
+        wall, reported = [], []
+        for _ in range( args.runs ):
+            w, r = time_to_listening( args.provider, wav )
+            wall.append( w )
+            reported.append( r )
+    print( f"time to listening ({args.provider}, {args.runs} runs): median {statistics.median( wall ) * 1000:.0f}ms wall, "
+           f"{statistics.median( reported ) * 1000:.0f}ms after main.py started" )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="Startup import time and time-to-listening" )
+    parser.add_argument( "--runs", type=int, default=5 )
+    parser.add_argument( "--provider", default="mock" )
+    parser.add_argument( "--top", type=int, default=12 )
+    main( parser.parse_args() )
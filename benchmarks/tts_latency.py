@@ -0,0 +1,79 @@
+"""
+Time from TTS.speak() to the first PCM write, cold connections vs the warm pool.
+
+Runs entirely offline against benchmarks.fake_elevenlabs:
+    python -m benchmarks.tts_latency --turns 20 --handshake-ms 80
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from benchmarks.fake_elevenlabs import FakeElevenLabs
+from modules.tts import TTS, ConnectionPool
+
+class FirstWriteSink:
+    """
+    Null audio sink that remembers when the first PCM of a turn was written.
+    """
+    def __init__(self):
+        self.first_write = None
+
+    def write(self, pcm):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+def percentile(values, pct):
+    ordered = sorted( values )
+    index = min( len( ordered ) - 1, int( round( pct / 100 * ( len( ordered ) - 1 ) ) ) )
+    return ordered[index]
+
+async def run_mode(server, mode, turns, gap):
+    # size=0 disables pre-opening, so every turn pays for connect + BOS like the old code path.
+    pool = ConnectionPool( "fake-key", base_url=server.url, size=0 if mode == "cold" else 1 )
+    sink = FirstWriteSink()
+    tts = TTS( voice_id="bench-voice", channels=1, pool=pool, sink=sink )
+    await tts.prewarm()
+    await asyncio.sleep( gap )
+
+    latencies = []
+    for _ in range( turns ):
+        sink.first_write = None
+        start = time.perf_counter()
+        await tts.speak( "That's a fascinating idea for a modular garden." )
+        latencies.append( ( sink.first_write - start ) * 1000 )
+        # The user talks and the LLM thinks between replies.
+        await asyncio.sleep( gap )
+
+    await tts.aclose()
+    tts.close()
+    return latencies, dict( pool.stats )
+
+async def main(args):
+    os.environ.setdefault( "ELEVENLABS_API_KEY", "fake-key" )
+    server = await FakeElevenLabs( handshake_delay=args.handshake_ms / 1000,
+                                   first_byte_delay=args.first_byte_ms / 1000,
+                                   realtime_factor=args.realtime_factor ).start()
+    try:
+        print( f"{'mode':<6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}  pool stats" )
+        for mode in ( "cold", "warm" ):
+            latencies, stats = await run_mode( server, mode, args.turns, args.gap )
+            print( f"{mode:<6} {statistics.median( latencies ):>8.1f} {percentile( latencies, 95 ):>8.1f} "
+                   f"{statistics.mean( latencies ):>8.1f}  {stats}" )
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="speak() -> first PCM write latency" )
+    parser.add_argument( "--turns", type=int, default=20 )
+    parser.add_argument( "--gap", type=float, default=0.3, help="Seconds between turns" )
+    parser.add_argument( "--handshake-ms", type=float, default=80 )
+    parser.add_argument( "--first-byte-ms", type=float, default=150 )
+    parser.add_argument( "--realtime-factor", type=float, default=50.0 )
+    asyncio.run( main( parser.parse_args() ) )
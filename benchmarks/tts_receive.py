@@ -0,0 +1,92 @@
+"""
+Cost of receiving TTS audio: parsing ElevenLabs frames (JSON + base64) into PCM and the --debug
+dump, per second of audio. Compares the old path (frame decoded to str -> json.loads -> b64decode)
+with parse_frame on the raw bytes, with the JSON parser it picked (orjson if installed) and plain json.
+    python -m benchmarks.tts_receive --seconds 60 --chunk-ms 250
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import math
+import os
+import struct
+import tempfile
+import time
+import tracemalloc
+from modules import tts
+from modules.tts import DebugDump, parse_frame
+
+def make_frames(seconds, chunk_ms, rate=24000, chars_per_second=15):
+    """
+    Text frames shaped like ElevenLabs' (audio plus character alignment), chunk_ms of a tone each.
+    """
+    samples = int( rate * chunk_ms / 1000 )
+    pcm = struct.pack( f"<{samples}h", *( int( 6000 * math.sin( 2 * math.pi * 220 * i / rate ) ) for i in range( samples ) ) )
+    chars = list( "the quick brown fox jumps over the lazy dog "[:max( 1, int( chars_per_second * chunk_ms / 1000 ) )] )
+    alignment = {"chars": chars, "charStartTimesMs": [i * 60 for i in range( len( chars ) )], "charDurationsMs": [60] * len( chars )}
+    frame = json.dumps( {"audio": base64.b64encode( pcm ).decode( "ascii" ), "isFinal": None,
+                         "normalizedAlignment": alignment, "alignment": alignment} )
+    return [frame] * int( seconds * 1000 / chunk_ms ), len( pcm )
+
+def old_path(message):
+    # recv() used to decode text frames to str first
+    data = json.loads( message.decode( "utf-8" ) )
+    return base64.b64decode( data["audio"] ), data
+
+def measure(name, decode, frames, pcm_bytes, repeat=10):
+    audio_s = repeat * len( frames ) * pcm_bytes / 48000
+    start = time.process_time()
+    for _ in range( repeat ):
+        for frame in frames:
+            decode( frame )
+    cpu = time.process_time() - start
+
+    # Transient memory: how much a frame allocates on top of what is alive before and after it
+    tracemalloc.start()
+    peaks = []
+    for frame in frames[:200]:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        decode( frame )
+        peaks.append( tracemalloc.get_traced_memory()[1] - base )
+    tracemalloc.stop()
+    print( f"  {name:<24} {cpu / audio_s * 1000:7.2f}ms CPU per audio second, "
+           f"{sum( peaks ) / len( peaks ) / 1024:6.1f}KB peak allocation per frame ({len( frames[0] ) / 1024:.1f}KB frame)" )
+
+def main(args):
+    frames, pcm_bytes = make_frames( args.seconds, args.chunk_ms )
+    raw = [frame.encode( "ascii" ) for frame in frames]
+    assert parse_frame( raw[0] )[0] == old_path( raw[0] )[0]
+    print( f"{len( frames )} frames, {args.seconds}s of 24kHz audio in {args.chunk_ms}ms chunks" )
+    measure( "json + b64decode (old)", old_path, raw, pcm_bytes )
+    parser = "orjson" if tts.loads is not json.loads else "json"
+    measure( f"parse_frame ({parser})", parse_frame, raw, pcm_bytes )
+    if parser != "json":
+        fast, tts.loads = tts.loads, json.loads
+        measure( "parse_frame (json)", parse_frame, raw, pcm_bytes )
+        tts.loads = fast
+
+    pcm = parse_frame( raw[0] )[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join( tmp, "dump.pcm" )
+        start = time.perf_counter()
+        for _ in frames:
+            with open( path, "ab" ) as f:
+                f.write( pcm )
+        sync = time.perf_counter() - start
+        for ext in ( ".wav", ".flac" ) if importlib.util.find_spec( "soundfile" ) else ( ".wav", ):
+            dump = DebugDump( os.path.join( tmp, "dump" + ext ) )
+            start = time.perf_counter()
+            for _ in frames:
+                dump.write( pcm )
+            queued = time.perf_counter() - start
+            dump.close()
+            print( f"  debug dump: {sync / len( frames ) * 1e6:.0f}us per chunk appending on the loop vs {queued / len( frames ) * 1e6:.1f}us "
+                   f"queued to the {os.path.basename( dump.path )} writer ({os.path.getsize( dump.path ) / 1024:.0f}KB)" )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser( description="TTS receive path: frame parsing and debug dump cost" )
+    parser.add_argument( "--seconds", type=float, default=60 )
+    parser.add_argument( "--chunk-ms", type=int, default=250 )
+    main( parser.parse_args() )
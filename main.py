@@ -1,22 +1,44 @@
+import time
+START = time.perf_counter()
+
 import asyncio
 import argparse
 import os
+import sys
 import json
 from dotenv import load_dotenv
 from modules.asr import ASR
-from modules.llm.gemini import GeminiProvider
-from modules.llm.anthropic import AnthropicProvider
-from modules.llm.openai import OpenAIProvider
+from modules.llm import registry
+from modules.llm.racing import RacingProvider
+from modules.llm.router import RouterProvider
+from modules.llm.parsing import ResponseStream
+from modules.llm import transport
 from modules.tts import TTS
+from modules.audio_cache import AudioCache
 from modules.storage import Storage
+from modules.context import ConversationContext
+from modules.semantic_index import SemanticIndex, format_notes
+from modules.note_search import NoteSearch, match_command, spoken_answer
+from modules.session_store import SessionStore
+from modules.tracing import Tracer
+from modules.loop_monitor import LoopMonitor
 
 # Load environment variables
 load_dotenv()
 
-async def pipeline(asr, llm, tts, storage):
+async def pipeline(asr, llm, tts, storage, barge_in=True, abort_llm=True, context=None, index=None, recall_k=3, notes=None,
+                   session=None, resumed=None, tracer=None, shared=False):
     """
     Main pipeline: Concurrent ASR -> LLM -> (TTS, Storage)
-    Allows listening while speaking.
+    Allows listening while speaking. With barge_in, speech detected during a reply
+    stops playback; abort_llm also cancels the in-flight LLM request.
+    History lives in a token-bounded ConversationContext (older turns get summarized).
+    With a SemanticIndex, the recall_k saved notes closest to what was said ride along with each turn.
+    With a NoteSearch, "what did I capture about ..." is answered from the full-text index without the LLM.
+    With a SessionStore, every turn is saved as a delta; resumed is a state it loaded (--resume).
+    Every turn is traced stage by stage (speech end -> playback done); the tracer prints a summary on exit.
+    With shared, the LLM, the TTS connection pool, storage and the indexes belong to the caller (server
+    mode: many pipelines in one process) and are left open when this conversation ends.
     """
     # System Prompt with JSON instruction
     SYSTEM_PROMPT = """
@@ -32,127 +54,477 @@ Format: `{"voice_output": {"text": "..."}, "data_management": {"will_capture": t
 Keep voice responses concise and conversational.
 """
 
-    messages = []
+    if context is None:
+        context = ConversationContext(llm)
+    if tracer is None:
+        tracer = Tracer()
     # Shared state for filename memory
-    state = {"active_filename": None}
+    state = {"active_filename": None, "turn": 0}
+    if resumed:
+        context.restore(resumed)
+        state["active_filename"] = resumed.get("active_filename")
+        state["turn"] = resumed.get("turn", 0)
+        if state["active_filename"]:
+            print(f"[SESSION] Filename locked: '{state['active_filename']}'")
+
+    def session_state():
+        return {**context.state(), "active_filename": state["active_filename"], "turn": state["turn"]}
+
+    # Session writes run in a thread, one after the other, off the turn's critical path
+    session_writes = {"last": None}
+
+    def save_session():
+        if session is None:
+            return
+        # Taken now, on the loop: the next turn may change the history while this is being written
+        snapshot = session_state()
+        previous = session_writes["last"]
+
+        async def write():
+            if previous is not None:
+                await previous
+            try:
+                await asyncio.to_thread(session.record, snapshot)
+            except Exception as e:
+                print(f"[SESSION] Saving the turn failed: {e}")
+        session_writes["last"] = asyncio.create_task(write())
     
+    # Prompt tokens for the whole session, split by provider cache hits
+    session_usage = {}
+
+    def report_usage(usage):
+        for key, value in usage.items():
+            session_usage[key] = session_usage.get(key, 0) + value
+        line = f"[LLM] Prompt tokens: {usage.get('cached_tokens', 0)} cached, {usage.get('uncached_tokens', 0)} uncached"
+        if usage.get("cache_write_tokens"):
+            line += f", {usage['cache_write_tokens']} cache write"
+        print(line + f"; {usage.get('output_tokens', 0)} output")
+
     # Queue for decoupled ASR -> LLM processing
     input_queue = asyncio.Queue()
 
+    # Recall started from a partial transcript while the user is still talking (streaming ASR backends):
+    # the search for the newest partial runs meanwhile, and the turn uses it if the final text is the same
+    early_recall = {"key": None, "task": None}
+    chained_partial = getattr(asr, "on_partial", None)
+
+    def recall_key(text):
+        return " ".join(text.lower().split()), state["active_filename"]
+
+    def on_partial(text):
+        if chained_partial is not None:
+            chained_partial(text)
+        key = recall_key(text)
+        running = early_recall["task"]
+        if not key[0] or key == early_recall["key"] or (running is not None and not running.done()):
+            # One search at a time; a partial skipped here is caught up by the next one (or by the turn)
+            return
+        early_recall["key"] = key
+        early_recall["task"] = asyncio.create_task(asyncio.to_thread(index.search, text, k=recall_k, exclude_file=key[1]))
+
+    if index is not None and recall_k > 0 and hasattr(asr, "on_partial"):
+        asr.on_partial = on_partial
+
+    async def recall(text, trace):
+        task, key = early_recall["task"], early_recall["key"]
+        early_recall["task"] = early_recall["key"] = None
+        if task is not None and key == recall_key(text):
+            try:
+                hits = await task
+                trace.set(recall_early=True)
+                return hits
+            except Exception as e:
+                print(f"[RECALL] Early search failed: {e}")
+        elif task is not None:
+            task.cancel()
+        # In a thread: the index's writer may hold its lock while it saves an update. The file this
+        # conversation writes to is already in the prompt's history, so it doesn't count as recall.
+        hits = await asyncio.to_thread(index.search, text, k=recall_k, exclude_file=state["active_filename"])
+        trace.set(recall_ms=index.stats["last_search_ms"])
+        return hits
+
     async def producer_asr():
         """Continuously listens and pushes text to queue"""
         print("[System] ASR Background Task Started")
-        while True:
-            # This yields control, allowing consumer to run
-            text = await asr.listen()
+        # In continuous mode the mic stays open, so utterances land here as soon as they end
+        async for text in asr.transcripts():
+            print(f"[ASR Input]: {text}")
+
+            if text.lower() in ["exit", "quit", "stop"]:
+                await input_queue.put((text, None))
+                print("[ASR] Exit command received.")
+                break
+            # Timing of this utterance from the VAD/recognizer (read before the generator moves on)
+            await input_queue.put((text, tracer.begin(text, **getattr(asr, "last_timing", {}))))
+        else:
+            # Input ended without an exit command (end of a WAV file, a client hung up): stop too
+            await input_queue.put(("", None))
+
+    async def answer_from_notes(text, query, trace):
+        """A "what did I capture about ..." question: full-text search -> TTS, no LLM round trip"""
+        user_message = context.add_user(text, merge=state.pop("merge_next", False))
+        trace.set(route="notes")
+        try:
+            # In a thread: the index may be mid-update after a save
+            hits = await asyncio.to_thread(notes.search, query, limit=3, marks=("", ""))
+            trace.set(search_ms=notes.stats["last_search_ms"])
+            print(f"[SEARCH] {len(hits)} notes about '{query}' in {notes.stats['last_search_ms']}ms")
+            answer = spoken_answer(query, hits)
+            # Kept in the history so a follow-up question to the LLM can refer to it
+            context.add_reply(user_message, answer)
+            print(f"AI: {answer}")
+            await tts.speak(answer, trace=trace)
+        except Exception as e:
+            print(f"[Error] Note search failed: {e}")
+        finally:
+            context.release(user_message)
+            save_session()
+
+    async def process_turn(text, trace):
+        """One user utterance: a notes query or an LLM reply, traced from speech end to playback"""
+        status = "error"
+        try:
+            if notes is not None:
+                query = match_command(text)
+                if query:
+                    await answer_from_notes(text, query, trace)
+                    status = "ok"
+                    return
+            status = await reply_turn(text, trace)
+        except asyncio.CancelledError:
+            # Barge-in with abort_llm: superseded by the next utterance
+            status = "cancelled"
+            raise
+        finally:
+            trace.end(status)
+
+    async def reply_turn(text, trace):
+        """LLM -> (TTS, Storage). Returns the trace status."""
+        status = "error"
+        # If the previous turn was aborted by barge-in before it answered, keep one user turn.
+        user_message = context.add_user(text, merge=state.pop("merge_next", False))
+        state["turn"] += 1
+        turn_number = state["turn"]
+        
+        # The system prompt stays byte-identical across turns so providers can cache it with the
+        # history prefix; the per-turn filename lock rides on the newest user message instead.
+        prompt_messages = context.prompt_messages()
+        if state["active_filename"]:
+            lock_note = f"\n\n(FILENAME LOCKED: The active file is '{state['active_filename']}'. You MUST use this exact filename. Any other filename you propose will be ignored.)"
+            prompt_messages[-1] = {**prompt_messages[-1], "content": prompt_messages[-1]["content"] + lock_note}
+        if index is not None and recall_k > 0:
+            hits = await recall(text, trace)
+            if hits:
+                print(f"[RECALL] {len(hits)} notes in {index.stats['last_search_ms']}ms: {', '.join(h['file'] for h in hits)}")
+                recall_note = "\n\n(Notes saved in earlier sessions that may be relevant:\n" + format_notes(hits) + ")"
+                prompt_messages[-1] = {**prompt_messages[-1], "content": prompt_messages[-1]["content"] + recall_note}
+
+        print(f"[LLM] Thinking...")
+        speaking = None
+        usage = {}
+        try:
+            # Stream the reply: sentences go to TTS as soon as they close,
+            # so the first one is audible while the rest is still being generated.
+            trace.mark("llm_request")
+            trace.set(provider=llm.name)
+            reply = ResponseStream(trace.stream(llm.stream(SYSTEM_PROMPT, prompt_messages, usage=usage), "llm_first_token", "llm_done"))
+            speaking = asyncio.create_task(tts.stream_audio(reply.sentences(), trace=trace))
+            response_data = await reply.collect()
+            if usage:
+                report_usage(usage)
+            
+            voice_output = response_data.get("voice_output", {})
+            data_mgmt = response_data.get("data_management", {})
+            
+            assistant_text = voice_output.get("text", "")
+            # Goes right after our user turn: a newer turn may have started if we were barged in on
+            context.add_reply(user_message, assistant_text)
+            if assistant_text:
+                print(f"AI: {assistant_text}")
             
-            if text:
-                print(f"[ASR Input]: {text}")
-                await input_queue.put(text)
+            # Handle Data Capture
+            if data_mgmt.get("will_capture"):
+                payload = data_mgmt.get("capture_payload", {})
                 
-                if text.lower() in ["exit", "quit", "stop"]:
-                    print("[ASR] Exit command received.")
-                    break
+                proposed_filename = payload.get("filename")
+                content = payload.get("content")
+                
+                if content:
+                    if state["active_filename"]:
+                        if proposed_filename and proposed_filename != state["active_filename"]:
+                            print( f"[STORAGE] Ignoring proposed '{proposed_filename}', locked to '{state['active_filename']}'" )
+                        filename = state["active_filename"]
+                    elif proposed_filename:
+                        state["active_filename"] = proposed_filename
+                        filename = proposed_filename
+                        print( f"[STORAGE] Filename locked: '{filename}'" )
+                    else:
+                        filename = None
+
+                    if filename:
+                        print( f"[STORAGE] Saving to {filename}..." )
+                        # Write-behind: the writer task journals, orders and batches it, the turn doesn't wait
+                        saved = storage.submit( filename, content, meta={"turn": turn_number, "provider": llm.name} )
+                        trace.watch(saved, "saved")
+            
+            # TTS: we await here, but producer_asr continues running!
+            status = "ok" if await speaking else "barged_in"
+                
+        except Exception as e:
+            print(f"[Error] Processing failed: {e}")
+        finally:
+            if speaking and not speaking.done():
+                speaking.cancel()
+            context.release(user_message)
+            # Keep the next prompt within budget; summarizing runs in the background
+            context.compact()
+            save_session()
+        return status
+
+    # Barge-in: set when the user starts talking over an active turn
+    barged_in = asyncio.Event()
+    current_turn = {"task": None}
+    # Turns allowed to finish (history + capture) after their audio was cut off
+    background_turns = set()
+
+    def on_speech_start():
+        turn = current_turn["task"]
+        if not barge_in or turn is None or turn.done():
+            return
+        print("[Barge-in] User started talking, stopping the reply.")
+        tts.interrupt()
+        barged_in.set()
+
+    asr.on_speech_start = on_speech_start
 
     async def consumer_processing():
         """Consumes text, generates response, and speaks"""
         print("[System] Processing Task Started")
         while True:
             # Wait for input
-            text = await input_queue.get()
+            text, trace = await input_queue.get()
             
-            if text.lower() in ["exit", "quit", "stop"]:
+            if trace is None:
                 input_queue.task_done()
                 break
-                
-            # Add to history
-            messages.append({"role": "user", "content": text})
-            
-            # Dynamic System Prompt
-            current_prompt = SYSTEM_PROMPT
-            if state["active_filename"]:
-                current_prompt += f"\n\nFILENAME LOCKED: The active file is '{state['active_filename']}'. You MUST use this exact filename. Any other filename you propose will be ignored."
 
-            print(f"[LLM] Thinking...")
+            barged_in.clear()
+            turn = asyncio.create_task(process_turn(text, trace))
+            current_turn["task"] = turn
+            interrupted = asyncio.create_task(barged_in.wait())
             try:
-                response_data = await llm.generate(current_prompt, messages)
-                
-                voice_output = response_data.get("voice_output", {})
-                data_mgmt = response_data.get("data_management", {})
-                
-                assistant_text = voice_output.get("text", "")
-                messages.append({"role": "assistant", "content": assistant_text})
-                
-                # Handle Data Capture
-                if data_mgmt.get("will_capture"):
-                    payload = data_mgmt.get("capture_payload", {})
-                    
-                    proposed_filename = payload.get("filename")
-                    content = payload.get("content")
-                    
-                    if content:
-                        if state["active_filename"]:
-                            if proposed_filename and proposed_filename != state["active_filename"]:
-                                print( f"[STORAGE] Ignoring proposed '{proposed_filename}', locked to '{state['active_filename']}'" )
-                            filename = state["active_filename"]
-                        elif proposed_filename:
-                            state["active_filename"] = proposed_filename
-                            filename = proposed_filename
-                            print( f"[STORAGE] Filename locked: '{filename}'" )
-                        else:
-                            filename = None
-
-                        if filename:
-                            print( f"[STORAGE] Saving to {filename}..." )
-                            asyncio.create_task( storage.save( filename, content ) )
-                
-                # TTS
-                if assistant_text:
-                    print(f"AI: {assistant_text}")
-                    # We await here, but producer_asr continues running!
-                    await tts.speak(assistant_text)
-                    
-            except Exception as e:
-                print(f"[Error] Processing failed: {e}")
+                await asyncio.wait({turn, interrupted}, return_when=asyncio.FIRST_COMPLETED)
             finally:
+                interrupted.cancel()
+                current_turn["task"] = None
                 input_queue.task_done()
 
+            if not turn.done():
+                # The new utterance goes through right away instead of waiting for this reply.
+                if abort_llm:
+                    turn.cancel()
+                    state["merge_next"] = True
+                else:
+                    background_turns.add(turn)
+                    turn.add_done_callback(background_turns.discard)
+
+    # Warm the LLM connection (DNS, TLS) while the mic and the TTS socket come up
+    llm_warmup = asyncio.create_task(llm.warmup())
+
+    # Open the first TTS socket while we wait for the user to speak
+    await tts.prewarm()
+
+    # Fill the audio cache with fallbacks and common phrases in the background
+    phrases = [llm.ERROR_TEXT] + [p.strip() for p in os.getenv("TTS_CACHE_PHRASES", "").split("|") if p.strip()]
+    cache_warmup = asyncio.create_task(tts.prewarm_cache(phrases))
+
     # Run both tasks concurrently
     producer = asyncio.create_task(producer_asr())
     consumer = asyncio.create_task(consumer_processing())
     
     # Wait for them to finish (they finish when 'exit' is spoken)
-    await asyncio.gather(producer, consumer)
-def main():
-    parser = argparse.ArgumentParser(description="Second Brain Voice Assistant")
-    parser.add_argument("--provider", choices=["gemini", "anthropic", "openai"], default="gemini", help="LLM Provider")
+    try:
+        await asyncio.gather(producer, consumer)
+    finally:
+        cache_warmup.cancel()
+        llm_warmup.cancel()
+        if session_usage:
+            prompt_total = session_usage.get("cached_tokens", 0) + session_usage.get("uncached_tokens", 0)
+            print(f"[LLM] Session prompt tokens: {prompt_total}, {session_usage.get('cached_tokens', 0)} from cache")
+        await context.aclose()
+        if session is not None:
+            if session_writes["last"] is not None:
+                await asyncio.gather(session_writes["last"], return_exceptions=True)
+            # Final snapshot: the next --resume is a single read
+            await asyncio.to_thread(session.close, session_state())
+        if shared:
+            tracer.close()
+            return
+        await llm.aclose()
+        await transport.aclose_all()
+        await tts.aclose()
+        # Everything captured this session is on disk (and indexed) before we exit
+        await storage.close()
+        if index is not None:
+            await index.aclose()
+        if notes is not None:
+            await notes.aclose()
+        # After storage.close(): a turn's trace is written once its capture has landed
+        tracer.close()
+
+def add_llm_arguments(parser):
+    """
+    Provider selection flags, shared with server.py.
+    """
+    parser.add_argument("--provider", choices=registry.names(), default="gemini", help="LLM Provider")
     parser.add_argument("--model", type=str, help="Specific model name")
+    parser.add_argument("--race", type=str, help="Race several providers per turn as provider[:model], e.g. 'gemini,openai' (first valid reply wins)")
+    parser.add_argument("--hedge-ms", type=float, help="With --race: start the next provider only after this many ms without a reply")
+    parser.add_argument("--fallback", type=str, help="Fallback backends as provider[:model], e.g. 'gemini:gemini-2.5-flash-lite,openai'; routes around slow or failing ones")
+    parser.add_argument("--latency-budget-ms", type=float, help="With --fallback: prefer a faster backend when p95 to first words exceeds this (or LLM_LATENCY_BUDGET_MS)")
+    parser.add_argument("--llm-timeout", type=float, help="With --fallback: seconds without usable output before trying the next backend (or LLM_TIMEOUT_S)")
+
+def build_llm(args):
+    """
+    The provider (or racing/fallback composite) selected on the command line. Imports its SDK(s).
+    """
+    if args.race:
+        providers = [registry.create(*registry.parse_spec(spec)) for spec in args.race.split(",") if spec.strip()]
+        llm = RacingProvider(providers, hedge_delay=args.hedge_ms / 1000 if args.hedge_ms is not None else None)
+    else:
+        llm = registry.create(args.provider, args.model)
+    if args.fallback:
+        fallbacks = [registry.create(*registry.parse_spec(spec)) for spec in args.fallback.split(",") if spec.strip()]
+        llm = RouterProvider([llm] + fallbacks,
+                             latency_budget=args.latency_budget_ms / 1000 if args.latency_budget_ms is not None else None,
+                             timeout=args.llm_timeout)
+    return llm
+
+async def startup(args, asr, storage):
+    """
+    Brings the LLM and the audio side up concurrently, each blocking step in a worker thread:
+    importing the provider SDK, PortAudio init + output device probing, the TTS socket handshake
+    and opening the mic (whose first frames then calibrate the noise floor). Storage replays its
+    journal and the semantic and full-text indexes catch up with brain/ meanwhile.
+    PortAudio setup stays on one thread, it isn't safe to initialize concurrently.
+    """
+    async def open_audio():
+        cache = AudioCache(max_bytes=int(os.getenv("TTS_CACHE_MB", "64")) * 1024 * 1024) if args.tts_cache else None
+        tts = await asyncio.to_thread(TTS, voice_id=args.voice_id, device_index=args.audio_output_index,
+                                      channels=args.audio_channels, debug=args.debug, cache=cache)
+        # Handshake in the background while the mic opens
+        await tts.prewarm()
+        await asyncio.to_thread(asr.open_input)
+        return tts
+
+    def open_index():
+        # After the journal replay, so the index sees the recovered notes
+        index = SemanticIndex(storage.base_path)
+        embedded = index.sync()
+        print(f"[INDEX] {len(index.files)} notes indexed ({embedded} chunks embedded)")
+        return index
+
+    def open_notes():
+        notes = NoteSearch(storage.base_path)
+        indexed = notes.sync()
+        print(f"[SEARCH] {notes.files()} notes searchable ({indexed} chunks indexed)")
+        return notes
+
+    async def open_storage():
+        await storage.open()
+        index, notes = await asyncio.gather(asyncio.to_thread(open_index) if args.recall else asyncio.sleep(0),
+                                            asyncio.to_thread(open_notes))
+        # Re-index notes as the writer appends to them
+        hooks = [i.schedule for i in (index, notes) if i is not None]
+        storage.on_saved = lambda filenames: [hook(filenames) for hook in hooks]
+        return index, notes
+
+    llm, tts, (index, notes) = await asyncio.gather(asyncio.to_thread(build_llm, args), open_audio(), open_storage())
+    print(f"[Startup] Ready to listen after {(time.perf_counter() - START) * 1000:.0f}ms")
+    return llm, tts, index, notes
+
+async def run(args, asr, storage):
+    monitor = None
+    if args.profile_loop:
+        # Startup included: blocking there delays the first turn just the same
+        monitor = LoopMonitor(args.loop_block_ms, report_path=os.path.join(storage.base_path, ".traces", "loop.json"))
+        monitor.start()
+    llm, tts, index, notes = await startup(args, asr, storage)
+    print(f"Starting Second Brain with {llm.name}...")
+    context = ConversationContext(llm, max_tokens=args.context_tokens)
+    recall_k = args.recall_k if args.recall_k is not None else int(os.getenv("RECALL_K", "3"))
+    # Trace file: Arg > Env > Default(brain/.traces/turns.jsonl); "" = summary only
+    trace_file = args.trace_file if args.trace_file is not None else os.getenv("TRACE_FILE", os.path.join(storage.base_path, ".traces", "turns.jsonl"))
+    tracer = Tracer(trace_file or "")
+    session, resumed = None, None
+    if args.session or args.resume:
+        session = SessionStore(os.path.join(storage.base_path, ".sessions"))
+        if args.resume:
+            resumed = session.resume(None if args.resume == "latest" else args.resume)
+            if resumed is None:
+                print("[SESSION] Nothing to resume, starting a new session")
+        if resumed is None:
+            session.start()
+    try:
+        await pipeline(asr, llm, tts, storage, barge_in=args.barge_in, abort_llm=not args.keep_llm_on_barge_in, context=context,
+                       index=index, recall_k=recall_k, notes=notes, session=session, resumed=resumed, tracer=tracer)
+    finally:
+        tts.close()
+        if monitor is not None:
+            monitor.close()
+
+def main():
+    if sys.argv[1:2] == ["search"]:
+        # python main.py search "pricing" [--limit N] [--raw]: query the captured notes, no audio or LLM
+        from modules import note_search
+        return note_search.main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="Second Brain Voice Assistant", epilog="Subcommand: main.py search QUERY (see main.py search -h)")
+    add_llm_arguments(parser)
     parser.add_argument("--voice-id", type=str, help="ElevenLabs Voice ID")
     parser.add_argument("--audio-output-index", type=int, help="Audio Output Device Index")
     parser.add_argument("--audio-channels", type=int, help="Audio Channels (1 or 2)")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging and audio dump")
+    parser.add_argument("--continuous", action=argparse.BooleanOptionalAction, default=True, help="Keep the mic open with continuous VAD segmentation")
+    parser.add_argument("--audio-input-index", type=int, help="Audio Input (Mic) Device Index")
+    parser.add_argument("--asr-backend", choices=["google", "vosk"], default="google", help="Speech recognition engine")
+    parser.add_argument("--vosk-model", type=str, help="Path to a Vosk model directory (or VOSK_MODEL_PATH)")
+    parser.add_argument("--input-wav", type=str, help="Read speech from a WAV file instead of the mic (offline testing)")
+    parser.add_argument("--barge-in", action=argparse.BooleanOptionalAction, default=True, help="Stop the reply when you start talking (continuous mode)")
+    parser.add_argument("--keep-llm-on-barge-in", action="store_true", help="On barge-in, let the LLM reply finish in the background so captures are still saved")
+    parser.add_argument("--context-tokens", type=int, help="History budget per prompt in tokens (or CONTEXT_MAX_TOKENS); older turns are summarized")
+    parser.add_argument("--recall", action=argparse.BooleanOptionalAction, default=True, help="Index brain/ and add the most relevant saved notes to each turn")
+    parser.add_argument("--recall-k", type=int, help="Notes recalled per turn (or RECALL_K, default 3; 0 = off)")
+    parser.add_argument("--session", action=argparse.BooleanOptionalAction, default=True, help="Save the conversation to brain/.sessions after every turn")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="SESSION_ID", help="Continue the last session (or the given one): history, summary and locked filename")
+    parser.add_argument("--trace-file", type=str, help="Per-turn stage timings as JSON lines (or TRACE_FILE, default brain/.traces/turns.jsonl; '' = off)")
+    parser.add_argument("--profile-loop", action="store_true", help="Measure event-loop lag, flag callbacks that block it (with stacks) and write brain/.traces/loop.json")
+    parser.add_argument("--loop-block-ms", type=float, help="With --profile-loop: stall threshold in ms (or LOOP_BLOCK_MS, default 50)")
+    parser.add_argument("--tts-cache", action=argparse.BooleanOptionalAction, default=True, help="Replay repeated phrases from the on-disk audio cache (TTS_CACHE_DIR)")
     
     args = parser.parse_args()
     
-    # Initialize Provider
-    if args.provider == "gemini":
-        # Updated default to Flash (faster/cheaper)
-        llm = GeminiProvider(model_name=args.model if args.model else "gemini-3-flash-preview")
-    elif args.provider == "anthropic":
-        llm = AnthropicProvider(model_name=args.model if args.model else "claude-3-opus-20240229")
-    elif args.provider == "openai":
-        llm = OpenAIProvider(model_name=args.model if args.model else "gpt-4-turbo-preview")
-        
-    asr = ASR()
-    tts = TTS(voice_id=args.voice_id, device_index=args.audio_output_index, channels=args.audio_channels, debug=args.debug)
+    if args.asr_backend == "vosk":
+        from modules.asr_backends.vosk import VoskBackend
+        asr_backend = VoskBackend(model_path=args.vosk_model)
+    else:
+        asr_backend = None
+
+    def on_partial(text):
+        print(f"[ASR Partial]: {text}")
+
+    asr = ASR(continuous=args.continuous, device_index=args.audio_input_index, backend=asr_backend,
+              on_partial=on_partial if args.debug else None, input_wav=args.input_wav)
     storage = Storage(base_path="brain")
     
-    print(f"Starting Second Brain with {args.provider}...")
     try:
-        asyncio.run(pipeline(asr, llm, tts, storage))
+        asyncio.run(run(args, asr, storage))
     except KeyboardInterrupt:
         print("\nExiting...")
-        tts.close()
+    finally:
+        # On every way out (exit command, end of --input-wav, an error): release the mic and stop the Vosk worker
+        asr.close()
+        asr.backend.close()
 
 if __name__ == "__main__":
     main()
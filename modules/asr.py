@@ -1,14 +1,192 @@
 import speech_recognition as sr
 import asyncio
+import collections
+import math
+import os
+import threading
+import time
+from array import array
 from concurrent.futures import ThreadPoolExecutor
+from modules.asr_backends.google import GoogleBackend
+
+class VADSegmenter:
+    """
+    Energy-based voice activity segmentation over fixed-size 16-bit mono PCM frames.
+
+    Frames are fed one at a time. While idle, the last `pre_roll_ms` of audio is kept
+    in a ring so the first syllable is not clipped when speech is detected.
+    The noise floor is calibrated once from the first `calibration_ms` of audio and then
+    keeps adapting on every non-speech frame.
+    """
+    START = "start"      # pcm = pre-roll + first voiced frames
+    SPEECH = "speech"    # pcm = one frame inside an utterance
+    END = "end"          # pcm = the complete utterance
+    DISCARD = "discard"  # utterance too short, treated as noise
+
+    def __init__(self, sample_rate=16000, frame_ms=30, pre_roll_ms=300, hangover_ms=800,
+                 start_ms=90, min_speech_ms=250, max_utterance_s=15, calibration_ms=1000,
+                 threshold_ratio=3.0, min_threshold=300.0, adapt_rate=0.05):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = int( sample_rate * frame_ms / 1000 ) * 2
+
+        self.pre_roll = collections.deque( maxlen=max( 1, pre_roll_ms // frame_ms ) )
+        self.hangover_frames = max( 1, hangover_ms // frame_ms )
+        self.start_frames = max( 1, start_ms // frame_ms )
+        self.min_speech_frames = max( 1, min_speech_ms // frame_ms )
+        self.max_frames = int( max_utterance_s * 1000 // frame_ms )
+        self.calibration_frames = max( 1, calibration_ms // frame_ms )
+
+        self.threshold_ratio = threshold_ratio
+        self.min_threshold = min_threshold
+        self.adapt_rate = adapt_rate
+
+        self.noise_floor = None
+        self._calibration = []
+        self._utterance = bytearray()
+        self._speaking = False
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._voiced_total = 0
+        self._frames = 0
+        # Silence at the end of the last finished utterance (the hangover that closed it)
+        self.trailing_silence_ms = 0
+
+    @property
+    def calibrated(self) -> bool:
+        return self.noise_floor is not None
+
+    @property
+    def confirmed(self) -> bool:
+        """
+        True once the current utterance has enough voiced audio to not be a click or cough.
+        """
+        return self._speaking and self._voiced_total >= self.min_speech_frames
+
+    @property
+    def threshold(self) -> float:
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max( self.min_threshold, self.noise_floor * self.threshold_ratio )
+
+    @staticmethod
+    def rms(frame: bytes) -> float:
+        samples = array( "h", frame )
+        if not samples:
+            return 0.0
+        return math.sqrt( sum( s * s for s in samples ) / len( samples ) )
+
+    def feed(self, frame: bytes):
+        """
+        Feeds one frame. Returns (event, pcm) or (None, None) when nothing happened.
+        """
+        energy = self.rms( frame )
+
+        # One-off calibration: the first second only establishes the noise floor.
+        if self.noise_floor is None:
+            self._calibration.append( energy )
+            self.pre_roll.append( frame )
+            if len( self._calibration ) >= self.calibration_frames:
+                self.noise_floor = sum( self._calibration ) / len( self._calibration )
+                self._calibration = []
+            return None, None
+
+        voiced = energy > self.threshold
+
+        if not self._speaking:
+            self.pre_roll.append( frame )
+            if voiced:
+                self._voiced_run += 1
+            else:
+                self._voiced_run = 0
+                # Background adaptation: only learn from frames we consider silence.
+                self.noise_floor += self.adapt_rate * ( energy - self.noise_floor )
+
+            if self._voiced_run >= self.start_frames:
+                self._speaking = True
+                self._utterance = bytearray().join( self.pre_roll )
+                self.pre_roll.clear()
+                self._frames = len( self._utterance ) // self.frame_bytes
+                self._voiced_total = self._voiced_run
+                self._voiced_run = 0
+                self._silent_run = 0
+                return self.START, bytes( self._utterance )
+            return None, None
+
+        self._utterance += frame
+        self._frames += 1
+        if voiced:
+            self._voiced_total += 1
+            self._silent_run = 0
+        else:
+            self._silent_run += 1
+
+        if self._silent_run >= self.hangover_frames or self._frames >= self.max_frames:
+            return self._finish()
+        return self.SPEECH, frame
+
+    def _finish(self):
+        pcm = bytes( self._utterance )
+        event = self.END if self._voiced_total >= self.min_speech_frames else self.DISCARD
+        self.trailing_silence_ms = self._silent_run * self.frame_ms
+        self._utterance = bytearray()
+        self._speaking = False
+        self._silent_run = 0
+        self._voiced_total = 0
+        self._frames = 0
+        return event, pcm
+
 
 class ASR:
-    def __init__(self):
+    def __init__(self, continuous=False, device_index=None, frame_ms=30, backend=None, on_partial=None, input_wav=None, on_speech_start=None,
+                 input_speed=1.0):
         self.recognizer = sr.Recognizer()
         # Adjust energy threshold for silence detection if needed
-        self.recognizer.energy_threshold = 300 
+        self.recognizer.energy_threshold = 300
         self.recognizer.dynamic_energy_threshold = True
         self.executor = ThreadPoolExecutor(max_workers=1)
+        self._calibrated = False
+
+        # Recognition engine: Google web API unless a local backend is supplied
+        self.backend = backend if backend is not None else GoogleBackend( self.recognizer )
+        # on_partial(text) is called on the event loop with in-progress hypotheses
+        self.on_partial = on_partial
+        # on_speech_start() is called on the event loop as soon as speech is confirmed (barge-in)
+        self.on_speech_start = on_speech_start
+
+        # Continuous capture settings. A WAV file input implies continuous segmentation,
+        # fed at input_speed x real time (benchmarks speed it up; the ring must still keep up).
+        self.input_wav = input_wav
+        self.input_speed = input_speed
+        self.continuous = continuous or input_wav is not None
+        self.sample_rate = self.backend.sample_rate
+        self.frame_ms = frame_ms
+        self.frames_per_buffer = int( self.sample_rate * frame_ms / 1000 )
+
+        # Device Index: Arg > Env > Default(None = system default)
+        if device_index is not None:
+            self.device_index = device_index
+        else:
+            try:
+                self.device_index = int( os.getenv( "AUDIO_INPUT_INDEX", "" ) )
+            except ValueError:
+                self.device_index = None
+
+        self.segmenter = VADSegmenter( sample_rate=self.sample_rate, frame_ms=frame_ms )
+        # Ring of raw frames filled by the PortAudio callback, drained by the segmenter thread.
+        # maxlen bounds memory if segmentation ever falls behind (~10s of audio).
+        self._ring = collections.deque( maxlen=max( 1, 10000 // frame_ms ) )
+        self._ring_ready = threading.Event()
+        self._input_done = False
+        self.overruns = 0
+        self._pa = None
+        self._stream = None
+        self._worker = None
+        self._reader = None
+        self._running = threading.Event()
+        # perf_counter() times of the utterance transcripts() just yielded: speech_end, endpoint, transcript
+        self.last_timing = {}
+        self._endpoint = {}
 
     async def listen(self) -> str:
         """
@@ -18,37 +196,229 @@ class ASR:
         loop = asyncio.get_running_loop()
         return await loop.run_in_executor(self.executor, self._listen_sync)
 
+    async def transcripts(self):
+        """
+        Async generator of recognized utterances.
+        In continuous mode the microphone stays open between turns, so nothing spoken
+        while the rest of the pipeline is busy gets dropped.
+        With input_wav set, the file is segmented the same way and the generator ends with it.
+        """
+        if not self.continuous:
+            while True:
+                text = await self.listen()
+                if text:
+                    self.last_timing = {"transcript": time.perf_counter()}
+                    yield text
+
+        loop = asyncio.get_running_loop()
+        utterances = asyncio.Queue()
+
+        def on_partial(text):
+            if self.on_partial:
+                loop.call_soon_threadsafe( self.on_partial, text )
+
+        def on_speech_start():
+            if self.on_speech_start:
+                loop.call_soon_threadsafe( self.on_speech_start )
+
+        # Called on the segmenter thread right after it set _endpoint for this utterance
+        def on_utterance(stream):
+            loop.call_soon_threadsafe( utterances.put_nowait, ( stream, self._endpoint ) )
+
+        self.start_capture( on_utterance, on_partial, on_speech_start )
+        try:
+            while True:
+                stream, endpoint = await utterances.get()
+                if stream is None:
+                    break
+                text = await loop.run_in_executor( self.executor, self._finish_stream, stream )
+                if text:
+                    self.last_timing = {**endpoint, "transcript": time.perf_counter()}
+                    yield text
+        finally:
+            self.close()
+
+    def start_capture(self, on_utterance, on_partial=None, on_speech_start=None):
+        """
+        Opens one persistent input (mic stream or WAV file) and starts the segmentation thread.
+        on_utterance(stream) is called from the worker thread for each finished utterance,
+        with the backend RecognitionStream ready to finish(). None marks the end of a file input.
+        on_speech_start() is called from the worker thread once an utterance is confirmed as speech.
+        """
+        if self._running.is_set():
+            return
+        self._running.set()
+        self._input_done = False
+        self._worker = threading.Thread( target=self._segment_loop, args=( on_utterance, on_partial, on_speech_start ), name="asr-vad", daemon=True )
+        self._worker.start()
+
+        if self.input_wav is not None:
+            self._reader = threading.Thread( target=self._read_wav, name="asr-wav", daemon=True )
+            self._reader.start()
+            return
+        self.open_input()
+
+    def open_input(self):
+        """
+        Opens the mic stream (PortAudio init, device lookup) without segmenting yet.
+        Blocking; call it from a worker thread during startup. Frames queue up in the ring
+        until start_capture(), so the noise floor calibrates on audio recorded meanwhile.
+        No-op for WAV input or when already open.
+        """
+        if self.input_wav is not None or self._stream is not None:
+            return
+
+        import pyaudio
+
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open( format=pyaudio.paInt16,
+                                      channels=1,
+                                      rate=self.sample_rate,
+                                      input=True,
+                                      input_device_index=self.device_index,
+                                      frames_per_buffer=self.frames_per_buffer,
+                                      stream_callback=self._on_audio )
+        self._stream.start_stream()
+        print("Calibrating ambient noise... (stay quiet for a second)")
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        # PortAudio callback thread: do as little as possible.
+        import pyaudio
+        self._push( in_data )
+        return ( None, pyaudio.paContinue )
+
+    def _push(self, frame):
+        if len( self._ring ) == self._ring.maxlen:
+            self.overruns += 1
+        self._ring.append( frame )
+        self._ring_ready.set()
+
+    def _read_wav(self):
+        """
+        Feeds a recorded WAV into the ring at real-time pace (times input_speed), standing in for the mic.
+        """
+        with sr.AudioFile( self.input_wav ) as source:
+            audio = self.recognizer.record( source )
+        pcm = audio.get_raw_data( convert_rate=self.sample_rate, convert_width=2 )
+        frame_bytes = self.segmenter.frame_bytes
+        silence = bytes( frame_bytes )
+
+        # Deterministic calibration on digital silence, then the file, then enough
+        # trailing silence for the segmenter to close the last utterance.
+        frames = [silence] * self.segmenter.calibration_frames
+        frames += [pcm[i:i + frame_bytes] for i in range( 0, len( pcm ) - frame_bytes + 1, frame_bytes )]
+        frames += [silence] * ( self.segmenter.hangover_frames + 1 )
+
+        for frame in frames:
+            if not self._running.is_set():
+                return
+            self._push( frame )
+            time.sleep( self.frame_ms / 1000 / self.input_speed )
+        self._input_done = True
+        self._ring_ready.set()
+
+    def _segment_loop(self, on_utterance, on_partial, on_speech_start):
+        was_calibrated = False
+        announced = False
+        stream = None
+        while self._running.is_set():
+            if not self._ring:
+                if self._input_done:
+                    on_utterance( None )
+                    return
+                self._ring_ready.wait( 0.1 )
+                self._ring_ready.clear()
+                continue
+            frame = self._ring.popleft()
+            event, pcm = self.segmenter.feed( frame )
+
+            if not was_calibrated and self.segmenter.calibrated:
+                was_calibrated = True
+                print( f"Listening... (noise floor {self.segmenter.noise_floor:.0f})" )
+
+            if event == VADSegmenter.START:
+                stream = self.backend.open_stream( on_partial )
+                stream.accept( pcm )
+            elif event == VADSegmenter.SPEECH:
+                stream.accept( pcm )
+            elif event == VADSegmenter.END:
+                now = time.perf_counter()
+                # The speaker stopped a hangover's worth of silence before the segmenter could tell
+                # (played back faster than real time, a WAV input took proportionally less wall time)
+                trailing = self.segmenter.trailing_silence_ms / 1000
+                if self.input_wav is not None:
+                    trailing /= self.input_speed
+                self._endpoint = {"speech_end": now - trailing, "endpoint": now}
+                on_utterance( stream )
+                stream = None
+                announced = False
+            elif event == VADSegmenter.DISCARD:
+                stream.cancel()
+                stream = None
+                announced = False
+
+            if stream is not None and not announced and self.segmenter.confirmed:
+                announced = True
+                if on_speech_start:
+                    on_speech_start()
+
+    def _finish_stream(self, stream) -> str:
+        """
+        Waits for the final transcript of a finished utterance.
+        """
+        try:
+            print("Recognizing...")
+            text = stream.finish()
+            if text:
+                print(f"Recognized: {text}")
+            return text
+        except Exception as e:
+            print(f"An error occurred during ASR: {e}")
+            return ""
+
     def _listen_sync(self) -> str:
         """
         Synchronous wrapper for speech_recognition listening and recognition.
         """
         try:
             with sr.Microphone() as source:
-                print("Adjusting for ambient noise... (say something!)")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                # Calibrate once; dynamic_energy_threshold keeps adapting afterwards.
+                if not self._calibrated:
+                    print("Adjusting for ambient noise... (say something!)")
+                    self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                    self._calibrated = True
                 print("Listening...")
                 # timeout: seconds to wait for speech to start
                 # phrase_time_limit: max seconds to record
                 audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=15)
-            
-            print("Recognizing...")
-            text = self.recognizer.recognize_google(audio)
-            print(f"Recognized: {text}")
-            return text
-        
+
+            stream = self.backend.open_stream()
+            stream.accept( audio.get_raw_data( convert_rate=self.sample_rate, convert_width=2 ) )
+            return self._finish_stream( stream )
+
         except sr.WaitTimeoutError:
             print("Listening timed out (no speech detected).")
             return ""
-        except sr.UnknownValueError:
-            print("Google Speech Recognition could not understand audio")
-            return ""
-        except sr.RequestError as e:
-            print(f"Could not request results from Google Speech Recognition service; {e}")
-            return ""
         except Exception as e:
             print(f"An error occurred during ASR: {e}")
             return ""
 
+    def close(self):
+        self._running.clear()
+        self._ring_ready.set()
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+        for thread in ( self._worker, self._reader ):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join( timeout=1 )
+        self._worker = None
+        self._reader = None
+
 if __name__ == "__main__":
     async def main():
         asr = ASR()
@@ -60,4 +430,3 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\nStopping ASR test.")
- 
\ No newline at end of file
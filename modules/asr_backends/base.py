@@ -0,0 +1,44 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+class RecognitionStream(ABC):
+    """
+    One utterance being recognized. Audio is pushed in as it is captured,
+    partial hypotheses (if the engine supports them) go to the on_partial callback.
+    """
+    @abstractmethod
+    def accept(self, pcm: bytes):
+        """
+        Feeds 16-bit mono PCM at the backend's sample rate. Must not block.
+        """
+        pass
+
+    @abstractmethod
+    def finish(self) -> str:
+        """
+        Signals end of speech and blocks until the final transcript is available.
+        Returns an empty string if nothing intelligible was said.
+        """
+        pass
+
+    def cancel(self):
+        """
+        Drops the utterance without producing a transcript.
+        """
+        pass
+
+class ASRBackend(ABC):
+    sample_rate = 16000
+
+    @abstractmethod
+    def open_stream(self, on_partial: Optional[Callable[[str], None]] = None) -> RecognitionStream:
+        """
+        Starts recognition of a new utterance.
+
+        Args:
+            on_partial: Called (from a backend thread) with the current hypothesis while the user is still talking.
+        """
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,33 @@
+import speech_recognition as sr
+from typing import Callable, Optional
+from .base import ASRBackend, RecognitionStream
+
+class GoogleStream(RecognitionStream):
+    def __init__(self, backend):
+        self.backend = backend
+        self.pcm = bytearray()
+
+    def accept(self, pcm: bytes):
+        # The web API has no streaming mode: buffer until the end of speech.
+        self.pcm += pcm
+
+    def finish(self) -> str:
+        try:
+            audio = sr.AudioData( bytes( self.pcm ), self.backend.sample_rate, 2 )
+            return self.backend.recognizer.recognize_google(audio)
+        except sr.UnknownValueError:
+            print("Google Speech Recognition could not understand audio")
+            return ""
+        except sr.RequestError as e:
+            print(f"Could not request results from Google Speech Recognition service; {e}")
+            return ""
+
+class GoogleBackend(ASRBackend):
+    """
+    Online recognition through speech_recognition's free Google Web Speech endpoint.
+    """
+    def __init__(self, recognizer: sr.Recognizer = None):
+        self.recognizer = recognizer or sr.Recognizer()
+
+    def open_stream(self, on_partial: Optional[Callable[[str], None]] = None) -> RecognitionStream:
+        return GoogleStream( self )
@@ -0,0 +1,151 @@
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Callable, Optional
+from .base import ASRBackend, RecognitionStream
+
+def _worker(model_path, sample_rate, requests, results):
+    """
+    Runs in a separate process so decoding never competes with capture for the GIL.
+    Messages are (kind, stream_id, payload) tuples.
+    """
+    try:
+        from vosk import Model, KaldiRecognizer, SetLogLevel
+        SetLogLevel(-1)
+        model = Model(model_path)
+    except Exception as e:
+        # Vosk raises on a bad model directory; tell the parent instead of leaving it waiting
+        results.put( ("error", None, f"{type( e ).__name__}: {e}") )
+        return
+    streams = {}
+    results.put( ("ready", None, None) )
+
+    while True:
+        kind, sid, payload = requests.get()
+        if kind == "stop":
+            break
+        if kind == "start":
+            # [recognizer, committed segments, last partial sent]
+            streams[sid] = [KaldiRecognizer( model, sample_rate ), [], ""]
+            continue
+
+        entry = streams.get( sid )
+        if entry is None:
+            continue
+        rec, committed, last = entry
+
+        if kind == "audio":
+            if rec.AcceptWaveform( payload ):
+                # Vosk found an internal endpoint: commit that segment.
+                segment = json.loads( rec.Result() ).get( "text", "" )
+                if segment:
+                    committed.append( segment )
+                partial = " ".join( committed )
+            else:
+                current = json.loads( rec.PartialResult() ).get( "partial", "" )
+                partial = " ".join( committed + [current] if current else committed )
+            if partial and partial != last:
+                entry[2] = partial
+                results.put( ("partial", sid, partial) )
+        elif kind == "finish":
+            tail = json.loads( rec.FinalResult() ).get( "text", "" )
+            text = " ".join( committed + [tail] if tail else committed )
+            del streams[sid]
+            results.put( ("final", sid, text) )
+        elif kind == "cancel":
+            del streams[sid]
+
+class VoskStream(RecognitionStream):
+    def __init__(self, backend, sid, on_partial):
+        self.backend = backend
+        self.sid = sid
+        self.on_partial = on_partial
+        self.done = threading.Event()
+        self.text = ""
+
+    def accept(self, pcm: bytes):
+        self.backend.requests.put( ("audio", self.sid, bytes( pcm )) )
+
+    def finish(self) -> str:
+        self.backend.requests.put( ("finish", self.sid, None) )
+        if not self.done.wait( self.backend.final_timeout ):
+            print(f"[ASR] Vosk final result timed out for utterance {self.sid}")
+            self.backend.streams.pop( self.sid, None )
+            return ""
+        return self.text
+
+    def cancel(self):
+        self.backend.streams.pop( self.sid, None )
+        self.backend.requests.put( ("cancel", self.sid, None) )
+
+class VoskBackend(ASRBackend):
+    """
+    Offline recognition with a local Vosk model running in a worker process.
+    Emits partial hypotheses while the user is still talking.
+    """
+    def __init__(self, model_path: str = None, final_timeout: float = 10.0):
+        model_path = model_path or os.getenv("VOSK_MODEL_PATH")
+        if not model_path:
+            raise ValueError("VOSK_MODEL_PATH not found in environment variables.")
+        if not os.path.isdir( model_path ):
+            raise ValueError(f"Vosk model directory not found: {model_path}")
+
+        self.final_timeout = final_timeout
+        self.streams = {}
+        self._ids = itertools.count( 1 )
+
+        ctx = multiprocessing.get_context( "spawn" )
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process( target=_worker,
+                                    args=( model_path, self.sample_rate, self.requests, self.results ),
+                                    name="asr-vosk", daemon=True )
+        self.process.start()
+
+        # Model load takes a few seconds; block here so startup, not the first turn, pays for it.
+        # Polled, so a worker that dies without a word (crash, OOM kill) fails startup instead of hanging it.
+        while True:
+            try:
+                kind, _, detail = self.results.get( timeout=0.5 )
+                break
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Vosk worker exited during model load (exit code {self.process.exitcode})")
+        if kind != "ready":
+            self.process.join( timeout=2 )
+            raise RuntimeError(f"Vosk worker failed to start: {detail}")
+
+        self._listener = threading.Thread( target=self._dispatch, name="asr-vosk-results", daemon=True )
+        self._listener.start()
+
+    def _dispatch(self):
+        while True:
+            kind, sid, text = self.results.get()
+            if kind == "closed":
+                break
+            stream = self.streams.get( sid )
+            if stream is None:
+                continue
+            if kind == "partial":
+                if stream.on_partial:
+                    stream.on_partial( text )
+            elif kind == "final":
+                del self.streams[sid]
+                stream.text = text
+                stream.done.set()
+
+    def open_stream(self, on_partial: Optional[Callable[[str], None]] = None) -> RecognitionStream:
+        sid = next( self._ids )
+        stream = VoskStream( self, sid, on_partial )
+        self.streams[sid] = stream
+        self.requests.put( ("start", sid, None) )
+        return stream
+
+    def close(self):
+        if self.process.is_alive():
+            self.requests.put( ("stop", None, None) )
+            self.process.join( timeout=2 )
+        self.results.put( ("closed", None, None) )
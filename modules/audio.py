@@ -0,0 +1,98 @@
+import numpy as np
+
+class PcmProcessor:
+    """
+    Streaming 16-bit PCM stage between the TTS socket and the audio device.
+
+    Mono source PCM is viewed in place with np.frombuffer, resampled to the device rate
+    (linear interpolation, phase carried across chunks), scaled by `gain` and fanned out to
+    `channels` interleaved outputs, optionally with per-channel `channel_gains`.
+    When nothing needs changing the input is passed through untouched.
+    """
+    def __init__(self, src_rate=24000, dst_rate=24000, channels=1, gain=1.0, channel_gains=None):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.channels = channels
+        self.gain = gain
+        if channel_gains is not None and len( channel_gains ) != channels:
+            raise ValueError( f"channel_gains needs {channels} entries, got {len( channel_gains )}" )
+        self.channel_gains = None if channel_gains is None else np.asarray( channel_gains, dtype=np.float32 )
+
+        self._step = src_rate / dst_rate
+        self.passthrough = src_rate == dst_rate and channels == 1 and gain == 1.0 and self.channel_gains is None
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets stream state (half samples, resampler phase) at the start of a new reply.
+        """
+        self._carry = b""
+        self._prev = None
+        self._pos = 0.0
+
+    def _resample(self, samples):
+        # x[0] is the last sample of the previous chunk, so interpolation is seamless across chunks;
+        # the final sample is repeated once so x[i + 1] is always in range.
+        head = 0 if self._prev is None else 1
+        x = np.empty( len( samples ) + head + 1, dtype=np.float32 )
+        if head:
+            x[0] = self._prev
+        x[head:-1] = samples
+        x[-1] = x[-2]
+        last = len( x ) - 2
+        self._prev = x[-1]
+        if self._pos > last:
+            self._pos -= last
+            return np.empty( 0, dtype=np.float32 )
+        n = int( ( last - self._pos ) // self._step ) + 1
+        self._pos, start = self._pos + n * self._step - last, self._pos
+        # Linear interpolation by hand: cheaper than np.interp's general search.
+        # float32 positions are exact to well under a sample for any chunk size we see.
+        t = np.arange( n, dtype=np.float32 )
+        t *= np.float32( self._step )
+        t += np.float32( start )
+        i = t.astype( np.intp )
+        t -= i
+        lo = x[i]
+        hi = x[i + 1]
+        hi -= lo
+        hi *= t
+        hi += lo
+        return hi
+
+    def process(self, pcm):
+        """
+        Returns a bytes-like object with the device-layout PCM for one chunk.
+        """
+        if self.passthrough:
+            return pcm
+        if self._carry:
+            pcm = self._carry + bytes( pcm )
+            self._carry = b""
+        if len( pcm ) % 2:
+            self._carry = bytes( pcm[-1:] )
+            pcm = pcm[:-1]
+        samples = np.frombuffer( pcm, dtype="<i2" )
+        if not len( samples ):
+            return b""
+
+        if self.src_rate != self.dst_rate:
+            samples = self._resample( samples )
+        if self.gain != 1.0:
+            samples = samples * np.float32( self.gain )
+        if samples.dtype != np.int16:
+            # Back to int16 before the fan-out, so the widening copy is done on 16-bit samples.
+            # Interpolation can't leave the input range; only gain needs clipping.
+            np.rint( samples, out=samples )
+            if self.gain > 1.0:
+                np.clip( samples, -32768, 32767, out=samples )
+            samples = samples.astype( "<i2" )
+
+        if self.channel_gains is not None:
+            out = np.clip( np.rint( samples[:, None] * self.channel_gains ), -32768, 32767 ).astype( "<i2" )
+        else:
+            out = np.empty( ( len( samples ), self.channels ), dtype="<i2" )
+            out[:] = samples[:, None]
+
+        # Flat byte view: the playback ring copies through memoryviews and counts in bytes.
+        return out.reshape( -1 ).view( np.uint8 )
@@ -0,0 +1,134 @@
+import collections
+import hashlib
+import json
+import mmap
+import os
+import re
+import unicodedata
+
+def default_cache_dir():
+    return os.path.expanduser( os.getenv( "TTS_CACHE_DIR", os.path.join( "~", ".cache", "second_brain", "tts" ) ) )
+
+class AudioCache:
+    """
+    Content-addressed PCM cache for synthesized speech.
+
+    Entries are keyed by (voice_id, model_id, output_format, voice_settings, normalized text)
+    and stored as raw PCM files named by their SHA-256. Disk usage is bounded by `max_bytes`
+    with LRU eviction (file mtime carries recency across restarts); the most recently used
+    entries stay memory-mapped so a hit can be played without a socket or a read() copy.
+    """
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024, max_mapped=32):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_mapped = max_mapped
+        os.makedirs( self.directory, exist_ok=True )
+
+        self._index = collections.OrderedDict()   # key -> size, least recently used first
+        self._mapped = collections.OrderedDict()  # key -> mmap
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        entries = []
+        for name in os.listdir( self.directory ):
+            if name.endswith( ".pcm" ):
+                path = os.path.join( self.directory, name )
+                st = os.stat( path )
+                entries.append( ( st.st_mtime, name[:-4], st.st_size ) )
+        for _, key, size in sorted( entries ):
+            self._index[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Case and punctuation change the prosody, whitespace and unicode forms don't.
+        return re.sub( r"\s+", " ", unicodedata.normalize( "NFKC", text ) ).strip()
+
+    @classmethod
+    def key(cls, voice_id, model_id, output_format, voice_settings, text) -> str:
+        material = json.dumps( [voice_id, model_id, output_format, voice_settings, cls.normalize( text )],
+                               sort_keys=True, ensure_ascii=False )
+        return hashlib.sha256( material.encode( "utf-8" ) ).hexdigest()
+
+    def _path(self, key):
+        return os.path.join( self.directory, key + ".pcm" )
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key):
+        """
+        Returns a read-only buffer (mmap) with the PCM, or None on a miss.
+        """
+        if key not in self._index:
+            self.stats["misses"] += 1
+            return None
+        self._index.move_to_end( key )
+        self.stats["hits"] += 1
+
+        pcm = self._mapped.get( key )
+        if pcm is not None:
+            self._mapped.move_to_end( key )
+            return pcm
+        try:
+            with open( self._path( key ), "rb" ) as f:
+                pcm = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+            os.utime( self._path( key ) )
+        except ( OSError, ValueError ):
+            # Deleted behind our back, or empty: forget it.
+            self.total_bytes -= self._index.pop( key )
+            self.stats["hits"] -= 1
+            self.stats["misses"] += 1
+            return None
+
+        self._mapped[key] = pcm
+        while len( self._mapped ) > self.max_mapped:
+            _, old = self._mapped.popitem( last=False )
+            self._unmap( old )
+        return pcm
+
+    def put(self, key, pcm):
+        if not pcm or len( pcm ) > self.max_bytes:
+            return
+        path = self._path( key )
+        tmp = path + ".tmp"
+        with open( tmp, "wb" ) as f:
+            f.write( pcm )
+        # Atomic publish: readers never see a half-written entry.
+        os.replace( tmp, path )
+
+        if key in self._index:
+            self.total_bytes -= self._index.pop( key )
+            old = self._mapped.pop( key, None )
+            if old is not None:
+                self._unmap( old )
+        self._index[key] = len( pcm )
+        self.total_bytes += len( pcm )
+        self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem( last=False )
+            self.total_bytes -= size
+            self.stats["evictions"] += 1
+            pcm = self._mapped.pop( key, None )
+            if pcm is not None:
+                self._unmap( pcm )
+            try:
+                os.remove( self._path( key ) )
+            except OSError:
+                pass
+
+    @staticmethod
+    def _unmap(pcm):
+        try:
+            pcm.close()
+        except BufferError:
+            # Still being copied into the playback ring; the GC unmaps it once released.
+            pass
+
+    def close(self):
+        for pcm in self._mapped.values():
+            self._unmap( pcm )
+        self._mapped.clear()
@@ -0,0 +1,199 @@
+import asyncio
+import os
+from typing import List, Dict
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a voice conversation between a user and an idea refinement agent.
+Respond **only** in JSON: `{"voice_output": {"text": "<the updated summary>"}}`
+
+Fold the new turns into the current summary. Keep every idea, decision, filename and open question;
+drop small talk. Write compact third-person notes, at most {words} words.
+"""
+
+# Per-message framing (role markers, separators) on top of the content tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class ConversationContext:
+    """
+    Conversation history with a bounded prompt size.
+
+    `messages` is the sliding window of recent turns. When window + summary outgrows `max_tokens`,
+    the oldest whole turns are moved out until the window is back under half the budget, and a
+    background LLM call folds them into `summary`. The reply path never waits for summarization;
+    it just sends the summary it already has, so the prompt stays bounded however long the session runs.
+    If the summary call fails, the turns go back to the head of the window (the model keeps seeing
+    them) and the next compaction moves them out and tries again.
+    """
+    def __init__(self, llm, max_tokens=None, summary_tokens=None):
+        self.llm = llm
+
+        # Budget: Arg > Env > Default(4000 tokens of history, system prompt excluded)
+        if max_tokens is None:
+            try:
+                max_tokens = int( os.getenv( "CONTEXT_MAX_TOKENS", "4000" ) )
+            except ValueError:
+                max_tokens = 4000
+        if summary_tokens is None:
+            try:
+                summary_tokens = int( os.getenv( "CONTEXT_SUMMARY_TOKENS", "400" ) )
+            except ValueError:
+                summary_tokens = 400
+        self.max_tokens = max_tokens
+        self.summary_tokens = min( summary_tokens, max_tokens // 4 )
+
+        self.messages: List[Dict[str, str]] = []
+        self.summary = ""
+        self._open = []       # user messages whose reply is still being generated
+        self._pending = []    # evicted messages waiting to be summarized
+        self._batch = []      # the ones being summarized right now
+        self._task = None
+        self.stats = {"compactions": 0, "summaries": 0, "summary_failures": 0, "evicted_messages": 0}
+
+    def count(self, message) -> int:
+        return self.llm.count_tokens( message["content"] ) + MESSAGE_OVERHEAD_TOKENS
+
+    @property
+    def tokens(self) -> int:
+        """
+        Size of what prompt_messages() would send right now.
+        """
+        return sum( self.count( m ) for m in self.prompt_messages() )
+
+    def add_user(self, text, merge=False):
+        """
+        Appends a user turn (or merges into the last one) and returns its message.
+        """
+        if merge and self.messages and self.messages[-1]["role"] == "user":
+            self.messages[-1]["content"] += " " + text
+            message = self.messages[-1]
+        else:
+            message = {"role": "user", "content": text}
+            self.messages.append( message )
+        if not any( m is message for m in self._open ):
+            self._open.append( message )
+        return message
+
+    def add_reply(self, user_message, text):
+        """
+        Inserts the assistant reply right after its user turn (a newer turn may have started meanwhile).
+        """
+        self.release( user_message )
+        for i, m in enumerate( self.messages ):
+            if m is user_message:
+                self.messages.insert( i + 1, {"role": "assistant", "content": text} )
+                return
+
+    def release(self, user_message):
+        """
+        The turn for user_message is over (answered, aborted or failed): its messages may be compacted.
+        """
+        self._open = [m for m in self._open if m is not user_message]
+
+    def prompt_messages(self) -> List[Dict[str, str]]:
+        """
+        What to send to the LLM: the running summary (as a leading user/assistant pair) plus the window.
+        """
+        if not self.summary:
+            return list( self.messages )
+        return [
+            {"role": "user", "content": f"Summary of our conversation so far:\n{self.summary}"},
+            {"role": "assistant", "content": "Got it, I'll keep that in mind."},
+        ] + self.messages
+
+    def compact(self):
+        """
+        Moves the oldest turns out of the window if over budget and schedules their summarization.
+        Call between turns; it never waits for the LLM.
+        """
+        if self.tokens <= self.max_tokens:
+            return
+        target = ( self.max_tokens - self.summary_tokens ) // 2
+        sizes = [self.count( m ) for m in self.messages]
+
+        # Never evict the newest message or anything from a turn still waiting for its reply.
+        limit = len( self.messages ) - 1
+        for i, m in enumerate( self.messages ):
+            if any( m is o for o in self._open ):
+                limit = min( limit, i )
+                break
+
+        # Cut on a turn boundary (the window has to start with a user message), as early as fits the target.
+        cut = 0
+        window = remaining = sum( sizes )
+        for i in range( 1, limit + 1 ):
+            remaining -= sizes[i - 1]
+            if self.messages[i]["role"] == "user":
+                cut, window = i, remaining
+                if window <= target:
+                    break
+        if cut == 0:
+            return
+
+        evicted, self.messages[:cut] = self.messages[:cut], []
+        self._pending.extend( evicted )
+        self.stats["compactions"] += 1
+        self.stats["evicted_messages"] += len( evicted )
+        print( f"[CONTEXT] Compacted {len( evicted )} messages, window now {window} tokens" )
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task( self._summarize() )
+
+    async def _summarize(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            self._batch = batch
+            transcript = "\n".join( f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in batch )
+            prompt = SUMMARY_PROMPT.replace( "{words}", str( int( self.summary_tokens * 0.75 ) ) )
+            request = [{"role": "user", "content": f"Current summary:\n{self.summary or '(empty)'}\n\nNew turns:\n{transcript}"}]
+
+            result = await self.llm.generate( prompt, request )
+            # Same reply shape as every other turn, so racing/routing validate it like any reply
+            summary = None
+            if isinstance( result, dict ) and not result.get( "error" ):
+                summary = ( result.get( "voice_output" ) or {} ).get( "text" )
+            if not isinstance( summary, str ) or not summary.strip():
+                # Provider error: back into the prompt, oldest first, until the next compaction retries.
+                # Anything evicted meanwhile is newer than the batch and older than the window.
+                restored = batch + self._pending
+                self.messages[:0] = restored
+                self._pending = []
+                self._batch = []
+                self.stats["summary_failures"] += 1
+                self.stats["evicted_messages"] -= len( restored )
+                print( f"[CONTEXT] Summary failed, {len( restored )} messages back in the window until the next compaction" )
+                return
+            self.summary = self._truncate( summary.strip() )
+            self._batch = []
+            self.stats["summaries"] += 1
+            print( f"[CONTEXT] Summary updated ({self.llm.count_tokens( self.summary )} tokens)" )
+
+    def state(self) -> dict:
+        """
+        What a saved session needs to pick the conversation back up: the window, the summary, turns
+        evicted but not summarized yet, and the running eviction count (how far the window has moved).
+        """
+        return {"messages": [dict( m ) for m in self.messages], "summary": self.summary,
+                "pending": [dict( m ) for m in self._batch + self._pending], "evicted": self.stats["evicted_messages"]}
+
+    def restore(self, state: dict):
+        """
+        Loads a state() from an earlier session. Call on the event loop: leftover turns get summarized right away.
+        """
+        self.messages = [dict( m ) for m in state.get( "messages", [] )]
+        self.summary = state.get( "summary", "" )
+        self._pending = [dict( m ) for m in state.get( "pending", [] )]
+        self.stats["evicted_messages"] = state.get( "evicted", 0 )
+        if self._pending:
+            self._task = asyncio.create_task( self._summarize() )
+
+    def _truncate(self, text):
+        # The model was asked for a short summary; enforce it so the budget holds regardless.
+        if self.llm.count_tokens( text ) <= self.summary_tokens:
+            return text
+        ratio = self.summary_tokens / self.llm.count_tokens( text )
+        return text[:int( len( text ) * ratio )].rsplit( " ", 1 )[0] + " ..."
+
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather( self._task, return_exceptions=True )
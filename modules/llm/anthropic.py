@@ -1,43 +1,91 @@
 import os
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 from .base import LLMProvider
+from .parsing import extract_json
+from . import transport
 import anthropic
 
 class AnthropicProvider(LLMProvider):
+    ERROR_TEXT = "I'm having trouble connecting to Anthropic."
+    CHARS_PER_TOKEN = 3.5
+
     def __init__(self, model_name: str = "claude-3-opus-20240229"):
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment variables.")
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        http_client = transport.shared_client("anthropic", anthropic.DefaultAsyncHttpxClient)
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, http_client=http_client, timeout=http_client.timeout)
         self.model_name = model_name
 
-    async def generate(self, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         try:
             # Prepare messages (strip empty system messages if present, Anthropic handles system prompt separately)
             # Ensure "user", "assistant" roles are correct.
+            system, cached_messages = self._prepare(system_prompt, messages)
             
             response = await self.client.messages.create(
                 model=self.model_name,
                 max_tokens=1024,
-                system=system_prompt,
-                messages=messages,
+                system=system,
+                messages=cached_messages,
                 # Force JSON object generation? Not explicitly supported as a mode like OpenAI/Gemini yet, 
                 # but models are good at compliance. We rely on the prompt instructing JSON.
             )
+            self._record(usage, response.usage)
             
             content = response.content[0].text
-            # Basic JSON extraction if markdown wrap is present
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].strip()
-                
-            return json.loads(content)
+            # Tolerant JSON extraction (fences, surrounding prose, truncation)
+            return extract_json(content)
 
         except Exception as e:
             print(f"Error generating response from Anthropic: {e}")
-            return {
-                "voice_output": {"text": "I'm having trouble connecting to Anthropic."},
-                "data_management": {"will_capture": False}
-            }
+            return self.error_response()
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """
+        Streams the response text deltas. Fences, if any, are handled by the stream parser.
+        """
+        started = False
+        try:
+            system, cached_messages = self._prepare(system_prompt, messages)
+            async with self.client.messages.stream(
+                model=self.model_name,
+                max_tokens=1024,
+                system=system,
+                messages=cached_messages,
+            ) as stream:
+                async for text in stream.text_stream:
+                    started = True
+                    yield text
+                self._record(usage, (await stream.get_final_message()).usage)
+
+        except Exception as e:
+            print(f"Error streaming response from Anthropic: {e}")
+            if not started:
+                yield json.dumps(self.error_response())
+
+    async def warmup(self):
+        # Model listing: authenticated, free, and leaves a warm connection in the shared pool
+        await transport.warm(self.name, lambda: self.client.models.list(limit=1))
+
+    def _prepare(self, system_prompt: str, messages: List[Dict[str, str]]):
+        """
+        Adds cache_control breakpoints: one after the static system prompt and one after the history
+        prefix (everything before the newest user turn), which is exactly next turn's prefix too.
+        """
+        system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        prepared = [{"role": m["role"], "content": m["content"]} for m in messages]
+        if len(prepared) >= 2:
+            prefix_end = prepared[-2]
+            prefix_end["content"] = [{"type": "text", "text": prefix_end["content"], "cache_control": {"type": "ephemeral"}}]
+        return system, prepared
+
+    def _record(self, usage, response_usage):
+        if response_usage is None:
+            return
+        self.record_usage(usage,
+                          cached=response_usage.cache_read_input_tokens,
+                          uncached=response_usage.input_tokens,
+                          cache_write=response_usage.cache_creation_input_tokens,
+                          output=response_usage.output_tokens)
@@ -1,17 +1,83 @@
+import json
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 
 class LLMProvider(ABC):
+    # Spoken when the provider fails; subclasses name themselves here
+    ERROR_TEXT = "I'm having trouble connecting to the language model."
+    # Rough tokenizer ratio for count_tokens(); providers with a local tokenizer override it
+    CHARS_PER_TOKEN = 4.0
+
     @abstractmethod
-    async def generate(self, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         """
         Generates a response from the LLM based on the system prompt and conversation history.
         
         Args:
-            system_prompt: The system instruction.
+            system_prompt: The system instruction. Keep it identical across turns so providers can cache it.
             messages: A list of message dictionaries (e.g., [{"role": "user", "content": "..."}]).
+            usage: Optional dict filled with this call's token counts (see record_usage).
             
         Returns:
             A dictionary parsed from the JSON response.
         """
         pass
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """
+        Streams the raw JSON response text as it is generated (token deltas).
+        Feed it to parsing.ResponseStream to get sentences for TTS and the parsed result.
+        `usage` is filled in once the stream has been read to the end.
+
+        The default implementation waits for generate() and yields the whole document at once.
+        """
+        response = await self.generate(system_prompt, messages, usage=usage)
+        yield json.dumps(response)
+
+    @staticmethod
+    def record_usage(usage: Optional[Dict[str, int]], cached: int = 0, uncached: int = 0, output: int = 0, cache_write: int = 0):
+        """
+        Prompt tokens split into cached (served from the provider's prefix cache) and uncached;
+        cache_write counts tokens billed for writing a new cache entry (Anthropic).
+        """
+        if usage is None:
+            return
+        usage["cached_tokens"] = usage.get("cached_tokens", 0) + (cached or 0)
+        usage["uncached_tokens"] = usage.get("uncached_tokens", 0) + (uncached or 0)
+        usage["cache_write_tokens"] = usage.get("cache_write_tokens", 0) + (cache_write or 0)
+        usage["output_tokens"] = usage.get("output_tokens", 0) + (output or 0)
+
+    async def warmup(self):
+        """
+        Opens the provider's connection ahead of the first turn (DNS, TLS) with a cheap request.
+        Failures are logged, never raised.
+        """
+        pass
+
+    async def aclose(self):
+        """
+        Releases provider-side resources (e.g. explicit prompt caches).
+        """
+        pass
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Estimates how many tokens text takes in this provider's tokenizer (no network call).
+        """
+        return int(len(text) / self.CHARS_PER_TOKEN) + 1
+
+    def error_response(self) -> Dict[str, Any]:
+        # "error" lets composite providers (racing, routing) tell the fallback from a real reply
+        return {
+            "voice_output": {"text": self.ERROR_TEXT},
+            "data_management": {"will_capture": False},
+            "error": True
+        }
+
+    @property
+    def name(self) -> str:
+        """
+        Provider and model, e.g. "GeminiProvider:gemini-3-flash-preview" (metrics key).
+        """
+        model = getattr(self, "model_name", None)
+        return f"{type(self).__name__}:{model}" if model else type(self).__name__
@@ -1,38 +1,55 @@
 import os
 import json
-from typing import List, Dict, Any
+import time
+import asyncio
+import hashlib
+import re
+from typing import List, Dict, Any, AsyncIterator, Optional
 from .base import LLMProvider
+from .parsing import extract_json
+from . import transport
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 
 class GeminiProvider(LLMProvider):
+    ERROR_TEXT = "I'm having trouble retrieving a response from Gemini."
+
     def __init__(self, model_name: str = "gemini-3-flash-preview"):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables.")
-        self.client = genai.Client(api_key=api_key)
+        # google-genai takes its timeout in milliseconds
+        self.client = genai.Client(api_key=api_key, http_options=types.HttpOptions(
+            httpx_async_client=transport.shared_client("gemini"),
+            timeout=int(transport.config().read * 1000)))
         self.model_name = model_name
 
-    async def generate(self, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        # Explicit context caching of system prompt + history prefix. Gemini only accepts caches
+        # above a model-dependent minimum size; 0 disables (implicit caching still applies).
+        try:
+            self.cache_min_tokens = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "2048"))
+        except ValueError:
+            self.cache_min_tokens = 2048
+        try:
+            self.cache_ttl = int(os.getenv("GEMINI_CACHE_TTL", "600"))
+        except ValueError:
+            self.cache_ttl = 600
+        # One provider can serve many conversations (server.py): caches are keyed by name and found by
+        # prefix, counted while requests use them, and deleted only once superseded and unused.
+        self._caches = {}         # name -> {"name", "system_prompt", "messages", "fingerprint", "expires", "users", "retired"}
+        self._cache_tasks = {}    # conversation -> cache creation in flight
+        self._deletions = set()
+        # After a transient failure (429, 5xx, timeout) creation pauses for a cooldown, doubled per failure
+        self._cache_cooldown = 30.0
+        self._cache_retry_at = 0.0
+
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         """
         Generates a response using the new google-genai SDK.
         """
+        cache = None
         try:
-            # Prepare configuration
-            config = types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json"
-            )
-            
-            # Prepare contents
-            # The new SDK accepts a list of Content objects or dicts
-            gemini_contents = []
-            for msg in messages:
-                # Map roles: user -> user, assistant -> model
-                role = "user" if msg["role"] == "user" else "model"
-                gemini_contents.append(
-                    types.Content(role=role, parts=[types.Part.from_text(text=msg["content"])])
-                )
+            config, gemini_contents, cache = self._prepare(system_prompt, messages)
 
             # Generate content asynchronously
             # Note: `client.aio` is the async client accessor in the new SDK
@@ -41,13 +58,211 @@ class GeminiProvider(LLMProvider):
                 contents=gemini_contents,
                 config=config
             )
+            self._record(usage, response.usage_metadata)
             
             # Parse JSON response
-            return json.loads(response.text)
+            return extract_json(response.text)
 
         except Exception as e:
             print(f"Error generating response from Gemini: {e}")
-            return {
-                "voice_output": {"text": "I'm having trouble retrieving a response from Gemini."},
-                "data_management": {"will_capture": False}
-            }
+            return self.error_response()
+        finally:
+            self._release(cache)
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """
+        Streams the JSON response text chunk by chunk.
+        """
+        started = False
+        cache = None
+        try:
+            config, gemini_contents, cache = self._prepare(system_prompt, messages)
+            response = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=gemini_contents,
+                config=config
+            )
+            usage_metadata = None
+            async for chunk in response:
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+                # Running totals; the last chunk carries the final counts
+                usage_metadata = chunk.usage_metadata or usage_metadata
+            self._record(usage, usage_metadata)
+
+        except Exception as e:
+            print(f"Error streaming response from Gemini: {e}")
+            if not started:
+                yield json.dumps(self.error_response())
+        finally:
+            self._release(cache)
+
+    def _prepare(self, system_prompt: str, messages: List[Dict[str, str]]):
+        # Prepare contents
+        # The new SDK accepts a list of Content objects or dicts
+        gemini_contents = [self._content(msg) for msg in messages]
+
+        # Prepare configuration: reuse the longest cached prefix this request still starts with
+        cache = self._lookup(system_prompt, messages)
+        if cache:
+            # Held until the request is done: a newer cache can't delete it from under us
+            cache["users"] += 1
+            config = types.GenerateContentConfig(
+                cached_content=cache["name"],
+                response_mime_type="application/json"
+            )
+            gemini_contents = gemini_contents[cache["messages"]:]
+        else:
+            config = types.GenerateContentConfig(
+                system_instruction=system_prompt,
+                response_mime_type="application/json"
+            )
+
+        self._maybe_refresh_cache(system_prompt, messages, cache)
+        return config, gemini_contents, cache
+
+    def _lookup(self, system_prompt: str, messages: List[Dict[str, str]]):
+        now = time.monotonic()
+        best = None
+        fingerprints = {}
+        for entry in list(self._caches.values()):
+            if now >= entry["expires"]:
+                # The server expires it by itself; forget it once no request holds it
+                if not entry["users"]:
+                    del self._caches[entry["name"]]
+                continue
+            count = entry["messages"]
+            if (entry["retired"] or entry["system_prompt"] != system_prompt or len(messages) <= count
+                    or (best and best["messages"] >= count)):
+                continue
+            if count not in fingerprints:
+                fingerprints[count] = self._fingerprint(messages[:count])
+            if fingerprints[count] == entry["fingerprint"]:
+                best = entry
+        return best
+
+    def _release(self, cache):
+        if cache is None:
+            return
+        cache["users"] -= 1
+        if cache["retired"] and not cache["users"]:
+            self._delete_later(cache)
+
+    def _delete_later(self, cache):
+        self._caches.pop(cache["name"], None)
+        task = asyncio.create_task(self._delete_cache(cache["name"]))
+        self._deletions.add(task)
+        task.add_done_callback(self._deletions.discard)
+
+    @staticmethod
+    def _content(msg: Dict[str, str]):
+        # Map roles: user -> user, assistant -> model
+        role = "user" if msg["role"] == "user" else "model"
+        return types.Content(role=role, parts=[types.Part.from_text(text=msg["content"])])
+
+    @staticmethod
+    def _fingerprint(messages: List[Dict[str, str]]) -> str:
+        return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _maybe_refresh_cache(self, system_prompt: str, messages: List[Dict[str, str]], cache):
+        """
+        Caches everything before the newest user turn once enough of it is uncached.
+        Runs in the background: this turn goes out with whatever cache it already has.
+        """
+        if not self.cache_min_tokens or time.monotonic() < self._cache_retry_at:
+            return
+        # One creation at a time per conversation: the cache it extends, or its opening message
+        conversation = cache["name"] if cache else self._fingerprint([{"role": "system", "content": system_prompt}] + messages[:1])
+        if conversation in self._cache_tasks:
+            return
+        prefix = messages[:-1]
+        cached = cache["messages"] if cache else 0
+        uncached = sum(self.count_tokens(m["content"]) for m in prefix[cached:])
+        if cache is None:
+            uncached += self.count_tokens(system_prompt)
+        threshold = self.cache_min_tokens if cache is None else self.cache_min_tokens // 2
+        if uncached >= threshold:
+            task = asyncio.create_task(self._create_cache(system_prompt, prefix, cache))
+            self._cache_tasks[conversation] = task
+            task.add_done_callback(lambda _: self._cache_tasks.pop(conversation, None))
+
+    async def _create_cache(self, system_prompt: str, prefix: List[Dict[str, str]], base=None):
+        try:
+            created = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    contents=[self._content(msg) for msg in prefix],
+                    ttl=f"{self.cache_ttl}s",
+                    display_name="second-brain-history"
+                )
+            )
+        except Exception as e:
+            self._cache_failed(e)
+            return
+        self._cache_cooldown = 30.0
+
+        self._caches[created.name] = {
+            "name": created.name,
+            "system_prompt": system_prompt,
+            "messages": len(prefix),
+            "fingerprint": self._fingerprint(prefix),
+            # Stop using it a little before the server expires it
+            "expires": time.monotonic() + self.cache_ttl - 30,
+            "users": 0,
+            "retired": False,
+        }
+        print(f"[LLM] Gemini context cache updated ({len(prefix)} messages, {len(self._caches)} cached conversations)")
+        if base is not None and base["name"] in self._caches:
+            # Superseded for this conversation; deleted once the requests still using it are done
+            base["retired"] = True
+            if not base["users"]:
+                self._delete_later(base)
+
+    def _cache_failed(self, e: Exception):
+        """
+        Only a model without explicit caching turns it off; it is shared by every conversation on this
+        provider, so anything else (429, 5xx, timeout) just pauses creation for a while.
+        """
+        message = str(getattr(e, "message", None) or e)
+        if isinstance(e, errors.ClientError):
+            if e.code == 404 or re.search(r"not supported|does not support", message, re.IGNORECASE):
+                print(f"[LLM] Gemini context cache disabled, not supported by {self.model_name}: {message}")
+                self.cache_min_tokens = 0
+                return
+            minimum = re.search(r"min_total_token_count=(\d+)", message)
+            if minimum and int(minimum.group(1)) > self.cache_min_tokens:
+                # Below the model's minimum size: wait for a prefix that big
+                print(f"[LLM] Gemini context cache needs {minimum.group(1)} tokens")
+                self.cache_min_tokens = int(minimum.group(1))
+                return
+        print(f"[LLM] Gemini context cache failed, retrying in {self._cache_cooldown:.0f}s: {type(e).__name__}: {e}")
+        self._cache_retry_at = time.monotonic() + self._cache_cooldown
+        self._cache_cooldown = min(self._cache_cooldown * 2, 300.0)
+
+    async def _delete_cache(self, name: str):
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            print(f"[LLM] Could not delete Gemini cache {name}: {e}")
+
+    def _record(self, usage, usage_metadata):
+        if usage_metadata is None:
+            return
+        cached = usage_metadata.cached_content_token_count or 0
+        self.record_usage(usage,
+                          cached=cached,
+                          uncached=(usage_metadata.prompt_token_count or 0) - cached,
+                          output=usage_metadata.candidates_token_count)
+
+    async def warmup(self):
+        await transport.warm(self.name, lambda: self.client.aio.models.get(model=self.model_name))
+
+    async def aclose(self):
+        tasks = list(self._cache_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        names, self._caches = list(self._caches), {}
+        await asyncio.gather(*self._deletions, *(self._delete_cache(name) for name in names), return_exceptions=True)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import random
+from typing import List, Dict, Any, AsyncIterator, Optional
+from .base import LLMProvider
+
+class MockProvider(LLMProvider):
+    """
+    Offline stand-in for a real provider (tests, benchmarks, --provider mock).
+
+    Replies after `latency` seconds (+/- `jitter`, with a `slow_rate` chance of a `slow_factor`
+    tail), streaming the JSON in `chunk_chars` pieces at `chars_per_second`. `failure_rate` returns
+    the error fallback like a real provider on an exception; `invalid_rate` emits malformed JSON.
+    `capture_rate` of the replies ask to save a note (to `capture_file`), exercising the storage path.
+    """
+    ERROR_TEXT = "I'm having trouble connecting to the mock model."
+
+    def __init__(self, model_name: str = "mock", latency: float = 0.3, jitter: float = 0.1,
+                 slow_rate: float = 0.0, slow_factor: float = 5.0, failure_rate: float = 0.0,
+                 invalid_rate: float = 0.0, chunk_chars: int = 8, chars_per_second: float = 400.0,
+                 text: Optional[str] = None, seed: Optional[int] = None, capture_rate: float = 0.0,
+                 capture_file: str = "mock_ideas.md"):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.failure_rate = failure_rate
+        self.invalid_rate = invalid_rate
+        self.chunk_chars = chunk_chars
+        self.chars_per_second = chars_per_second
+        self.text = text
+        self.capture_rate = capture_rate
+        self.capture_file = capture_file
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self) -> float:
+        delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if self.random.random() < self.slow_rate:
+            delay *= self.slow_factor
+        return delay
+
+    def _reply(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        heard = messages[-1]["content"] if messages else ""
+        text = self.text or f"Mock reply {self.calls} from {self.model_name}. You said: {heard[:60]}"
+        data_management = {"will_capture": False}
+        if self.capture_rate and self.random.random() < self.capture_rate:
+            data_management = {"will_capture": True,
+                               "capture_payload": {"filename": self.capture_file, "content": f"## Turn {self.calls}\n{heard[:200]}"}}
+        return {
+            "voice_output": {"text": text},
+            "data_management": data_management
+        }
+
+    def _outcome(self):
+        roll = self.random.random()
+        if roll < self.failure_rate:
+            return "failure"
+        if roll < self.failure_rate + self.invalid_rate:
+            return "invalid"
+        return "ok"
+
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        self.calls += 1
+        outcome = self._outcome()
+        await asyncio.sleep(self._delay())
+        if outcome != "ok":
+            # A real provider swallows the parse error (or the exception) the same way
+            print(f"Error generating response from {self.model_name}: simulated {outcome}")
+            return self.error_response()
+        self.record_usage(usage, uncached=sum(self.count_tokens(m["content"]) for m in messages), output=40)
+        return self._reply(messages)
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        self.calls += 1
+        outcome = self._outcome()
+        await asyncio.sleep(self._delay())
+        if outcome == "failure":
+            print(f"Error streaming response from {self.model_name}: simulated failure")
+            yield json.dumps(self.error_response())
+            return
+
+        document = json.dumps(self._reply(messages))
+        if outcome == "invalid":
+            document = document[:len(document) // 2] + "<|garbled|>"
+        pause = self.chunk_chars / self.chars_per_second
+        for start in range(0, len(document), self.chunk_chars):
+            yield document[start:start + self.chunk_chars]
+            await asyncio.sleep(pause)
+        self.record_usage(usage, uncached=sum(self.count_tokens(m["content"]) for m in messages), output=len(document) // 4)
@@ -1,36 +1,102 @@
 import os
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional
 from .base import LLMProvider
-from openai import AsyncOpenAI
+from .parsing import extract_json
+from . import transport
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+try:
+    import tiktoken
+except ImportError:
+    # Optional: exact token counts for context budgeting, else the base estimate
+    tiktoken = None
 
 class OpenAIProvider(LLMProvider):
+    ERROR_TEXT = "I'm having trouble connecting to OpenAI."
+
     def __init__(self, model_name: str = "gpt-4-turbo-preview"):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in environment variables.")
-        self.client = AsyncOpenAI(api_key=api_key)
+        http_client = transport.shared_client("openai", DefaultAsyncHttpxClient)
+        self.client = AsyncOpenAI(api_key=api_key, http_client=http_client, timeout=http_client.timeout)
         self.model_name = model_name
+        # Routes this session's requests to the same cache shard
+        self.cache_key = os.getenv("OPENAI_PROMPT_CACHE_KEY", "second-brain")
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
 
-    async def generate(self, system_prompt: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         try:
             # Combine system prompt with messages? Or use 'developer' role for o1 models?
             # Standard gpt-4 expects 'system' role.
-            
+            # OpenAI caches prompt prefixes automatically: static system prompt first, history next,
+            # and anything that changes per turn only in the newest user message.
             full_messages = [{"role": "system", "content": system_prompt}] + messages
             
             response = await self.client.chat.completions.create(
                 model=self.model_name,
                 messages=full_messages,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                prompt_cache_key=self.cache_key
             )
+            self._record(usage, response.usage)
             
             content = response.choices[0].message.content
-            return json.loads(content)
+            return extract_json(content)
 
         except Exception as e:
             print(f"Error generating response from OpenAI: {e}")
-            return {
-                "voice_output": {"text": "I'm having trouble connecting to OpenAI."},
-                "data_management": {"will_capture": False}
-            }
+            return self.error_response()
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return super().count_tokens(text)
+        return len(self.encoding.encode(text))
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        """
+        Streams the JSON response text deltas.
+        """
+        started = False
+        try:
+            full_messages = [{"role": "system", "content": system_prompt}] + messages
+
+            response = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=full_messages,
+                response_format={"type": "json_object"},
+                prompt_cache_key=self.cache_key,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    started = True
+                    yield chunk.choices[0].delta.content
+                if chunk.usage:
+                    # Sent as a final chunk with no choices
+                    self._record(usage, chunk.usage)
+
+        except Exception as e:
+            print(f"Error streaming response from OpenAI: {e}")
+            if not started:
+                yield json.dumps(self.error_response())
+
+    async def warmup(self):
+        await transport.warm(self.name, lambda: self.client.models.retrieve(self.model_name))
+
+    def _record(self, usage, response_usage):
+        if response_usage is None:
+            return
+        details = response_usage.prompt_tokens_details
+        cached = (details.cached_tokens or 0) if details else 0
+        self.record_usage(usage,
+                          cached=cached,
+                          uncached=response_usage.prompt_tokens - cached,
+                          output=response_usage.completion_tokens)
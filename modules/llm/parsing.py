@@ -0,0 +1,526 @@
+import asyncio
+import json
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {"true": True, "false": False, "null": None}
+# Characters that end a bare literal (true, 12, null) outside strings
+_LITERAL_END = frozenset( '{}[],:" \t\r\n' )
+
+class JSONStringStreamer:
+    """
+    Incremental scanner that pulls one string field out of a JSON document while it is still
+    being generated, e.g. ("voice_output", "text").
+
+    feed() takes raw model output (token deltas, possibly wrapped in ```json fences) and returns
+    the newly decoded characters of the watched field. Every other scalar field is recorded in
+    `fields` (path tuple -> value) the moment it closes; `closed` lists the ones not yet drained.
+    """
+    def __init__(self, path: Sequence[str] = ("voice_output", "text")):
+        self.path = list( path )
+        # Each frame: [kind ("obj"/"arr"), current key, expecting_key]
+        self._stack = []
+        self._in_string = False
+        self._string_is_key = False
+        self._key = []
+        self._escape = False
+        self._unicode = None
+        self._high_surrogate = None
+        self._watching = False
+        self.complete = False
+        self._value = []
+        self._literal = []
+        self.fields = {}
+        self.closed = []
+
+    def _current_path(self):
+        return [frame[1] for frame in self._stack if frame[0] == "obj"]
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    if self._unicode is not None:
+                        self._unicode += ch
+                        if len( self._unicode ) == 4:
+                            self._emit_code( int( self._unicode, 16 ), out )
+                            self._unicode = None
+                            self._escape = False
+                    elif ch == 'u':
+                        self._unicode = ""
+                    else:
+                        self._emit( _ESCAPES.get( ch, ch ), out )
+                        self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._close_string()
+                else:
+                    self._emit( ch, out )
+                continue
+
+            if ch in _LITERAL_END:
+                if self._literal:
+                    self._close_literal()
+            else:
+                self._literal.append( ch )
+                continue
+
+            if ch == '{':
+                self._stack.append( ["obj", None, True] )
+            elif ch == '[':
+                self._stack.append( ["arr", None, False] )
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+            elif ch == '"':
+                if not self._stack:
+                    continue
+                top = self._stack[-1]
+                self._in_string = True
+                self._string_is_key = top[0] == "obj" and top[2]
+                if self._string_is_key:
+                    self._key = []
+                else:
+                    self._value = []
+                    self._watching = not self.complete and self._current_path() == self.path
+            elif ch == ':':
+                if self._stack and self._stack[-1][0] == "obj":
+                    self._stack[-1][2] = False
+            elif ch == ',':
+                if self._stack and self._stack[-1][0] == "obj":
+                    self._stack[-1][2] = True
+        return "".join( out )
+
+    def _emit(self, text, out):
+        if self._string_is_key:
+            self._key.append( text )
+            return
+        self._value.append( text )
+        if self._watching:
+            out.append( text )
+
+    def _emit_code(self, code, out):
+        # Join UTF-16 surrogate pairs (\ud83d\ude00 style escapes).
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ( ( self._high_surrogate - 0xD800 ) << 10 ) + ( code - 0xDC00 )
+        self._high_surrogate = None
+        self._emit( chr( code ), out )
+
+    def _close_string(self):
+        self._in_string = False
+        if self._string_is_key:
+            self._stack[-1][1] = "".join( self._key )
+            return
+        if self._watching:
+            self._watching = False
+            self.complete = True
+        self._record( "".join( self._value ) )
+
+    def _close_literal(self):
+        token = "".join( self._literal )
+        self._literal = []
+        if not self._stack or ( self._stack[-1][0] == "obj" and self._stack[-1][2] ):
+            return   # prose or fences around the document
+        if token in _LITERALS:
+            self._record( _LITERALS[token] )
+            return
+        try:
+            self._record( float( token ) if any( c in token for c in ".eE" ) else int( token ) )
+        except ValueError:
+            pass
+
+    def _record(self, value):
+        path = tuple( self._current_path() )
+        self.fields[path] = value
+        self.closed.append( ( path, value ) )
+
+class SentenceChunker:
+    """
+    Splits streamed text into sentence-sized chunks for TTS.
+    Very short fragments ("Hi.") are held back and merged with what follows.
+    """
+    _BOUNDARY = re.compile( r'[.!?…]+["\')\]]*\s+|\n+' )
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in self._BOUNDARY.finditer( self._buffer ):
+            end = match.end()
+            if len( self._buffer[start:end].strip() ) >= self.min_chars:
+                sentences.append( self._buffer[start:end].strip() )
+                start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+def repair_json(text: str, info: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Best-effort repair of a model's JSON reply. Finds the first object (skipping prose and ``` fences),
+    escapes raw control characters inside strings, drops comments and trailing commas, maps Python
+    literals (True/False/None), stops after the first complete object, and closes whatever a truncated
+    reply left open (string, dangling key or value, brackets). Returns None if there is no object at all.
+    If info is given, info["truncated"] is set when the object had to be closed (the reply was cut off).
+    """
+    start = text.find( "{" )
+    if start < 0:
+        return None
+    out = []
+    stack = []          # expected closers
+    states = []         # per object frame: "key", "colon", "value", "next"
+    token = []
+    in_string = False
+    escape = 0          # 0, or chars still expected after a backslash (1, or 5 for \uXXXX)
+    i = start
+    n = len( text )
+
+    def flush_token():
+        if token:
+            word = "".join( token )
+            out.append( _PY_LITERALS.get( word, word ) )
+            token.clear()
+            if states and states[-1] == "value":
+                states[-1] = "next"
+
+    def strip_trailing_comma():
+        while out and out[-1] in " \t\r\n":
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    while i < n:
+        ch = text[i]
+        i += 1
+        if in_string:
+            if escape:
+                if escape == 1 and ch == "u":
+                    escape = 5
+                out.append( ch )
+                escape -= 1
+            elif ch == "\\":
+                out.append( ch )
+                escape = 1
+            elif ch == '"':
+                out.append( ch )
+                in_string = False
+                if states:
+                    states[-1] = {"key": "colon", "value": "next"}.get( states[-1], states[-1] )
+            elif ch < " ":
+                out.append( _CONTROL_ESCAPES.get( ch, f"\\u{ord( ch ):04x}" ) )
+            else:
+                out.append( ch )
+            continue
+
+        if ch == "/" and i < n and text[i] in "/*":
+            # Comments are not JSON, but models write them anyway
+            flush_token()
+            end = text.find( "\n" if text[i] == "/" else "*/", i )
+            i = n if end < 0 else end + ( 0 if text[i] == "/" else 2 )
+            continue
+        if ch.isalnum() or ch in "+-.":
+            token.append( ch )
+            continue
+        flush_token()
+
+        if ch == '"':
+            in_string = True
+            out.append( ch )
+        elif ch in "{[":
+            if states and states[-1] == "value":
+                states[-1] = "next"
+            stack.append( "}" if ch == "{" else "]" )
+            states.append( "key" if ch == "{" else "array" )
+            out.append( ch )
+        elif ch in "}]":
+            if not stack:
+                break
+            strip_trailing_comma()
+            out.append( stack.pop() )
+            states.pop()
+            if not stack:
+                return "".join( out )
+        elif ch == ":":
+            out.append( ch )
+            if states and states[-1] == "colon":
+                states[-1] = "value"
+        elif ch == ",":
+            out.append( ch )
+            if states and states[-1] == "next":
+                states[-1] = "key"
+        elif ch in " \t\r\n":
+            out.append( ch )
+        # anything else (backticks, stray prose) is dropped
+
+    # Truncated: finish the open string / literal and close every frame.
+    if info is not None:
+        info["truncated"] = True
+    if in_string:
+        if escape:
+            # Drop an unfinished escape sequence
+            while out and out[-1] != "\\":
+                out.pop()
+            out.pop()
+        out.append( '"' )
+        if states:
+            states[-1] = {"key": "colon", "value": "next"}.get( states[-1], states[-1] )
+    if token:
+        word = "".join( token )
+        for literal in ( "true", "false", "null" ):
+            if literal.startswith( word ):
+                word = literal
+                break
+        else:
+            word = _PY_LITERALS.get( word, word.rstrip( "+-.eE" ) or "null" )
+        token[:] = [word]
+        flush_token()
+    while stack:
+        state = states.pop()
+        if state == "colon":
+            out.append( ": null" )
+        elif state == "value":
+            out.append( " null" )
+        else:
+            strip_trailing_comma()
+        out.append( stack.pop() )
+    return "".join( out )
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+
+def extract_json(content: str, repair: bool = True) -> Dict[str, Any]:
+    """
+    Parses a model reply that may be wrapped in markdown fences or prose.
+    With repair=False only well-formed documents are accepted (used to tell a finished stream from a partial one).
+    """
+    try:
+        return json.loads( content )
+    except json.JSONDecodeError:
+        pass
+    if "```json" in content:
+        fenced = content.split( "```json" )[1].split( "```" )[0].strip()
+    elif "```" in content:
+        fenced = content.split( "```" )[1].strip()
+    else:
+        fenced = None
+    if fenced:
+        try:
+            return json.loads( fenced )
+        except json.JSONDecodeError:
+            if not repair:
+                raise
+    elif not repair:
+        return json.loads( content )
+    info = {}
+    repaired = repair_json( content, info )
+    if repaired is None:
+        raise json.JSONDecodeError( "No JSON object in reply", content, 0 )
+    data = json.loads( repaired )
+    if info.get( "truncated" ) and isinstance( data, dict ):
+        # Cut off: what was spoken is still usable, but a capture closed by the repair may be half-written
+        dropped = data.get( "data_management" )
+        if isinstance( dropped, dict ) and dropped.get( "will_capture" ):
+            print( "[LLM] Reply was cut off, dropped its capture" )
+        data = {**{key: data[key] for key in ( "voice_output", ) if key in data},
+                "data_management": {"will_capture": False}, "truncated": True}
+    return data
+
+def compile_schema(schema: Dict[str, Any], path: str = "$"):
+    """
+    Compiles a small JSON-schema subset (type object/string/boolean/number, properties, required)
+    into nested closures once, so validating a reply is a few function calls instead of a schema walk.
+    The returned validate(value, errors) returns the value, coerced where that is unambiguous
+    ("true" -> True, 12 -> "12"), and appends "path: problem" strings to errors.
+    """
+    kind = schema.get( "type" )
+    if kind == "object":
+        properties = {key: compile_schema( sub, f"{path}.{key}" ) for key, sub in schema.get( "properties", {} ).items()}
+        required = tuple( schema.get( "required", () ) )
+
+        def validate(value, errors):
+            if not isinstance( value, dict ):
+                errors.append( f"{path}: expected object" )
+                return value
+            for key in required:
+                if key not in value:
+                    errors.append( f"{path}.{key}: missing" )
+            for key, check in properties.items():
+                if key in value:
+                    value[key] = check( value[key], errors )
+            return value
+    elif kind == "string":
+        def validate(value, errors):
+            if isinstance( value, str ):
+                return value
+            if isinstance( value, ( int, float ) ) and not isinstance( value, bool ):
+                return str( value )
+            errors.append( f"{path}: expected string" )
+            return value
+    elif kind == "boolean":
+        def validate(value, errors):
+            if isinstance( value, bool ):
+                return value
+            if isinstance( value, str ) and value.strip().lower() in _BOOL_WORDS:
+                return _BOOL_WORDS[value.strip().lower()]
+            if value in ( 0, 1 ):
+                return bool( value )
+            errors.append( f"{path}: expected boolean" )
+            return value
+    elif kind == "number":
+        def validate(value, errors):
+            if isinstance( value, ( int, float ) ) and not isinstance( value, bool ):
+                return value
+            errors.append( f"{path}: expected number" )
+            return value
+    else:
+        def validate(value, errors):
+            return value
+    return validate
+
+_BOOL_WORDS = {"true": True, "false": False, "yes": True, "no": False}
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "required": ["voice_output"],
+    "properties": {
+        "voice_output": {
+            "type": "object",
+            "required": ["text"],
+            "properties": {"text": {"type": "string"}},
+        },
+        "data_management": {
+            "type": "object",
+            "properties": {
+                "will_capture": {"type": "boolean"},
+                "capture_payload": {
+                    "type": "object",
+                    "properties": {"filename": {"type": "string"}, "content": {"type": "string"}},
+                },
+            },
+        },
+        "error": {"type": "boolean"},
+    },
+}
+
+_validate_response = compile_schema( RESPONSE_SCHEMA )
+
+def validate_response(data: Any):
+    """
+    Checks a parsed reply against RESPONSE_SCHEMA. Returns (reply or None, errors).
+    A reply with a usable voice_output is kept even if data_management is broken; the capture
+    is dropped instead, so the user never has to repeat themselves over a bad side channel.
+    """
+    errors = []
+    if isinstance( data, dict ) and isinstance( data.get( "voice_output" ), str ):
+        # {"voice_output": "text"}: unambiguous, take it
+        data["voice_output"] = {"text": data["voice_output"]}
+    data = _validate_response( data, errors )
+    if any( e.startswith( ( "$:", "$.voice_output" ) ) for e in errors ):
+        return None, errors
+    if errors:
+        data["data_management"] = {"will_capture": False}
+    return data, errors
+
+def parse_response(content: str) -> Dict[str, Any]:
+    """
+    Raw model text -> validated reply. Raises ValueError if no usable reply can be recovered.
+    """
+    try:
+        data = extract_json( content )
+    except json.JSONDecodeError as e:
+        raise ValueError( f"Unparseable reply: {e}" )
+    data, errors = validate_response( data )
+    if data is None:
+        raise ValueError( f"Reply does not match schema: {', '.join( errors )}" )
+    if errors:
+        print( f"[LLM] Dropped invalid data_management: {', '.join( errors )}" )
+    return data
+
+def is_valid_response(data: Any) -> bool:
+    """
+    True for a reply the pipeline can use: voice_output.text is a string and data_management,
+    if present, is an object. Provider error fallbacks (error_response()) don't count.
+    """
+    if not isinstance( data, dict ) or data.get( "error" ):
+        return False
+    voice = data.get( "voice_output" )
+    if not isinstance( voice, dict ) or not isinstance( voice.get( "text" ), str ):
+        return False
+    return isinstance( data.get( "data_management", {} ), dict )
+
+class ResponseStream:
+    """
+    Drives an LLMProvider.stream() and exposes two views of it:
+      - sentences(): voice_output.text split into sentences as soon as they are complete
+      - collect(): the full parsed JSON once the stream ends (repaired and validated)
+    Scalar fields are available in `fields` (and via on_field) as soon as they close.
+    """
+    _DONE = object()
+
+    def __init__(self, deltas: AsyncIterator[str], min_chars: int = 12, on_field=None):
+        self.deltas = deltas
+        # on_field("data_management.capture_payload.filename", value): called as each field closes
+        self.on_field = on_field
+        self.streamer = JSONStringStreamer()
+        self.chunker = SentenceChunker( min_chars=min_chars )
+        self.raw = []
+        self.voice_text = []
+        self._sentences = asyncio.Queue()
+
+    async def collect(self) -> Dict[str, Any]:
+        try:
+            async for delta in self.deltas:
+                self.raw.append( delta )
+                text = self.streamer.feed( delta )
+                if text:
+                    self.voice_text.append( text )
+                    for sentence in self.chunker.feed( text ):
+                        self._sentences.put_nowait( sentence )
+                if self.streamer.closed:
+                    if self.on_field is not None:
+                        for path, value in self.streamer.closed:
+                            self.on_field( ".".join( path ), value )
+                    self.streamer.closed.clear()
+        finally:
+            # Closing the provider stream also releases its HTTP response (e.g. on barge-in).
+            if hasattr( self.deltas, "aclose" ):
+                await self.deltas.aclose()
+            rest = self.chunker.flush()
+            if rest:
+                self._sentences.put_nowait( rest )
+            self._sentences.put_nowait( self._DONE )
+
+        raw = "".join( self.raw )
+        try:
+            return parse_response( raw )
+        except ValueError as e:
+            # The spoken part already went out; keep it in history even if the tail was malformed.
+            print( f"[LLM] Could not parse streamed JSON ({len( raw )} chars): {e}" )
+            return {
+                "voice_output": {"text": "".join( self.voice_text )},
+                "data_management": {"will_capture": False}
+            }
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        return {".".join( path ): value for path, value in self.streamer.fields.items()}
+
+    async def sentences(self):
+        while True:
+            sentence = await self._sentences.get()
+            if sentence is self._DONE:
+                break
+            yield sentence
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import time
+from typing import List, Dict, Any, AsyncIterator, Optional
+from .base import LLMProvider
+from .parsing import JSONStringStreamer, extract_json, parse_response, validate_response, is_valid_response
+from modules.metrics import LatencyHistogram
+
+_END = object()
+
+class Candidate:
+    """
+    One provider's attempt at a turn, run in its own task (SDK streams don't like changing tasks).
+
+    `decision` resolves True as soon as the attempt is usable (generate: a valid reply; stream: a
+    complete valid document or voice_output.text has started) and False if it can't be, with
+    `failure` set to "error" (provider fallback), "invalid" (schema / JSON) or "exception".
+    A streaming winner's deltas keep flowing through `queue` until _END; `valid` tells afterwards
+    whether the whole document parsed.
+    """
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        self.usage = {}
+        self.decision = asyncio.get_running_loop().create_future()
+        self.queue = asyncio.Queue()
+        self.result = None
+        self.failure = None
+        self.valid = None
+        self.task = None
+        self.started = time.perf_counter()
+
+    def _decide(self, ok: bool, failure: Optional[str] = None):
+        if not self.decision.done():
+            self.failure = None if ok else failure
+            self.decision.set_result(ok)
+
+    @classmethod
+    def generate(cls, provider: LLMProvider, system_prompt: str, messages: List[Dict[str, str]]) -> "Candidate":
+        candidate = cls(provider)
+
+        async def run():
+            try:
+                data = await provider.generate(system_prompt, messages, usage=candidate.usage)
+            except Exception as e:
+                print(f"[LLM] {provider.name} failed: {e}")
+                candidate._decide(False, "exception")
+                return
+            if isinstance(data, dict) and data.get("error"):
+                candidate.valid = False
+                candidate._decide(False, "error")
+                return
+            data, _ = validate_response(data)
+            candidate.valid = data is not None
+            if candidate.valid:
+                candidate.result = data
+                candidate._decide(True)
+            else:
+                candidate._decide(False, "invalid")
+
+        candidate.task = asyncio.create_task(run())
+        return candidate
+
+    @classmethod
+    def stream(cls, provider: LLMProvider, system_prompt: str, messages: List[Dict[str, str]]) -> "Candidate":
+        candidate = cls(provider)
+
+        async def run():
+            streamer = JSONStringStreamer()
+            raw = []
+            try:
+                async for delta in provider.stream(system_prompt, messages, usage=candidate.usage):
+                    candidate.queue.put_nowait(delta)
+                    raw.append(delta)
+                    if candidate.decision.done():
+                        continue
+                    started = streamer.feed(delta)
+                    try:
+                        data = extract_json("".join(raw), repair=False)
+                    except (json.JSONDecodeError, IndexError):
+                        if started:
+                            candidate._decide(True)
+                        continue
+                    # Complete document already (non-streaming providers, error fallbacks)
+                    if is_valid_response(data):
+                        candidate._decide(True)
+                    else:
+                        candidate._decide(False, "error" if isinstance(data, dict) and data.get("error") else "invalid")
+                try:
+                    parse_response("".join(raw))
+                    candidate.valid = True
+                except ValueError:
+                    candidate.valid = False
+                candidate._decide(False, "invalid")
+            except Exception as e:
+                print(f"[LLM] {provider.name} failed: {e}")
+                candidate._decide(False, "exception")
+            finally:
+                candidate.queue.put_nowait(_END)
+
+        candidate.task = asyncio.create_task(run())
+        return candidate
+
+    async def deltas(self) -> AsyncIterator[str]:
+        """
+        The winner's stream, from the first delta (already buffered ones included).
+        """
+        try:
+            while True:
+                delta = await self.queue.get()
+                if delta is _END:
+                    break
+                yield delta
+        finally:
+            # Closed early (barge-in): stop the request too
+            self.cancel()
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+class RacingProvider(LLMProvider):
+    """
+    Sends each turn to several providers and keeps the first usable reply; the rest are cancelled.
+
+    hedge_delay=None starts every provider at once. With a delay (seconds) only the first one starts,
+    and the next is launched whenever no winner has emerged after another hedge_delay, or right away
+    when a candidate fails. With adaptive=True the order follows each provider's rolling p50 latency.
+
+    generate(): the first reply that passes validate_response() wins.
+    stream(): a candidate wins as soon as its output is either a complete valid document or has started
+    streaming voice_output.text, so TTS can start before the reply is finished.
+    """
+    ERROR_TEXT = "I'm having trouble connecting to the language models."
+
+    def __init__(self, providers: List[LLMProvider], hedge_delay: Optional[float] = None, adaptive: bool = True, window: int = 100):
+        if not providers:
+            raise ValueError("RacingProvider needs at least one provider.")
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.adaptive = adaptive
+        self.histograms = {p.name: LatencyHistogram(window) for p in self.providers}
+        self.stats = {p.name: {"wins": 0, "losses": 0, "failures": 0} for p in self.providers}
+        self.launched = {p.name: 0 for p in self.providers}
+        self.hedges = 0
+
+    @property
+    def name(self) -> str:
+        return "Racing[" + ", ".join(p.name for p in self.providers) + "]"
+
+    def count_tokens(self, text: str) -> int:
+        return self.providers[0].count_tokens(text)
+
+    def ordered(self) -> List[LLMProvider]:
+        """
+        Launch order: fastest recent p50 first. A provider never launched yet goes first once so it gets
+        measured; one that was launched but has no samples (it only ever failed) goes last.
+        """
+        if not self.adaptive:
+            return list(self.providers)
+        def key(indexed):
+            index, provider = indexed
+            p50 = self.histograms[provider.name].percentile(50)
+            if p50 is None:
+                p50 = float("inf") if self.launched[provider.name] else 0.0
+            return (p50, index)
+        return [p for _, p in sorted(enumerate(self.providers), key=key)]
+
+    async def _race(self, launch) -> Optional[Candidate]:
+        """
+        launch(provider) -> Candidate. Returns the winning candidate, or None if every provider failed.
+        """
+        order = self.ordered()
+        running = {}
+        next_index = 0
+
+        def start_next():
+            nonlocal next_index
+            candidate = launch(order[next_index])
+            self.launched[candidate.provider.name] += 1
+            next_index += 1
+            running[candidate.decision] = candidate
+
+        try:
+            start_next()
+            while self.hedge_delay is None and next_index < len(order):
+                start_next()
+
+            while running:
+                more = next_index < len(order)
+                done, _ = await asyncio.wait(running.keys(), timeout=self.hedge_delay if more else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge: the leader is slower than we are willing to wait
+                    self.hedges += 1
+                    start_next()
+                    continue
+                for decision in done:
+                    candidate = running.pop(decision)
+                    name = candidate.provider.name
+                    if not decision.result():
+                        self.stats[name]["failures"] += 1
+                        if next_index < len(order):
+                            start_next()
+                        continue
+                    now = time.perf_counter()
+                    self.histograms[name].record(now - candidate.started)
+                    self.stats[name]["wins"] += 1
+                    for loser in running.values():
+                        self.stats[loser.provider.name]["losses"] += 1
+                        # A lower bound (it would have taken at least this long): without it a provider
+                        # that always loses is never measured and keeps being launched first
+                        self.histograms[loser.provider.name].record(now - loser.started)
+                    return candidate
+            return None
+        finally:
+            for candidate in running.values():
+                candidate.cancel()
+
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        winner = await self._race(lambda provider: Candidate.generate(provider, system_prompt, messages))
+        if winner is None:
+            return self.error_response()
+        self._merge_usage(usage, winner.usage)
+        return winner.result
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        winner = await self._race(lambda provider: Candidate.stream(provider, system_prompt, messages))
+        if winner is None:
+            yield json.dumps(self.error_response())
+            return
+        async for delta in winner.deltas():
+            yield delta
+        self._merge_usage(usage, winner.usage)
+
+    @staticmethod
+    def _merge_usage(usage, winner_usage):
+        if usage is not None:
+            for key, value in winner_usage.items():
+                usage[key] = usage.get(key, 0) + value
+
+    def report(self) -> str:
+        lines = [f"[LLM] Race: {self.hedges} hedged launches"]
+        for p in self.providers:
+            lines.append(f"[LLM]   {p.name}: {self.stats[p.name]} latency {self.histograms[p.name]}")
+        return "\n".join(lines)
+
+    async def warmup(self):
+        await asyncio.gather(*(p.warmup() for p in self.providers))
+
+    async def aclose(self):
+        if any(h.count for h in self.histograms.values()):
+            print(self.report())
+        await asyncio.gather(*(p.aclose() for p in self.providers), return_exceptions=True)
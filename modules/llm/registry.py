@@ -0,0 +1,41 @@
+import importlib
+from typing import Dict, List, Optional, Tuple
+from .base import LLMProvider
+
+# name -> (module, class, default model). The SDK behind a provider is imported on first use only,
+# so a run pays for the one it talks to (google.genai alone is several hundred ms to import).
+PROVIDERS: Dict[str, Tuple[str, str, str]] = {
+    # Flash by default (faster/cheaper)
+    "gemini": ("modules.llm.gemini", "GeminiProvider", "gemini-3-flash-preview"),
+    "anthropic": ("modules.llm.anthropic", "AnthropicProvider", "claude-3-opus-20240229"),
+    "openai": ("modules.llm.openai", "OpenAIProvider", "gpt-4-turbo-preview"),
+    # Offline runs: no API key, canned replies
+    "mock": ("modules.llm.mock", "MockProvider", "mock"),
+}
+
+def names() -> List[str]:
+    return list(PROVIDERS)
+
+def provider_class(name: str) -> type:
+    """
+    Imports and returns the provider class registered under name.
+    """
+    try:
+        module_name, class_name, _ = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown provider '{name}' (choose from {', '.join(PROVIDERS)})")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def create(name: str, model: Optional[str] = None) -> LLMProvider:
+    """
+    Builds a provider by name, e.g. create("gemini") or create("openai", "gpt-4o-mini").
+    """
+    cls = provider_class(name)
+    return cls(model_name=model or PROVIDERS[name][2])
+
+def parse_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """
+    "provider[:model]" -> (provider, model or None).
+    """
+    name, _, model = spec.strip().partition(":")
+    return name, model or None
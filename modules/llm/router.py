@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import time
+from typing import List, Dict, Any, AsyncIterator, Optional
+from .base import LLMProvider
+from .racing import Candidate
+from modules.metrics import LatencyHistogram
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold consecutive failures) -> open -> (cooldown) -> half-open.
+    Half-open lets one trial request through: success closes the breaker, failure reopens it
+    with the cooldown doubled (up to max_cooldown).
+    """
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.cooldown = self.base_cooldown
+
+    def failure(self):
+        self.consecutive_failures += 1
+        if self.trial:
+            # Failed its probe: back off harder
+            self.cooldown = min( self.cooldown * 2, self.max_cooldown )
+            self.opened_at = time.monotonic()
+            self.trial = False
+        elif self.opened_at is None and self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class BackendHealth:
+    """
+    Live telemetry for one provider/model: latency to the first usable output, outcome counters
+    and its circuit breaker.
+    """
+    def __init__(self, breaker: CircuitBreaker, window: int = 50):
+        self.latency = LatencyHistogram( window )
+        self.breaker = breaker
+        self.counts = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "parse_failures": 0, "bypassed": 0}
+        self.last_used = 0.0
+
+    def snapshot(self) -> dict:
+        return dict( self.counts, state=self.breaker.state, latency=str( self.latency ) )
+
+class RouterProvider(LLMProvider):
+    """
+    Routes each turn to one backend based on live telemetry.
+
+    `backends` are in order of preference, e.g. [primary model, flash tier, other provider].
+    A backend is skipped while its circuit breaker is open, or when its rolling p95 latency to first
+    output exceeds `latency_budget` and a later backend is predicted to fit it (fallback to a faster
+    model). A bypassed backend still gets one probe every `probe_interval` seconds so it can recover.
+    Timeouts (no usable output within `timeout`), provider errors and unparseable replies count as
+    failures; if nothing has been spoken yet the turn is retried on the next backend.
+    """
+    ERROR_TEXT = "I'm having trouble connecting to the language models."
+
+    def __init__(self, backends: List[LLMProvider], latency_budget: Optional[float] = None, timeout: Optional[float] = None,
+                 failure_threshold: int = 3, cooldown: float = 30.0, probe_interval: float = 60.0, window: int = 20):
+        if not backends:
+            raise ValueError( "RouterProvider needs at least one backend." )
+        self.backends = list( backends )
+
+        # Latency budget to the first words of a reply: Arg > Env > Default(1.5s)
+        if latency_budget is None:
+            try:
+                latency_budget = float( os.getenv( "LLM_LATENCY_BUDGET_MS", "1500" ) ) / 1000
+            except ValueError:
+                latency_budget = 1.5
+        # Give up on a backend that produced nothing usable: Arg > Env > Default(8s)
+        if timeout is None:
+            try:
+                timeout = float( os.getenv( "LLM_TIMEOUT_S", "8" ) )
+            except ValueError:
+                timeout = 8.0
+        self.latency_budget = latency_budget
+        self.timeout = timeout
+        self.probe_interval = probe_interval
+        self.health = {b.name: BackendHealth( CircuitBreaker( failure_threshold, cooldown ), window ) for b in self.backends}
+
+    @property
+    def name(self) -> str:
+        return "Router[" + ", ".join( b.name for b in self.backends ) + "]"
+
+    def count_tokens(self, text: str) -> int:
+        return self.backends[0].count_tokens( text )
+
+    def _fits_budget(self, backend) -> bool:
+        p95 = self.health[backend.name].latency.percentile( 95 )
+        # No data yet: assume it fits (and measure it)
+        return p95 is None or p95 <= self.latency_budget
+
+    def choose(self, exclude=()) -> Optional[LLMProvider]:
+        """
+        Picks the backend for the next attempt, or None if every candidate is excluded or broken.
+        """
+        available = [b for b in self.backends if b not in exclude and self.health[b.name].breaker.state != "open"]
+        if not available:
+            return None
+        now = time.monotonic()
+        for index, backend in enumerate( available ):
+            health = self.health[backend.name]
+            faster_later = any( self._fits_budget( b ) for b in available[index + 1:] )
+            probing = now - health.last_used >= self.probe_interval
+            if self._fits_budget( backend ) or not faster_later or probing:
+                if health.breaker.allow():
+                    return backend
+                continue
+            health.counts["bypassed"] += 1
+        # Everything left is over budget or waiting on a half-open trial: take the fastest that will accept
+        for backend in sorted( available, key=lambda b: self.health[b.name].latency.percentile( 50 ) or 0.0 ):
+            if self.health[backend.name].breaker.allow():
+                return backend
+        return None
+
+    def _record(self, candidate: Candidate, ok: bool, reason: Optional[str] = None):
+        health = self.health[candidate.provider.name]
+        if ok:
+            health.counts["ok"] += 1
+            health.latency.record( time.perf_counter() - candidate.started )
+            health.breaker.success()
+            return
+        health.counts[{"timeout": "timeouts", "invalid": "parse_failures"}.get( reason, "errors" )] += 1
+        health.breaker.failure()
+        if health.breaker.state != "closed":
+            print( f"[LLM] Circuit open for {candidate.provider.name} ({health.breaker.consecutive_failures} failures, retry in {health.breaker.cooldown:.0f}s)" )
+
+    async def _attempt(self, launch) -> Optional[Candidate]:
+        """
+        Tries backends in routing order until one produces usable output in time.
+        """
+        tried = []
+        while True:
+            backend = self.choose( exclude=tried )
+            if backend is None:
+                return None
+            tried.append( backend )
+            health = self.health[backend.name]
+            health.counts["calls"] += 1
+            health.last_used = time.monotonic()
+
+            candidate = launch( backend )
+            try:
+                ok = await asyncio.wait_for( asyncio.shield( candidate.decision ), self.timeout )
+            except asyncio.TimeoutError:
+                candidate.cancel()
+                print( f"[LLM] {backend.name} timed out after {self.timeout:.1f}s, trying the next backend" )
+                self._record( candidate, False, "timeout" )
+                continue
+            except asyncio.CancelledError:
+                candidate.cancel()
+                raise
+            if ok:
+                self._record( candidate, True )
+                return candidate
+            self._record( candidate, False, candidate.failure )
+
+    async def generate(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        candidate = await self._attempt( lambda backend: Candidate.generate( backend, system_prompt, messages ) )
+        if candidate is None:
+            return self.error_response()
+        self.record_usage( usage, **self._usage( candidate ) )
+        return candidate.result
+
+    async def stream(self, system_prompt: str, messages: List[Dict[str, str]], usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+        candidate = await self._attempt( lambda backend: Candidate.stream( backend, system_prompt, messages ) )
+        if candidate is None:
+            yield json.dumps( self.error_response() )
+            return
+        async for delta in candidate.deltas():
+            yield delta
+        if candidate.valid is False:
+            # Already spoken, too late to retry; but it counts against the backend
+            health = self.health[candidate.provider.name]
+            health.counts["parse_failures"] += 1
+            health.breaker.failure()
+        self.record_usage( usage, **self._usage( candidate ) )
+
+    @staticmethod
+    def _usage(candidate: Candidate) -> dict:
+        u = candidate.usage
+        return {"cached": u.get( "cached_tokens", 0 ), "uncached": u.get( "uncached_tokens", 0 ),
+                "cache_write": u.get( "cache_write_tokens", 0 ), "output": u.get( "output_tokens", 0 )}
+
+    def report(self) -> str:
+        lines = [f"[LLM] Router (budget {self.latency_budget * 1000:.0f}ms, timeout {self.timeout:.1f}s)"]
+        for b in self.backends:
+            lines.append( f"[LLM]   {b.name}: {self.health[b.name].snapshot()}" )
+        return "\n".join( lines )
+
+    async def warmup(self):
+        await asyncio.gather( *( b.warmup() for b in self.backends ) )
+
+    async def aclose(self):
+        if any( h.counts["calls"] for h in self.health.values() ):
+            print( self.report() )
+        await asyncio.gather( *( b.aclose() for b in self.backends ), return_exceptions=True )
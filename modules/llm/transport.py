@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+from typing import Dict, Optional
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    # Optional: pip install h2 to multiplex requests over one connection per host
+    HTTP2_AVAILABLE = False
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+class TransportConfig:
+    """
+    HTTP settings shared by every provider SDK: Arg > Env > Default.
+
+    keepalive is how long an idle pooled connection is kept; it has to outlast the pause
+    between two spoken turns (httpx's own default is 5s), or every turn pays DNS + TLS again.
+    """
+    def __init__(self, connect: Optional[float] = None, read: Optional[float] = None, keepalive: Optional[float] = None,
+                 max_connections: Optional[int] = None, http2: Optional[bool] = None):
+        self.connect = connect if connect is not None else _env_float("LLM_CONNECT_TIMEOUT_S", 5.0)
+        self.read = read if read is not None else _env_float("LLM_READ_TIMEOUT_S", 60.0)
+        self.keepalive = keepalive if keepalive is not None else _env_float("LLM_KEEPALIVE_S", 120.0)
+        self.max_connections = max_connections if max_connections is not None else int(_env_float("LLM_MAX_CONNECTIONS", 10))
+        if http2 is None:
+            http2 = os.getenv("LLM_HTTP2", "1").lower() not in ("0", "false", "no")
+        if http2 and not HTTP2_AVAILABLE:
+            http2 = False
+        self.http2 = http2
+
+    def timeout(self, http=httpx):
+        # read also bounds the gap between two streamed chunks
+        return http.Timeout(self.read, connect=self.connect, write=self.connect, pool=self.connect)
+
+    def limits(self, http=httpx):
+        return http.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections,
+                           keepalive_expiry=self.keepalive)
+
+_config: Optional[TransportConfig] = None
+_clients: Dict[str, "httpx.AsyncClient"] = {}
+
+def config() -> TransportConfig:
+    global _config
+    if _config is None:
+        _config = TransportConfig()
+    return _config
+
+def _http_module(client_cls):
+    """
+    The httpx-compatible package client_cls is built on: SDKs pin either httpx or httpx2
+    and reject clients (and Timeout/Limits) from the other one.
+    """
+    for base in client_cls.__mro__:
+        module = sys.modules.get(base.__module__.split(".")[0])
+        if module is not None and all(hasattr(module, attr) for attr in ("AsyncClient", "Timeout", "Limits")):
+            return module
+    return httpx
+
+def shared_client(name: str, client_cls=httpx.AsyncClient):
+    """
+    One pooled client per API ("anthropic", "openai", "gemini"), shared by every provider instance
+    talking to it, so racing/fallback backends and test runs reuse the same warm connections.
+    client_cls is the SDK's own client class (e.g. anthropic.DefaultAsyncHttpxClient).
+    Pass client.timeout on to the SDK as well, it overrides the client's per request.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        cfg = config()
+        http = _http_module(client_cls)
+        client = client_cls(timeout=cfg.timeout(http), limits=cfg.limits(http), http2=cfg.http2, follow_redirects=True)
+        _clients[name] = client
+    return client
+
+async def warm(name: str, request) -> Optional[float]:
+    """
+    Awaits a cheap request (e.g. a model lookup) to resolve DNS and finish the TLS handshake
+    before the first turn. Returns the elapsed seconds, or None if it failed.
+    """
+    start = time.perf_counter()
+    try:
+        await request()
+    except Exception as e:
+        print(f"[LLM] Warm-up for {name} failed: {e}")
+        return None
+    elapsed = time.perf_counter() - start
+    print(f"[LLM] Warm-up for {name}: {elapsed * 1000:.0f}ms")
+    return elapsed
+
+async def aclose_all():
+    """
+    Closes every shared client (end of the session).
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        if not client.is_closed:
+            await client.aclose()
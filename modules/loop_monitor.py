@@ -0,0 +1,232 @@
+import asyncio
+import collections
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional
+from modules.metrics import LatencyHistogram
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+# Blocked time is charged to the stage of the innermost frame in our own code (first matching prefix)
+STAGES = (
+    ( "modules/asr", "asr" ),
+    ( "modules/llm/", "llm" ),
+    ( "modules/tts.py", "tts" ),
+    ( "modules/audio", "tts" ),
+    ( "modules/playback.py", "playback" ),
+    ( "modules/storage.py", "storage" ),
+    ( "modules/session_store.py", "session" ),
+    ( "modules/semantic_index.py", "recall" ),
+    ( "modules/note_search.py", "notes" ),
+    ( "modules/context.py", "context" ),
+    ( "modules/tracing.py", "tracing" ),
+    ( "modules/metrics.py", "tracing" ),
+    ( "modules/loop_monitor.py", "monitor" ),
+    ( "main.py", "pipeline" ),
+)
+
+def stage_of(path: str) -> Optional[str]:
+    """
+    Pipeline stage a source file belongs to, or None for code outside the repo (stdlib, libraries).
+    """
+    if not path.startswith( ROOT + os.sep ):
+        return None
+    relative = os.path.relpath( path, ROOT ).replace( os.sep, "/" )
+    for prefix, stage in STAGES:
+        if relative.startswith( prefix ):
+            return stage
+    return None
+
+def attribute(stack: List[traceback.FrameSummary]):
+    """
+    (stage, site, leaf) of one stack sample: the innermost frame of ours, where in it, and the call it was stuck in.
+    """
+    leaf = stack[-1]
+    leaf_name = f"{os.path.basename( leaf.filename )}:{leaf.lineno} {leaf.name}"
+    for frame in reversed( stack ):
+        stage = stage_of( frame.filename )
+        if stage:
+            site = f"{os.path.relpath( frame.filename, ROOT )}:{frame.lineno} {frame.name}"
+            return stage, site, "" if frame is leaf else leaf_name
+    return "other", leaf_name, ""
+
+class LoopMonitor:
+    """
+    Event-loop lag and blocking-call detector (--profile-loop).
+
+    A probe task sleeps `interval` in a loop and records how late it wakes up: that's the loop lag
+    every other callback sees. A watchdog thread checks the probe's heartbeat; while it is overdue
+    by more than the threshold (LOOP_BLOCK_MS, default 50ms) it samples the loop thread's stack.
+    Each stall over the threshold is flagged as it ends and charged to the pipeline stage whose code
+    was on the stack (a stall that held the GIL throughout has no samples and is "unsampled").
+    close() prints a summary and writes the full report as JSON to `report_path`.
+    """
+    def __init__(self, threshold_ms: Optional[float] = None, interval: float = 0.01, report_path: Optional[str] = None,
+                 sample_ms: float = 10, keep: int = 50, verbose: bool = True):
+        # Stall threshold: Arg > Env > Default(50ms)
+        if threshold_ms is None:
+            try:
+                threshold_ms = float( os.getenv( "LOOP_BLOCK_MS", "50" ) )
+            except ValueError:
+                threshold_ms = 50.0
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.sample_interval = sample_ms / 1000
+        self.report_path = report_path
+        self.keep = keep
+        self.verbose = verbose
+
+        self.lag = LatencyHistogram( window=10000 )
+        self.max_lag = 0.0
+        self.stalls = []                                   # the `keep` worst, with their stacks
+        self.stall_count = 0
+        self.blocked = 0.0
+        self.stages = collections.defaultdict( lambda: {"stalls": 0, "blocked_s": 0.0, "worst_s": 0.0} )
+        self.sites = collections.Counter()                 # "stage | site -> leaf" -> blocked seconds
+
+        self._lock = threading.Lock()
+        self._samples = []
+        self._beat = None
+        self._started = None
+        self._task = None
+        self._watchdog = None
+        self._running = threading.Event()
+        self._loop_thread = None
+
+    def start(self):
+        """
+        Starts probing the running loop (call from inside it).
+        """
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._started = self._beat = time.perf_counter()
+        self._running.set()
+        self._task = asyncio.create_task( self._probe() )
+        self._watchdog = threading.Thread( target=self._watch, name="loop-watchdog", daemon=True )
+        self._watchdog.start()
+
+    async def _probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep( self.interval )
+            now = time.perf_counter()
+            lag = max( 0.0, now - start - self.interval )
+            with self._lock:
+                self._beat = now
+                samples, self._samples = self._samples, []
+            self.lag.record( lag )
+            self.max_lag = max( self.max_lag, lag )
+            if lag > self.threshold:
+                self._record_stall( lag, samples )
+
+    def _watch(self):
+        frames = sys._current_frames
+        while self._running.is_set():
+            time.sleep( self.sample_interval )
+            with self._lock:
+                overdue = time.perf_counter() - self._beat - self.interval
+            if overdue <= self.threshold:
+                continue
+            frame = frames().get( self._loop_thread )
+            if frame is None:
+                continue
+            stack = traceback.extract_stack( frame )
+            del frame
+            with self._lock:
+                # The probe may have woken up meanwhile: then this sample belongs to nobody
+                if time.perf_counter() - self._beat - self.interval > self.threshold:
+                    self._samples.append( stack )
+
+    def _record_stall(self, lag: float, samples):
+        self.stall_count += 1
+        self.blocked += lag
+        if samples:
+            attributed = [attribute( stack ) for stack in samples]
+        else:
+            attributed = [( "unsampled", "held the GIL (C code or a tight loop)", "" )]
+        # Split the stall's time across its samples: a long stall that moved between stages is shared
+        share = lag / len( attributed )
+        charged = set()
+        for stage, site, leaf in attributed:
+            entry = self.stages[stage]
+            entry["blocked_s"] += share
+            if stage not in charged:
+                entry["stalls"] += 1
+                entry["worst_s"] = max( entry["worst_s"], lag )
+                charged.add( stage )
+            self.sites[f"{stage} | {site}" + ( f" -> {leaf}" if leaf else "" )] += share
+
+        stage, site, leaf = collections.Counter( attributed ).most_common( 1 )[0][0]
+        if self.verbose:
+            print( f"[LOOP] Blocked {lag * 1000:.0f}ms in {stage}: {site}" + ( f" -> {leaf}" if leaf else "" ) )
+        stall = {
+            "at_s": round( time.perf_counter() - self._started, 3 ),
+            "ms": round( lag * 1000, 1 ),
+            "stage": stage,
+            "site": site,
+            "samples": len( samples ),
+            # The deepest sample's stack, our frames and the call they were in
+            "stack": [f"{os.path.relpath( f.filename, ROOT ) if stage_of( f.filename ) else os.path.basename( f.filename )}:{f.lineno} {f.name}"
+                      for f in ( max( samples, key=len )[-12:] if samples else [] )],
+        }
+        self.stalls.append( stall )
+        if len( self.stalls ) > self.keep:
+            self.stalls.remove( min( self.stalls, key=lambda s: s["ms"] ) )
+
+    def report(self) -> dict:
+        def ms(seconds):
+            return None if seconds is None else round( seconds * 1000, 1 )
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "monitored_s": round( elapsed, 1 ),
+            "threshold_ms": ms( self.threshold ),
+            "lag": {"p50_ms": ms( self.lag.percentile( 50 ) ), "p95_ms": ms( self.lag.percentile( 95 ) ),
+                    "p99_ms": ms( self.lag.percentile( 99 ) ), "max_ms": ms( self.max_lag )},
+            "stalls": self.stall_count,
+            "blocked_ms": ms( self.blocked ),
+            "stages": {stage: {"stalls": e["stalls"], "blocked_ms": ms( e["blocked_s"] ), "worst_ms": ms( e["worst_s"] )}
+                       for stage, e in sorted( self.stages.items(), key=lambda item: -item[1]["blocked_s"] )},
+            "sites": [{"site": site, "blocked_ms": ms( s )} for site, s in self.sites.most_common( 20 )],
+            "worst": sorted( self.stalls, key=lambda s: -s["ms"] ),
+        }
+
+    def summary(self) -> str:
+        report = self.report()
+        lag = report["lag"]
+        lines = [f"[LOOP] {report['monitored_s']}s monitored, lag p50 {lag['p50_ms']}ms p99 {lag['p99_ms']}ms max {lag['max_ms']}ms; "
+                 f"{report['stalls']} stalls over {report['threshold_ms']:.0f}ms ({report['blocked_ms']}ms blocked)"]
+        for stage, entry in report["stages"].items():
+            lines.append( f"[LOOP]   {stage:<10} {entry['stalls']:>4} stalls {entry['blocked_ms']:>8.1f}ms  worst {entry['worst_ms']}ms" )
+        for site in report["sites"][:5]:
+            lines.append( f"[LOOP]   {site['blocked_ms']:>8.1f}ms  {site['site']}" )
+        return "\n".join( lines )
+
+    def close(self) -> dict:
+        """
+        Stops monitoring, prints the summary and writes the report (if report_path). Returns the report.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._running.clear()
+        if self._watchdog is not None:
+            self._watchdog.join( timeout=1 )
+            self._watchdog = None
+        report = self.report()
+        if self.verbose:
+            print( self.summary() )
+        if self.report_path:
+            try:
+                os.makedirs( os.path.dirname( self.report_path ) or ".", exist_ok=True )
+                with open( self.report_path, "w", encoding="utf-8" ) as f:
+                    f.write( json.dumps( report, indent=2 ) )
+                if self.verbose:
+                    print( f"[LOOP] Report written to {self.report_path}" )
+            except OSError as e:
+                print( f"[LOOP] Report write failed: {e}" )
+        return report
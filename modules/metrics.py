@@ -0,0 +1,55 @@
+import collections
+from typing import Optional
+
+class LatencyHistogram:
+    """
+    Latency distribution for one backend: fixed log-spaced buckets over the whole session,
+    plus a rolling window of recent samples for percentiles that follow the current conditions.
+    """
+    BOUNDS_MS = ( 25, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 30000 )
+
+    def __init__(self, window: int = 100):
+        self.counts = [0] * ( len( self.BOUNDS_MS ) + 1 )
+        self.recent = collections.deque( maxlen=window )
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        bucket = 0
+        while bucket < len( self.BOUNDS_MS ) and ms > self.BOUNDS_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.recent.append( seconds )
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        pct-th percentile (seconds) of the recent window, or None without samples.
+        """
+        if not self.recent:
+            return None
+        ordered = sorted( self.recent )
+        index = min( len( ordered ) - 1, int( round( pct / 100 * ( len( ordered ) - 1 ) ) ) )
+        return ordered[index]
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def snapshot(self) -> dict:
+        def ms(value):
+            return None if value is None else round( value * 1000, 1 )
+        labels = [f"<={b}ms" for b in self.BOUNDS_MS] + [f">{self.BOUNDS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "mean_ms": ms( self.mean ),
+            "p50_ms": ms( self.percentile( 50 ) ),
+            "p95_ms": ms( self.percentile( 95 ) ),
+            "buckets": {label: n for label, n in zip( labels, self.counts ) if n},
+        }
+
+    def __str__(self):
+        snap = self.snapshot()
+        return f"n={snap['count']} p50={snap['p50_ms']}ms p95={snap['p95_ms']}ms mean={snap['mean_ms']}ms"
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from modules.semantic_index import TOKEN, STOP_WORDS, chunk_markdown, note_files
+
+# "what did I capture about X", "what have I said on X", "search my notes for X", "find notes about X"
+COMMANDS = [
+    re.compile( r"^(?:what|which)(?: notes)? (?:did|have) i (?:capture|captured|save|saved|say|said|note|noted|write|written|wrote) "
+                r"(?:about|on|regarding|for) (?P<query>.+)$", re.IGNORECASE ),
+    re.compile( r"^(?:search|find|look up|check)(?: in)? (?:my |the )?notes (?:for|about|on) (?P<query>.+)$", re.IGNORECASE ),
+]
+
+def match_command(text: str) -> Optional[str]:
+    """
+    The query of a spoken "what did I capture about ..." request, or None for anything else.
+    """
+    text = " ".join( text.strip().rstrip( "?.!" ).split() )
+    for pattern in COMMANDS:
+        match = pattern.match( text )
+        if match:
+            return match.group( "query" ).strip()
+    return None
+
+def fts_query(text: str, any_term: bool = False) -> str:
+    """
+    Free text -> FTS5 MATCH expression: each content word quoted (no FTS syntax leaks through) and
+    prefix-matched, all required unless any_term.
+    """
+    terms = [w.replace( '"', "" ) for w in TOKEN.findall( text.lower() ) if w not in STOP_WORDS]
+    return ( " OR " if any_term else " " ).join( f'"{t}"*' for t in terms if t )
+
+class NoteSearch:
+    """
+    Full-text index of the notes in `directory` (SQLite FTS5, porter stemming, BM25 ranking),
+    one row per heading-delimited chunk, in <directory>/.index/notes.sqlite3.
+
+    Kept current the same way as the SemanticIndex: a restart only re-reads files whose size or
+    mtime changed, and an append re-indexes just the file's last chunk plus the new ones.
+    """
+    def __init__(self, directory: str = "brain", path: Optional[str] = None):
+        self.directory = directory
+        self.path = path or os.path.join( directory, ".index", "notes.sqlite3" )
+        os.makedirs( os.path.dirname( self.path ), exist_ok=True )
+        # Updates run in a worker thread, searches on the event loop: one connection behind a lock
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.stats = {"searches": 0, "indexed": 0}
+        self.db = sqlite3.connect( self.path, check_same_thread=False )
+        self.db.execute( "PRAGMA journal_mode=WAL" )
+        self.db.execute( "PRAGMA synchronous=NORMAL" )
+        self.db.executescript( """
+            CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime REAL, tail INTEGER);
+            CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, file TEXT, offset INTEGER);
+            CREATE INDEX IF NOT EXISTS sections_file ON sections (file, offset);
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5 (heading, body, tokenize='porter unicode61');
+        """ )
+
+    def files(self) -> int:
+        with self._lock:
+            return self.db.execute( "SELECT COUNT(*) FROM files" ).fetchone()[0]
+
+    # --- updates -----------------------------------------------------------------------------
+
+    def sync(self) -> int:
+        """
+        Brings the whole directory up to date (startup, CLI). Returns how many chunks were indexed.
+        """
+        present = set( note_files( self.directory ) )
+        with self._lock, self.db:
+            indexed = sum( self._update( name ) for name in sorted( present ) )
+            for ( name, ) in self.db.execute( "SELECT name FROM files" ).fetchall():
+                if name not in present:
+                    self._drop( name, 0 )
+                    self.db.execute( "DELETE FROM files WHERE name = ?", ( name, ) )
+        return indexed
+
+    def update(self, *filenames: str) -> int:
+        """
+        Re-indexes what changed in the given notes, in one transaction. Returns the chunks indexed.
+        """
+        with self._lock, self.db:
+            return sum( self._update( name ) for name in filenames )
+
+    def schedule(self, filenames: List[str]):
+        """
+        Storage.on_saved hook (event loop): re-indexes the saved notes in a worker thread.
+        """
+        task = asyncio.create_task( asyncio.to_thread( self.update, *filenames ) )
+        self._pending.add( task )
+        task.add_done_callback( self._pending.discard )
+
+    def _update(self, filename: str) -> int:
+        path = os.path.join( self.directory, filename )
+        try:
+            st = os.stat( path )
+        except FileNotFoundError:
+            return 0
+        known = self.db.execute( "SELECT size, mtime, tail FROM files WHERE name = ?", ( filename, ) ).fetchone()
+        if known and known[0] == st.st_size and known[1] == st.st_mtime:
+            return 0
+        # Grew since last time: re-read from the start of the last chunk (the append may continue it)
+        start = known[2] if known and st.st_size > known[0] else 0
+        with open( path, "rb" ) as f:
+            f.seek( start )
+            text = f.read().decode( "utf-8", errors="replace" )
+
+        self._drop( filename, start )
+        tail = start
+        count = 0
+        for offset, heading, body in chunk_markdown( text, start ):
+            if heading:
+                # The heading has its own column (weighted in bm25); keep it out of the snippets
+                body = body.split( "\n", 1 )[1] if "\n" in body else ""
+            cursor = self.db.execute( "INSERT INTO sections (file, offset) VALUES (?, ?)", ( filename, offset ) )
+            self.db.execute( "INSERT INTO chunks (rowid, heading, body) VALUES (?, ?, ?)", ( cursor.lastrowid, heading, body ) )
+            tail = offset
+            count += 1
+        self.db.execute( "INSERT OR REPLACE INTO files (name, size, mtime, tail) VALUES (?, ?, ?, ?)",
+                         ( filename, st.st_size, st.st_mtime, tail ) )
+        self.stats["indexed"] += count
+        return count
+
+    def _drop(self, filename: str, from_offset: int):
+        ids = [( row, ) for ( row, ) in self.db.execute( "SELECT id FROM sections WHERE file = ? AND offset >= ?",
+                                                         ( filename, from_offset ) )]
+        self.db.executemany( "DELETE FROM chunks WHERE rowid = ?", ids )
+        self.db.executemany( "DELETE FROM sections WHERE id = ?", ids )
+
+    # --- queries -----------------------------------------------------------------------------
+
+    def search(self, query: str, limit: int = 5, raw: bool = False, marks=( "[", "]" )) -> List[dict]:
+        """
+        Best chunks for query: [{"file", "heading", "offset", "snippet", "score"}], best first.
+        Every word must match (prefixes count, "tomato" finds "tomatoes"); if nothing does, any word.
+        raw passes query through as an FTS5 expression (AND/OR/NEAR, "phrases", heading:word).
+        """
+        start = time.perf_counter()
+        attempts = [query] if raw else [fts_query( query ), fts_query( query, any_term=True )]
+        hits = []
+        with self._lock:
+            for expression in attempts:
+                if not expression:
+                    continue
+                # bm25 weights: a word in the heading counts double
+                rows = self.db.execute(
+                    "SELECT s.file, c.heading, s.offset, snippet(chunks, 1, ?, ?, '...', 16), bm25(chunks, 2.0, 1.0) AS rank "
+                    "FROM chunks c JOIN sections s ON s.id = c.rowid WHERE chunks MATCH ? ORDER BY rank LIMIT ?",
+                    ( marks[0], marks[1], expression, limit ) ).fetchall()
+                if rows:
+                    hits = [{"file": f, "heading": h, "offset": o, "snippet": s, "score": round( -r, 3 )} for f, h, o, s, r in rows]
+                    break
+        self.stats["searches"] += 1
+        self.stats["last_search_ms"] = round( ( time.perf_counter() - start ) * 1000, 2 )
+        return hits
+
+    async def aclose(self):
+        """
+        Finishes pending re-indexing and closes the database.
+        """
+        if self._pending:
+            await asyncio.gather( *self._pending, return_exceptions=True )
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+def spoken_answer(query: str, hits: List[dict], max_notes: int = 2) -> str:
+    """
+    Short reply read out for a voice query, from the top hits (snippets without highlight marks).
+    """
+    if not hits:
+        return f"I couldn't find anything you captured about {query}."
+    files = sorted( { hit["file"] for hit in hits } )
+    parts = [f"I found {len( hits )} {'note' if len( hits ) == 1 else 'notes'} about {query}, in {', '.join( os.path.splitext( f )[0] for f in files )}."]
+    for hit in hits[:max_notes]:
+        where = f"Under {hit['heading']}" if hit["heading"] else f"In {os.path.splitext( hit['file'] )[0]}"
+        snippet = " ".join( hit["snippet"].replace( "#", "" ).split() )
+        parts.append( f"{where}: {snippet}" )
+    return " ".join( parts )
+
+def main(argv=None):
+    """
+    python main.py search "what did I say about pricing" (or python -m modules.note_search ...)
+    """
+    parser = argparse.ArgumentParser( prog="main.py search", description="Search captured notes" )
+    parser.add_argument( "query", nargs="+" )
+    parser.add_argument( "--limit", type=int, default=5 )
+    parser.add_argument( "--dir", default="brain", help="Notes directory" )
+    parser.add_argument( "--raw", action="store_true", help="Query is an FTS5 expression (AND/OR/NEAR, \"phrases\", heading:word)" )
+    args = parser.parse_args( argv )
+    query = " ".join( args.query )
+
+    index = NoteSearch( args.dir )
+    start = time.perf_counter()
+    indexed = index.sync()
+    if indexed:
+        print( f"[SEARCH] Indexed {indexed} chunks in {( time.perf_counter() - start ) * 1000:.0f}ms" )
+    try:
+        hits = index.search( match_command( query ) or query, limit=args.limit, raw=args.raw )
+    except sqlite3.OperationalError as e:
+        parser.error( f"bad query: {e}" )
+    for hit in hits:
+        where = hit["file"] + ( f" > {hit['heading']}" if hit["heading"] else "" )
+        print( f"{hit['score']:6.2f}  {where}\n        {' '.join( hit['snippet'].split() )}" )
+    print( f"[SEARCH] {len( hits )} results from {index.files()} notes in {index.stats['last_search_ms']}ms" )
+    index.close()
+
+if __name__ == "__main__":
+    main()
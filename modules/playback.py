@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+
+class PcmRingBuffer:
+    """
+    Bounded single-producer / single-consumer PCM ring over one preallocated bytearray.
+    Writes and reads copy through memoryviews, so no per-chunk buffers are allocated.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = bytearray( capacity )
+        self._view = memoryview( self._buf )
+        self._read = 0    # absolute byte counters; position in the ring is counter % capacity
+        self._write = 0
+        self._lock = threading.Lock()
+        self.readable = threading.Condition( self._lock )
+
+    def __len__(self):
+        return self._write - self._read
+
+    @property
+    def free(self) -> int:
+        return self.capacity - ( self._write - self._read )
+
+    def write_nowait(self, data) -> int:
+        """
+        Copies as much of data as fits. Returns the number of bytes written.
+        """
+        src = memoryview( data )
+        with self._lock:
+            n = min( len( src ), self.capacity - ( self._write - self._read ) )
+            if n <= 0:
+                return 0
+            start = self._write % self.capacity
+            first = min( n, self.capacity - start )
+            self._view[start:start + first] = src[:first]
+            if n > first:
+                self._view[0:n - first] = src[first:n]
+            self._write += n
+            self.readable.notify()
+        return n
+
+    def read_into(self, out: memoryview) -> int:
+        """
+        Copies up to len(out) buffered bytes into out. Returns the number of bytes read.
+        """
+        with self._lock:
+            n = min( len( out ), self._write - self._read )
+            if n <= 0:
+                return 0
+            start = self._read % self.capacity
+            first = min( n, self.capacity - start )
+            out[:first] = self._view[start:start + first]
+            if n > first:
+                out[first:n] = self._view[0:n - first]
+            self._read += n
+        return n
+
+    def clear(self) -> int:
+        """
+        Drops everything buffered (e.g. when playback is interrupted). Returns bytes dropped.
+        """
+        with self._lock:
+            dropped = self._write - self._read
+            self._read = self._write
+        return dropped
+
+class NullSink:
+    """
+    Audio sink that discards PCM. With realtime=True it blocks like a sound card would,
+    so benchmarks see realistic playback pacing.
+    """
+    def __init__(self, bytes_per_second: int = 48000, realtime: bool = True):
+        self.bytes_per_second = bytes_per_second
+        self.realtime = realtime
+        self.bytes_written = 0
+
+    def write(self, pcm):
+        self.bytes_written += len( pcm )
+        if self.realtime:
+            time.sleep( len( pcm ) / self.bytes_per_second )
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+class PlaybackThread:
+    """
+    Dedicated playback thread fed through a PCM jitter buffer.
+
+    The event loop only copies decoded audio into the ring; the blocking device write happens
+    here, so receiving the next frames overlaps with playing the current ones.
+    Playback of a reply starts once `prebuffer_ms` is buffered (or the reply ended), and an
+    underrun mid-reply drops back to buffering instead of stuttering chunk by chunk.
+    """
+    def __init__(self, sink, bytes_per_second: int, prebuffer_ms: int = 120, capacity_ms: int = 4000, period_ms: int = 20, frame_size: int = 2):
+        self.sink = sink
+        self.bytes_per_second = bytes_per_second
+        self.frame_size = frame_size
+        self.prebuffer_bytes = self._align( bytes_per_second * prebuffer_ms // 1000 )
+        self.period_bytes = max( frame_size, self._align( bytes_per_second * period_ms // 1000 ) )
+        self.ring = PcmRingBuffer( max( self.period_bytes * 2, self._align( bytes_per_second * capacity_ms // 1000 ) ) )
+
+        self._out = bytearray( self.period_bytes )
+        self._out_view = memoryview( self._out )
+        self._end_of_stream = threading.Event()
+        self._drained = threading.Event()
+        self._drained.set()
+        self._running = True
+        self._playing = False
+        self._starved = False
+        # perf_counter() of the current reply's first device write (tracing)
+        self.first_write_at = None
+
+        self.stats = {"underruns": 0, "backpressure_waits": 0, "dropped_bytes": 0, "bytes_played": 0}
+
+        self._thread = threading.Thread( target=self._run, name="tts-playback", daemon=True )
+        self._thread.start()
+
+    def _align(self, n):
+        return n - n % self.frame_size
+
+    def begin(self):
+        """
+        Marks the start of a new reply: playback waits for the pre-buffer again.
+        """
+        self._end_of_stream.clear()
+        self._drained.clear()
+        self.first_write_at = None
+
+    async def write(self, pcm):
+        """
+        Queues PCM for playback, waiting (without blocking the loop) while the ring is full.
+        """
+        view = memoryview( pcm )
+        while view:
+            n = self.ring.write_nowait( view )
+            view = view[n:]
+            if view:
+                self.stats["backpressure_waits"] += 1
+                await asyncio.sleep( self.period_bytes / self.bytes_per_second )
+
+    def end_of_stream(self):
+        """
+        No more audio for this reply: play whatever is buffered, even below the pre-buffer.
+        """
+        with self.ring.readable:
+            self._end_of_stream.set()
+            self.ring.readable.notify()
+
+    async def drain(self):
+        """
+        Waits until everything queued for the current reply has been played.
+        """
+        while not self._drained.is_set():
+            await asyncio.sleep( self.period_bytes / self.bytes_per_second )
+
+    def flush(self):
+        """
+        Drops buffered audio and ends the current reply immediately.
+        """
+        self.stats["dropped_bytes"] += self.ring.clear()
+        self.end_of_stream()
+
+    def _run(self):
+        while self._running:
+            with self.ring.readable:
+                while self._running:
+                    buffered = len( self.ring )
+                    ending = self._end_of_stream.is_set()
+                    if buffered and ( self._playing or ending or buffered >= self.prebuffer_bytes ):
+                        break
+                    if not buffered and ending:
+                        self._playing = False
+                        self._starved = False
+                        self._drained.set()
+                    self.ring.readable.wait( 0.05 )
+            if not self._running:
+                break
+
+            if self._starved:
+                # Ran dry mid-reply and more audio followed: that was a real underrun.
+                self.stats["underruns"] += 1
+                self._starved = False
+            self._playing = True
+            n = self.ring.read_into( self._out_view )
+            if self.first_write_at is None:
+                self.first_write_at = time.perf_counter()
+            # PyAudio only takes immutable bytes, so this is the one copy per period.
+            self.sink.write( bytes( self._out_view[:n] ) )
+            self.stats["bytes_played"] += n
+
+            if not len( self.ring ) and not self._end_of_stream.is_set():
+                # Network fell behind playback (or the reply is about to end): rebuffer.
+                self._playing = False
+                self._starved = True
+
+    def close(self):
+        self._running = False
+        with self.ring.readable:
+            self.ring.readable.notify()
+        self._thread.join( timeout=1 )
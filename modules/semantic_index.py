@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import List, Optional
+import numpy as np
+
+HEADING = re.compile( r"^#{1,6}\s", re.MULTILINE )
+TOKEN = re.compile( r"[\w']+" )
+STOP_WORDS = frozenset( """a an and are as at be but by can could do for from had has have how i if in into is it its
+me my of on or our should so that the their then there these this to was we what when where which who will with would
+you your""".split() )
+
+@lru_cache( maxsize=65536 )
+def _word_features(word: str, n: int, ngram_weight: float):
+    """
+    (crc32, weight) for a word and its character n-grams; notes reuse a small vocabulary, so this is mostly a cache hit.
+    """
+    padded = f"<{word}>"
+    # "#" keeps a 4-letter word and its only 4-gram in separate buckets
+    grams = ["#" + padded[i:i + n] for i in range( len( padded ) - n + 1 )]
+    return [( zlib.crc32( word.encode( "utf-8" ) ), 1.0 )] + [( zlib.crc32( g.encode( "utf-8" ) ), ngram_weight ) for g in grams]
+
+class HashingEmbedder:
+    """
+    Offline embedding: content words, word bigrams and character 4-grams (so "tomato" meets
+    "tomatoes") hashed with crc32 (stable across runs) into `dim` signed buckets, log term
+    frequency, L2-normalized. Lexical rather than semantic, but no model download and deterministic.
+    """
+    NGRAM = 4
+    NGRAM_WEIGHT = 0.5
+
+    def __init__(self, dim: int = 2048):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def features(self, text: str):
+        """
+        (crc32, weight) pairs: words, word bigrams and character n-grams.
+        """
+        words = [w for w in TOKEN.findall( text.lower() ) if w not in STOP_WORDS]
+        features = [( zlib.crc32( f"{a} {b}".encode( "utf-8" ) ), 1.0 ) for a, b in zip( words, words[1:] )]
+        for w in words:
+            features += _word_features( w, self.NGRAM, self.NGRAM_WEIGHT )
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros( ( len( texts ), self.dim ), dtype=np.float32 )
+        for row, text in enumerate( texts ):
+            features = self.features( text )
+            if not features:
+                continue
+            hashes = np.fromiter( ( h for h, _ in features ), dtype=np.uint32, count=len( features ) )
+            weights = np.fromiter( ( w for _, w in features ), dtype=np.float32, count=len( features ) )
+            weights[( hashes & 0x80000000 ) != 0] *= -1
+            np.add.at( out[row], hashes % self.dim, weights )
+            vec = np.sign( out[row] ) * np.log1p( np.abs( out[row] ) )
+            norm = np.linalg.norm( vec )
+            out[row] = vec / norm if norm else vec
+        return out
+
+class SentenceTransformerEmbedder:
+    """
+    Local neural embeddings via sentence-transformers (optional dependency), e.g. all-MiniLM-L6-v2.
+    """
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer( model_name )
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray( self.model.encode( texts, normalize_embeddings=True ), dtype=np.float32 )
+
+def make_embedder(model_name: Optional[str] = None):
+    """
+    Embedder: Arg > Env(SEMANTIC_MODEL, a sentence-transformers model) > Default(hashing).
+    """
+    model_name = model_name or os.getenv( "SEMANTIC_MODEL" )
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder( model_name )
+        except ImportError:
+            print( "[INDEX] sentence-transformers not installed, using hashing embeddings" )
+    return HashingEmbedder()
+
+def note_files(directory: str):
+    """
+    Markdown files under directory (hidden folders like .journal/.index skipped), relative paths.
+    """
+    for root, dirs, names in os.walk( directory ):
+        dirs[:] = [d for d in dirs if not d.startswith( "." )]
+        for name in names:
+            if name.endswith( ( ".md", ".markdown", ".txt" ) ):
+                yield os.path.relpath( os.path.join( root, name ), directory )
+
+def chunk_markdown(text: str, start: int = 0):
+    """
+    Splits markdown at headings. Yields (offset, heading, body) with offsets relative to the file.
+    """
+    bounds = [m.start() for m in HEADING.finditer( text )]
+    if not bounds or bounds[0] != 0:
+        bounds.insert( 0, 0 )
+    bounds.append( len( text ) )
+    for begin, end in zip( bounds, bounds[1:] ):
+        section = text[begin:end]
+        if not section.strip():
+            continue
+        first = section.split( "\n", 1 )[0]
+        heading = first.lstrip( "#" ).strip() if first.startswith( "#" ) else ""
+        yield start + len( text[:begin].encode( "utf-8" ) ), heading, section.strip()
+
+class SemanticIndex:
+    """
+    Embedding index over the markdown notes in `directory`, one row per heading-delimited chunk.
+
+    Vectors live in a memory-mapped float32 matrix (<directory>/.index/vectors.f32, grown by doubling)
+    with the chunk metadata in meta.json, so a restart only re-embeds files that changed.
+    Appending to a note re-embeds just its last chunk (the one the new text may extend) plus the new
+    ones; replaced rows are tombstoned and compacted away once they are half the matrix.
+    search() is one matrix-vector product over the live rows.
+    """
+    META_SAVE_S = 5.0
+
+    def __init__(self, directory: str = "brain", embedder=None, max_chunk_chars: int = 2000):
+        self.directory = directory
+        self.embedder = embedder or make_embedder()
+        self.dim = self.embedder.dim
+        self.max_chunk_chars = max_chunk_chars
+        self.index_dir = os.path.join( directory, ".index" )
+        self.vectors_path = os.path.join( self.index_dir, "vectors.f32" )
+        self.meta_path = os.path.join( self.index_dir, "meta.json" )
+        # _lock guards the matrix/rows against concurrent search(); _update_lock serializes writers
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._pending = set()
+        self._dirty = False
+        self._saved_at = 0.0
+        self.stats = {"searches": 0, "embedded": 0, "compactions": 0}
+
+        # rows[i] = {"file", "offset", "heading", "text"} or None (tombstone); files[name] = {"size", "mtime", "tail"}
+        self.rows = []
+        self.files = {}
+        self.matrix = None
+        self.capacity = 0
+        self._load()
+
+    # --- persistence -------------------------------------------------------------------------
+
+    def _load(self):
+        os.makedirs( self.index_dir, exist_ok=True )
+        try:
+            with open( self.meta_path, encoding="utf-8" ) as f:
+                meta = json.load( f )
+            if meta.get( "embedder" ) == self.embedder.name and meta.get( "dim" ) == self.dim:
+                self.rows = meta["rows"]
+                self.files = meta["files"]
+                self.capacity = meta["capacity"]
+        except ( FileNotFoundError, ValueError, KeyError ):
+            pass
+        if not self.capacity or not os.path.exists( self.vectors_path ) or \
+                os.path.getsize( self.vectors_path ) != self.capacity * self.dim * 4:
+            # Nothing usable on disk (or another embedder): start over, sync() refills it
+            self.rows, self.files, self.capacity = [], {}, 0
+            self._resize( 256 )
+        else:
+            self.matrix = np.memmap( self.vectors_path, dtype=np.float32, mode="r+", shape=( self.capacity, self.dim ) )
+
+    def _resize(self, capacity: int):
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open( self.vectors_path, "ab" ) as f:
+            f.truncate( capacity * self.dim * 4 )
+        self.capacity = capacity
+        self.matrix = np.memmap( self.vectors_path, dtype=np.float32, mode="r+", shape=( capacity, self.dim ) )
+
+    def _save_meta(self):
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.matrix.flush()
+        tmp = self.meta_path + ".tmp"
+        with open( tmp, "w", encoding="utf-8" ) as f:
+            # dumps() runs the C encoder; dump() streams through the pure-Python one (~5x slower here)
+            f.write( json.dumps( {"embedder": self.embedder.name, "dim": self.dim, "capacity": self.capacity,
+                                  "rows": self.rows, "files": self.files} ) )
+        os.replace( tmp, self.meta_path )
+
+    # --- updates -----------------------------------------------------------------------------
+
+    def notes(self):
+        return note_files( self.directory )
+
+    def sync(self) -> int:
+        """
+        Brings the whole directory up to date (startup). Returns how many chunks were embedded.
+        """
+        embedded = 0
+        present = set()
+        with self._update_lock:
+            for name in self.notes():
+                present.add( name )
+                embedded += self._update( name )
+            with self._lock:
+                for name in [n for n in self.files if n not in present]:
+                    self._drop_rows( name, 0 )
+                    del self.files[name]
+                self._save_meta()
+        return embedded
+
+    def update(self, *filenames: str) -> int:
+        """
+        Re-indexes what changed in the given notes. Appends only re-embed the tail; anything else the whole file.
+        Returns the chunks embedded.
+
+        meta.json is rewritten at most every META_SAVE_S (and on close): if the process dies in between,
+        the older metadata still describes the rows it lists, and sync() re-embeds what it is missing.
+        """
+        with self._update_lock:
+            embedded = sum( self._update( name ) for name in filenames )
+            if self._dirty and time.monotonic() - self._saved_at >= self.META_SAVE_S:
+                with self._lock:
+                    self._save_meta()
+        return embedded
+
+    def schedule(self, filenames: List[str]):
+        """
+        Storage.on_saved hook (event loop): re-indexes the saved notes in a worker thread.
+        """
+        task = asyncio.create_task( asyncio.to_thread( self.update, *filenames ) )
+        self._pending.add( task )
+        task.add_done_callback( self._pending.discard )
+
+    def _update(self, filename: str) -> int:
+        path = os.path.join( self.directory, filename )
+        try:
+            st = os.stat( path )
+        except FileNotFoundError:
+            return 0
+        known = self.files.get( filename )
+        if known and known["size"] == st.st_size and known["mtime"] == st.st_mtime:
+            return 0
+        # Grew since last time: re-chunk from the start of the last chunk (the append may continue it)
+        start = known["tail"] if known and st.st_size > known["size"] else 0
+        with open( path, "rb" ) as f:
+            f.seek( start )
+            text = f.read().decode( "utf-8", errors="replace" )
+
+        chunks = []
+        for offset, heading, body in chunk_markdown( text, start ):
+            for piece in range( 0, len( body ), self.max_chunk_chars ):
+                chunks.append( ( offset, heading, body[piece:piece + self.max_chunk_chars] ) )
+        vectors = self.embedder.embed( [f"{heading}\n{body}" if heading else body for _, heading, body in chunks] ) if chunks else None
+
+        with self._lock:
+            capacity = self.capacity
+            self._drop_rows( filename, start )
+            first = len( self.rows )
+            if chunks:
+                while len( self.rows ) + len( chunks ) > self.capacity:
+                    self._resize( self.capacity * 2 )
+                self.matrix[first:first + len( chunks )] = vectors
+                for offset, heading, body in chunks:
+                    self.rows.append( {"file": filename, "offset": offset, "heading": heading, "text": body} )
+            self.files[filename] = {"size": st.st_size, "mtime": st.st_mtime,
+                                    "tail": chunks[-1][0] if chunks else start}
+            self._dirty = True
+            if self._maybe_compact() or self.capacity != capacity:
+                # Rows moved or the matrix file grew: metadata from before would not match it any more
+                self._save_meta()
+        self.stats["embedded"] += len( chunks )
+        return len( chunks )
+
+    def _drop_rows(self, filename: str, from_offset: int):
+        for i, row in enumerate( self.rows ):
+            if row is not None and row["file"] == filename and row["offset"] >= from_offset:
+                self.rows[i] = None
+                self.matrix[i] = 0.0
+
+    def _maybe_compact(self):
+        dead = sum( 1 for row in self.rows if row is None )
+        if dead < 64 or dead * 2 < len( self.rows ):
+            return False
+        live = [i for i, row in enumerate( self.rows ) if row is not None]
+        self.matrix[:len( live )] = self.matrix[live]
+        self.matrix[len( live ):len( self.rows )] = 0.0
+        self.rows = [self.rows[i] for i in live]
+        self.stats["compactions"] += 1
+        return True
+
+    # --- queries -----------------------------------------------------------------------------
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.1, exclude_file: Optional[str] = None) -> List[dict]:
+        """
+        Top-k chunks by cosine similarity: [{"score", "file", "heading", "text"}], best first.
+        """
+        if not query.strip():
+            return []
+        start = time.perf_counter()
+        vector = self.embedder.embed( [query] )[0]
+        with self._lock:
+            count = len( self.rows )
+            if not count or self.matrix is None:
+                return []
+            scores = self.matrix[:count] @ vector
+            best = np.argsort( -scores )[:k * 3]
+            hits = []
+            for i in best:
+                row = self.rows[i]
+                if row is None or scores[i] < min_score or row["file"] == exclude_file:
+                    continue
+                hits.append( dict( row, score=float( scores[i] ) ) )
+                if len( hits ) == k:
+                    break
+        self.stats["searches"] += 1
+        self.stats["last_search_ms"] = round( ( time.perf_counter() - start ) * 1000, 2 )
+        return hits
+
+    async def aclose(self):
+        """
+        Finishes pending re-indexing and saves the index.
+        """
+        if self._pending:
+            await asyncio.gather( *self._pending, return_exceptions=True )
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self.matrix is not None:
+                if self._dirty:
+                    self._save_meta()
+                self.matrix = None
+
+def format_notes(hits: List[dict], max_chars: int = 400) -> str:
+    """
+    Retrieved chunks as a compact block for the prompt.
+    """
+    lines = []
+    for hit in hits:
+        text = " ".join( hit["text"].split() )
+        if len( text ) > max_chars:
+            text = text[:max_chars].rsplit( " ", 1 )[0] + "..."
+        where = hit["file"] + ( f" > {hit['heading']}" if hit["heading"] else "" )
+        lines.append( f"- [{where}] {text}" )
+    return "\n".join( lines )
@@ -0,0 +1,216 @@
+import json
+import os
+import time
+import zlib
+from typing import List, Optional
+from modules.storage import Journal
+
+try:
+    import msgpack
+except ImportError:
+    # Optional: pip install msgpack for smaller, faster session files (JSON otherwise)
+    msgpack = None
+
+def encode(obj) -> bytes:
+    if msgpack is not None:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode(payload: bytes):
+    # A JSON record starts with "{", which msgpack would read as a lone integer, never as a record
+    if payload[:1] == b"{":
+        return json.loads(payload)
+    if msgpack is None:
+        raise ValueError("session saved with msgpack, which is not installed")
+    return msgpack.unpackb(payload, raw=False)
+
+class DeltaLog(Journal):
+    """
+    The capture journal's framing (length, crc32, torn tail cut off on open) around msgpack deltas.
+    """
+    LABEL = "[SESSION] Delta log"
+    encode = staticmethod(encode)
+    decode = staticmethod(decode)
+
+    def truncate(self):
+        self._file.truncate(0)
+
+def apply_delta(state: dict, delta: dict) -> dict:
+    messages = state.get("messages", [])[delta["drop"]:]
+    state["messages"] = messages[:delta["keep"]] + delta["append"]
+    state.update(delta["set"])
+    return state
+
+class SessionStore:
+    """
+    Saved conversations in `directory` (brain/.sessions), so `--resume` picks up where the last run stopped.
+
+    A session is a snapshot (<id>.snap, the whole state) plus a log of per-turn deltas (<id>.log):
+    how many messages left the front of the window (state["evicted"] is the running count), how
+    many of the rest are unchanged, the new tail, and any other field that changed. A turn appends
+    one small record (flushed, not fsynced: a power cut costs at most the last turn). Every
+    `snapshot_every` turns (SESSION_SNAPSHOT_TURNS, default 20) and on close the state is rewritten
+    as a snapshot and the log restarts, so loading is one snapshot plus at most that many deltas.
+    """
+    def __init__(self, directory: str = "brain/.sessions", snapshot_every: Optional[int] = None, keep: int = 10):
+        self.directory = directory
+        # Snapshot cadence: Arg > Env > Default(20 turns)
+        if snapshot_every is None:
+            try:
+                snapshot_every = int(os.getenv("SESSION_SNAPSHOT_TURNS", "20"))
+            except ValueError:
+                snapshot_every = 20
+        self.snapshot_every = max(1, snapshot_every)
+        self.keep = keep
+        self.session_id = None
+        self._log = None
+        self._last = None
+        self._deltas = 0
+
+    def _path(self, session_id: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.{ext}")
+
+    def sessions(self) -> List[str]:
+        """
+        Saved session ids, least recently used first.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = {os.path.splitext(name)[0] for name in names if name.endswith((".snap", ".log"))}
+        def used(session_id):
+            return max((os.path.getmtime(self._path(session_id, ext)) for ext in ("snap", "log")
+                        if os.path.exists(self._path(session_id, ext))), default=0)
+        return sorted(ids, key=used)
+
+    # --- open --------------------------------------------------------------------------------
+
+    def start(self) -> str:
+        """
+        Begins a new session (and drops the oldest beyond `keep`).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        session_id = time.strftime("%Y%m%d-%H%M%S")
+        while os.path.exists(self._path(session_id, "log")):
+            session_id += "a"
+        ids = self.sessions()
+        for old in ids[:max(0, len(ids) - self.keep + 1)]:
+            for ext in ("snap", "log"):
+                if os.path.exists(self._path(old, ext)):
+                    os.remove(self._path(old, ext))
+        self._open(session_id, {"messages": []}, 0)
+        return session_id
+
+    def resume(self, session_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Loads a session (the most recent one by default) and keeps recording into it.
+        Returns its state, or None if there is nothing to resume.
+        """
+        if session_id is None:
+            ids = self.sessions()
+            if not ids:
+                return None
+            session_id = ids[-1]
+        start = time.perf_counter()
+        try:
+            snapshots, _, _ = DeltaLog.read(self._path(session_id, "snap"))
+            deltas, _, _ = DeltaLog.read(self._path(session_id, "log"))
+        except ValueError as e:
+            print(f"[SESSION] Can't load {session_id}: {e}")
+            return None
+        if not snapshots and not deltas:
+            return None
+        state = snapshots[0]["state"] if snapshots else {"messages": []}
+        seq = snapshots[0]["seq"] if snapshots else 0
+        # Deltas up to the snapshot's seq are already in it (a crash between the two writes leaves them behind)
+        applied = 0
+        for delta in deltas:
+            if delta["seq"] > seq:
+                apply_delta(state, delta)
+                seq = delta["seq"]
+                applied += 1
+        self._open(session_id, state, seq)
+        self._deltas = applied
+        print(f"[SESSION] Resumed {session_id}: {len(state['messages'])} messages, turn {state.get('turn', 0)}, "
+              f"{applied} deltas replayed in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return state
+
+    def _open(self, session_id: str, state: dict, seq: int):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.session_id = session_id
+        self._log = DeltaLog(self._path(session_id, "log"), sync=False)
+        self._log.open()
+        # Numbering continues past the snapshot even though the log restarted after it
+        self._log.seq = max(self._log.seq, seq)
+        self._last = state
+        self._deltas = 0
+
+    # --- record ------------------------------------------------------------------------------
+
+    def diff(self, state: dict) -> dict:
+        """
+        What changed since the last recorded state, as a delta for apply_delta().
+        """
+        last = self._last
+        drop = min(max(0, state.get("evicted", 0) - last.get("evicted", 0)), len(last["messages"]))
+        old, new = last["messages"][drop:], state["messages"]
+        keep = 0
+        while keep < len(old) and keep < len(new) and old[keep] == new[keep]:
+            keep += 1
+        changed = {key: value for key, value in state.items() if key != "messages" and last.get(key) != value}
+        return {"drop": drop, "keep": keep, "append": new[keep:], "set": changed}
+
+    def record(self, state: dict):
+        """
+        Appends the turn's delta; every snapshot_every deltas the log is folded into a new snapshot.
+        state must be a fresh copy (it is kept to diff the next turn against).
+        """
+        if self._log is None:
+            return
+        delta = self.diff(state)
+        if delta["drop"] or delta["append"] or delta["set"] or delta["keep"] < len(self._last["messages"]):
+            self._log.append([delta])
+            self._deltas += 1
+        self._last = state
+        if self._deltas >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self, state: Optional[dict] = None):
+        """
+        Writes the whole state (atomically) and restarts the delta log.
+        """
+        if self._log is None:
+            return
+        if state is not None:
+            self._last = state
+        # seq says which deltas the snapshot already contains
+        payload = encode({"seq": self._log.seq, "state": self._last})
+        path = self._path(self.session_id, "snap")
+        with open(path + ".tmp", "wb") as f:
+            f.write(DeltaLog.HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._log.truncate()
+        self._deltas = 0
+
+    def close(self, state: Optional[dict] = None):
+        """
+        Snapshots the final state (if given) and closes the log. A session nothing was said in is
+        removed, so it doesn't shadow the previous one for --resume.
+        """
+        if self._log is None:
+            return
+        if state is not None:
+            self._last = state
+        empty = not self._last.get("messages") and not self._last.get("summary") and not self._last.get("pending")
+        if not empty and (state is not None or self._deltas):
+            self.snapshot()
+        self._log.close()
+        self._log = None
+        if empty:
+            for ext in ("snap", "log"):
+                if os.path.exists(self._path(self.session_id, ext)):
+                    os.remove(self._path(self.session_id, ext))
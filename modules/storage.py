@@ -1,22 +1,598 @@
-import aiofiles
 import asyncio
+import collections
+import json
 import os
+import struct
+import sys
+import time
+import zlib
+from typing import Dict, List, Optional
+
+_STOP = object()
+
+def _measure(path: str, start: int = 0, crc: int = 0):
+    """
+    (size, crc32) of a file; with start/crc, continues a crc already taken over its first `start` bytes.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            for block in iter(lambda: f.read(1 << 16), b""):
+                crc = zlib.crc32(block, crc)
+                start += len(block)
+    except FileNotFoundError:
+        return 0, 0
+    return start, crc
+
+def _matches(path: str, size: int, crc: Optional[int]) -> bool:
+    """
+    True if the file still starts with what the checkpoint recorded: at least `size` bytes, the first
+    `size` hashing to `crc` (None: a checkpoint from before crcs were kept, size alone).
+    """
+    if not os.path.exists(path):
+        return size == 0
+    if os.path.getsize(path) < size:
+        return False
+    if crc is None:
+        return True
+    computed = 0
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining:
+            block = f.read(min(1 << 16, remaining))
+            if not block:
+                return False
+            computed = zlib.crc32(block, computed)
+            remaining -= len(block)
+    return computed == crc
+
+def _missing(path: str, records: List[dict]) -> List[dict]:
+    """
+    The records (in seq order) the file doesn't hold yet, merging the journal into a file it can't roll
+    back: the longest run of leading records the file ends with is already there, the rest is not.
+    Positional rather than by content, so a line the user captures twice is kept twice.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return records
+    chunks = [(r["content"] + "\n").encode("utf-8", "replace") for r in records]
+    joined = b"".join(chunks)
+    end = len(joined)
+    for held in range(len(records), 0, -1):
+        if data.endswith(joined[:end]):
+            return records[held:]
+        end -= len(chunks[held - 1])
+    return records
+
+class Journal:
+    """
+    Append-only write-ahead log of captures.
+
+    Each record is [u32 length][u32 crc32 of payload][payload: UTF-8 JSON], the payload carrying
+    seq, ts, file, mode, content and whatever metadata the caller attached (turn, provider).
+    append() writes a whole batch with one write() and one fsync (group commit). Reading stops
+    at the first short or corrupt record: that is where a crash tore the tail, and open() cuts it off.
+    """
+    HEADER = struct.Struct("<II")
+    LABEL = "[STORAGE] Journal"
+
+    def __init__(self, path: str, sync: bool = True):
+        self.path = path
+        self.sync = sync
+        self.seq = 0
+        self._file = None
+
+    @staticmethod
+    def encode(record: dict) -> bytes:
+        # A lone surrogate (broken ASR text) becomes "?", as in the view, instead of failing the batch
+        return json.dumps(record, ensure_ascii=False).encode("utf-8", "replace")
+
+    @staticmethod
+    def decode(payload: bytes) -> dict:
+        return json.loads(payload)
+
+    @classmethod
+    def read(cls, path: str):
+        """
+        Returns (records, valid_bytes, total_bytes).
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0, 0
+        records = []
+        offset = 0
+        while offset + cls.HEADER.size <= len(data):
+            length, crc = cls.HEADER.unpack_from(data, offset)
+            start = offset + cls.HEADER.size
+            end = start + length
+            if end > len(data) or zlib.crc32(data[start:end]) != crc:
+                break
+            try:
+                records.append(cls.decode(data[start:end]))
+            except ValueError:
+                break
+            offset = end
+        return records, offset, len(data)
+
+    def open(self) -> List[dict]:
+        """
+        Recovers the log (dropping a torn tail) and opens it for appending. Returns every record.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        records, valid, total = self.read(self.path)
+        if valid < total:
+            print(f"{self.LABEL}: dropping {total - valid} bytes of torn or corrupt tail")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+        self.seq = records[-1]["seq"] if records else 0
+        self._file = open(self.path, "ab")
+        return records
+
+    def append(self, entries: List[dict]) -> List[dict]:
+        """
+        Numbers and commits a batch of records. Either the whole batch is written or none of it.
+        """
+        records = []
+        buf = bytearray()
+        seq = self.seq
+        for entry in entries:
+            seq += 1
+            record = dict(entry, seq=seq)
+            payload = self.encode(record)
+            buf += self.HEADER.pack(len(payload), zlib.crc32(payload))
+            buf += payload
+            records.append(record)
+        start = self._file.tell()
+        try:
+            self._file.write(buf)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+        except Exception:
+            # Don't leave half a batch behind for the next append to build on
+            self._file.truncate(start)
+            raise
+        self.seq = seq
+        return records
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
 class Storage:
-    def __init__(self, base_path: str = "."):
+    """
+    Write-behind file store ("Queue B (Disk IO)" in ARCHITECTURE.md).
+
+    submit() only enqueues; a single writer task owns every file, so writes to one file land in
+    the order they were submitted and never interleave. Each pass takes everything queued so far
+    and does the blocking IO in a worker thread with one cached handle per file (at most
+    `max_open`, least recently used closed first).
+
+    With the journal on (default), a pass is first committed to base_path/.journal/journal.log
+    (one write + one fsync for the whole batch) and only then applied to the markdown files,
+    which become views of the journal: they are fsynced and checkpointed every `fsync_interval`
+    seconds, and on startup anything after the last checkpoint is replayed, so a crash can
+    neither lose a committed capture nor leave a torn markdown file behind. rebuild() regenerates
+    the views from the journal, on top of what each file held before its first journaled write.
+    A view that no longer matches its checkpoint (edited by hand, checkpoint lost) is never cut
+    back: it is kept and only the captures it doesn't end with yet are appended.
+
+    Without the journal, writes are flushed to the OS right away and fsync follows
+    `fsync_interval` (seconds, 0 = after every batch, negative = leave it to the OS).
+    close() drains the queue before returning.
+    """
+    def __init__(self, base_path: str = ".", fsync_interval: Optional[float] = None, max_open: int = 16, max_batch: int = 256,
+                 journal: Optional[bool] = None, on_saved=None):
         self.base_path = base_path
+        # on_saved(filenames) is called on the event loop after each batch lands in the files (e.g. re-indexing)
+        self.on_saved = on_saved
+        # fsync cadence: Arg > Env > Default(1s)
+        if fsync_interval is None:
+            try:
+                fsync_interval = float(os.getenv("STORAGE_FSYNC_S", "1.0"))
+            except ValueError:
+                fsync_interval = 1.0
+        self.fsync_interval = fsync_interval
+        self.max_open = max_open
+        self.max_batch = max_batch
+        self.stats = {"saves": 0, "batches": 0, "writes": 0, "fsyncs": 0, "errors": 0, "replayed": 0}
+
+        # Write-ahead journal: Arg > Env > Default(on)
+        if journal is None:
+            journal = os.getenv("STORAGE_JOURNAL", "1").lower() not in ("0", "false", "no")
+        journal_dir = os.path.join(base_path, ".journal")
+        self.journal = Journal(os.path.join(journal_dir, "journal.log"), sync=fsync_interval >= 0) if journal else None
+        self.checkpoint_path = os.path.join(journal_dir, "views.json")
+        # Last persisted checkpoint: every record up to "seq" is in the views. Per file: "size" and "crc"
+        # (crc32) of the view at that point, "base" and "base_crc" of what it held before the journal
+        self._checkpoint = {"seq": 0, "files": {}}
+        self._applied = 0
+        self._stale = set()
+        self._rewritten = set()  # views replaced (mode "w") since the last checkpoint: their crc starts over
+
+        self._queue = None
+        self._writer = None
+        self._files = collections.OrderedDict()  # path -> open handle, LRU order
+        self._dirty = set()
+        self._last_fsync = time.monotonic()
+
+    def _ensure_writer(self):
+        if self._writer is None or self._writer.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def submit(self, filename: str, content: str, mode: str = "a", meta: Optional[Dict] = None) -> asyncio.Future:
+        """
+        Queues content (plus a newline) for filename and returns right away.
+        mode "a" appends, "w" replaces the file; meta (e.g. turn, provider) is kept in the journal.
+        The returned future resolves to True once the write is committed (journal) or reached the OS
+        (no journal), False if it failed; nobody has to await it.
+        """
+        self._ensure_writer()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((filename, content, mode, meta, future))
+        self.stats["saves"] += 1
+        return future
+
+    async def save(self, filename: str, content: str, mode: str = "a", meta: Optional[Dict] = None) -> bool:
+        """
+        Asynchronously writes content to a file (submit() and wait for it).
+        """
+        return await self.submit(filename, content, mode, meta)
+
+    def _control(self, mode: str) -> asyncio.Future:
+        # A no-content entry, handled by the writer once everything queued before it is written
+        self._ensure_writer()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((None, None, mode, None, future))
+        return future
 
-    async def save(self, filename: str, content: str, mode: str = "a"):
+    async def open(self):
         """
-        Asynchronously writes content to a file.
+        Starts the writer now, journal recovery included, rather than on the first save.
         """
+        await self._control("sync")
+
+    async def flush(self):
+        """
+        Waits until everything submitted so far is written and fsynced.
+        """
+        if self._writer is None or self._writer.done():
+            return
+        await self._control("sync")
+
+    async def close(self):
+        """
+        Drains the queue, fsyncs and closes every file. Safe to call more than once.
+        """
+        if self._writer is not None and not self._writer.done():
+            self._queue.put_nowait(_STOP)
+            await asyncio.shield(self._writer)
+        self._writer = None
+        await asyncio.to_thread(self._close_files)
+
+    async def rebuild(self):
+        """
+        Regenerates every journaled markdown file from the journal alone.
+        """
+        if self.journal is None:
+            raise ValueError("rebuild() needs the journal (STORAGE_JOURNAL).")
+        await self._control("rebuild")
+
+    async def _write_loop(self):
+        if self.journal is not None and self.journal._file is None:
+            try:
+                await asyncio.to_thread(self._recover)
+            except Exception as e:
+                # Writing on top of an unrecovered journal could lose captures: fail what is queued,
+                # the next submit() starts a writer that tries again
+                print(f"[STORAGE] Journal recovery failed: {type(e).__name__}: {e}")
+                self.journal.close()
+                self.stats["errors"] += 1
+                while not self._queue.empty():
+                    entry = self._queue.get_nowait()
+                    if entry is not _STOP and not entry[4].done():
+                        entry[4].set_result(False)
+                return
+        while True:
+            timeout = None
+            if self._dirty and self.fsync_interval > 0:
+                timeout = max(0.0, self._last_fsync + self.fsync_interval - time.monotonic())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # Idle with unsynced data: sync it now
+                await asyncio.to_thread(self._fsync)
+                continue
+
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stop = any(entry is _STOP for entry in batch)
+            entries = [entry for entry in batch if entry is not _STOP]
+
+            try:
+                failed = await asyncio.to_thread(self._write_batch, entries)
+                self.stats["batches"] += 1
+                if any(mode == "rebuild" for _, _, mode, _, _ in entries):
+                    await asyncio.to_thread(self._rebuild)
+                force = stop or any(mode == "sync" for _, _, mode, _, _ in entries)
+                if self._dirty and (force or 0 <= self.fsync_interval <= time.monotonic() - self._last_fsync):
+                    await asyncio.to_thread(self._fsync)
+            except Exception as e:
+                # Whatever went wrong, nobody waits forever on this batch and the writer keeps going
+                print(f"[STORAGE] Batch failed: {type(e).__name__}: {e}")
+                failed = {filename for filename, _, _, _, _ in entries if filename is not None}
+                if self.journal is not None:
+                    # Unknown how far the batch got: keep the checkpoint back, the next start replays it
+                    self._stale |= failed
+                for _, _, _, _, future in entries:
+                    if not future.done():
+                        future.set_result(False)
+                if not failed:
+                    self.stats["errors"] += 1
+
+            saved = []
+            for filename, _, mode, _, future in entries:
+                if filename is not None:
+                    if filename in failed:
+                        self.stats["errors"] += 1
+                    elif filename not in saved:
+                        saved.append(filename)
+                if not future.done():
+                    future.set_result(filename not in failed)
+            for filename in saved:
+                print(f"Saved content to {filename}")
+            if saved and self.on_saved:
+                try:
+                    self.on_saved(saved)
+                except Exception as e:
+                    print(f"[STORAGE] on_saved failed: {e}")
+            if stop:
+                return
+
+    def _write_batch(self, entries) -> set:
+        """
+        Worker thread: commits the batch to the journal, then applies it to the files.
+        Returns the filenames whose write failed.
+        """
+        records = []
+        for filename, content, mode, meta, _ in entries:
+            if filename is None:
+                continue
+            record = {"ts": round(time.time(), 3), "file": filename, "mode": mode, "content": content}
+            if meta:
+                record.update(meta)
+            records.append(record)
+        if not records:
+            return set()
+
+        if self.journal is None:
+            return self._apply(records)
+        try:
+            records = self.journal.append(records)
+        except Exception as e:
+            print(f"[STORAGE] Journal write failed: {type(e).__name__}: {e}")
+            return {record["file"] for record in records}
+        failed = self._apply(records)
+        # Committed either way; a view that failed to update is repaired from the journal on the next start
+        self._stale |= failed
+        self._applied = records[-1]["seq"]
+        return set()
+
+    def _apply(self, records: List[dict]) -> set:
+        """
+        One write per file for the whole batch, in order per file. Returns the files that failed.
+        """
+        plan: Dict[str, dict] = {}
+        for record in records:
+            filename = record["file"]
+            chunk = plan.setdefault(filename, {"truncate": False, "parts": []})
+            if record.get("mode") == "w":
+                # Replacing the file: whatever was queued for it before no longer matters
+                chunk["truncate"] = True
+                chunk["parts"] = []
+                self._rewritten.add(filename)
+            chunk["parts"].append(record["content"] + "\n")
+
+        failed = set()
+        for filename, chunk in plan.items():
+            try:
+                handle = self._handle(filename, chunk["truncate"])
+                handle.write("".join(chunk["parts"]))
+                handle.flush()
+                self._dirty.add(filename)
+                self.stats["writes"] += 1
+            except Exception as e:
+                print(f"[STORAGE] Write to {filename} failed: {type(e).__name__}: {e}")
+                self._drop(filename)
+                failed.add(filename)
+        return failed
+
+    def _handle(self, filename: str, truncate: bool = False):
+        handle = self._files.get(filename)
+        if handle is not None and not truncate:
+            self._files.move_to_end(filename)
+            return handle
+        if handle is not None:
+            self._drop(filename)
+
         filepath = os.path.join(self.base_path, filename)
         # Ensure directory exists if filename contains path separators
         dir_name = os.path.dirname(filepath)
         if dir_name:
             os.makedirs(dir_name, exist_ok=True)
-            
-        async with aiofiles.open(filepath, mode=mode) as f:
-            await f.write(content + "\n")
-            
-        print(f"Saved content to {filename}")
+        if self.journal is not None and filename not in self._checkpoint["files"]:
+            # First journaled write to this file: remember what was there before (replay starts from it)
+            size, crc = _measure(filepath)
+            self._checkpoint["files"][filename] = {"base": size, "base_crc": crc, "size": size, "crc": crc}
+            self._save_checkpoint(self._checkpoint)
+        # A truncating handle keeps appending to the fresh file afterwards
+        handle = open(filepath, "w" if truncate else "a", encoding="utf-8", errors="replace")
+        self._files[filename] = handle
+        while len(self._files) > self.max_open:
+            oldest = next(iter(self._files))
+            self._drop(oldest)
+        return handle
+
+    def _drop(self, filename: str):
+        handle = self._files.pop(filename, None)
+        if handle is None:
+            return
+        try:
+            if filename in self._dirty and self.fsync_interval >= 0:
+                os.fsync(handle.fileno())
+            handle.close()
+        except OSError as e:
+            print(f"[STORAGE] Closing {filename} failed: {e}")
+        self._dirty.discard(filename)
+
+    def _fsync(self):
+        if self.fsync_interval >= 0:
+            for filename in list(self._dirty):
+                handle = self._files.get(filename)
+                try:
+                    if handle is not None:
+                        os.fsync(handle.fileno())
+                        self.stats["fsyncs"] += 1
+                except OSError as e:
+                    print(f"[STORAGE] fsync of {filename} failed: {e}")
+        self._dirty.clear()
+        self._last_fsync = time.monotonic()
+        self._advance_checkpoint()
+
+    def _advance_checkpoint(self, force: bool = False):
+        """
+        Records that the views now hold everything up to the last applied record.
+        """
+        if self.journal is None or self._stale or (self._applied <= self._checkpoint["seq"] and not force):
+            return
+        files = {}
+        for filename, entry in self._checkpoint["files"].items():
+            path = os.path.join(self.base_path, filename)
+            if filename in self._rewritten or entry.get("crc") is None:
+                size, crc = _measure(path)
+            else:
+                # Views only grow between rewrites: extend the crc over the new bytes instead of rereading the file
+                size, crc = _measure(path, entry["size"], entry["crc"])
+            files[filename] = dict(entry, size=size, crc=crc)
+        self._rewritten.clear()
+        self._save_checkpoint({"seq": self._applied, "files": files})
+
+    def _save_checkpoint(self, checkpoint: dict):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            if self.fsync_interval >= 0:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        self._checkpoint = checkpoint
+
+    def _recover(self):
+        """
+        Startup: opens the journal and replays whatever the views missed since the last checkpoint.
+        """
+        records = self.journal.open()
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                self._checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            self._checkpoint = {"seq": 0, "files": {}}
+            if records:
+                # Nothing says how far the views got: merge the journal into them without cutting anything
+                print(f"[STORAGE] No usable checkpoint ({e}), merging the journal into the views")
+                self._replay(records, trusted=False)
+            return
+        # Checkpoints before baselines were recorded kept just a size per file
+        self._checkpoint["files"] = {name: entry if isinstance(entry, dict) else {"size": entry}
+                                     for name, entry in self._checkpoint["files"].items()}
+        self._applied = self._checkpoint["seq"]
+        pending = [r for r in records if r["seq"] > self._checkpoint["seq"]]
+        if pending:
+            self._replay(pending)
+
+    def _rebuild(self):
+        records, _, _ = Journal.read(self.journal.path)
+        self._replay(records, rebuild=True)
+
+    def _replay(self, records: List[dict], rebuild: bool = False, trusted: bool = True):
+        """
+        Rolls each affected view back to a state the checkpoint vouches for (its checkpointed size, or
+        for a rebuild its pre-journal baseline), verified by crc, and re-applies the records. A view
+        that doesn't match (edited by hand, or not trusted: no checkpoint) is kept as it is and only
+        gets the records it doesn't end with yet (_missing). A view is never extended by truncate().
+        """
+        by_file = {}
+        for record in records:
+            by_file.setdefault(record["file"], []).append(record)
+        apply = []
+        for filename, pending in by_file.items():
+            self._drop(filename)
+            path = os.path.join(self.base_path, filename)
+            entry = self._checkpoint["files"].get(filename)
+            rewrites = [i for i, record in enumerate(pending) if record.get("mode") == "w"]
+            if rewrites and (rebuild or not trusted):
+                # The last rewrite defines the file by itself, whatever was there before
+                pending = pending[rewrites[-1]:]
+                self._rewritten.add(filename)
+            elif trusted and entry is None:
+                # Crashed before its first write got that far: the file is as we found it
+                size, crc = _measure(path)
+                self._checkpoint["files"][filename] = {"base": size, "base_crc": crc, "size": size, "crc": crc}
+            else:
+                size, crc = None, None
+                if entry is not None and trusted:
+                    size, crc = (entry.get("base"), entry.get("base_crc")) if rebuild else (entry.get("size"), entry.get("crc"))
+                if size is not None and _matches(path, size, crc):
+                    if os.path.exists(path):
+                        with open(path, "r+b") as f:
+                            f.truncate(size)
+                    self._checkpoint["files"][filename] = dict(entry, size=size, crc=crc)
+                else:
+                    if trusted:
+                        print(f"[STORAGE] {filename} doesn't match its checkpoint (edited by hand?): "
+                              f"keeping it, appending only the captures it doesn't end with")
+                    pending = _missing(path, pending)
+                    self._rewritten.add(filename)
+            if filename not in self._checkpoint["files"]:
+                # What the file held before the journal is unknown: a later rebuild merges instead of rolling back
+                self._checkpoint["files"][filename] = {"base": None, "base_crc": None, "size": 0, "crc": None}
+            apply += pending
+        self._stale.clear()
+        apply.sort(key=lambda r: r["seq"])
+        failed = self._apply(apply)
+        self._stale |= failed
+        if records:
+            self._applied = max(self._applied, records[-1]["seq"])
+        self.stats["replayed"] += len(apply)
+        print(f"[STORAGE] Replayed {len(apply)} journal records into {len({r['file'] for r in apply})} files")
+        self._fsync()
+        self._advance_checkpoint(force=True)
+
+    def _close_files(self):
+        self._fsync()
+        for filename in list(self._files):
+            self._drop(filename)
+        if self.journal is not None:
+            self.journal.close()
+
+if __name__ == "__main__":
+    # python -m modules.storage [base_path] [--rebuild]
+    async def main():
+        base_path = next((a for a in sys.argv[1:] if not a.startswith("--")), "brain")
+        storage = Storage(base_path)
+        records, valid, total = Journal.read(storage.journal.path)
+        print(f"{storage.journal.path}: {len(records)} records, {valid} bytes" + (f" ({total - valid} torn)" if valid < total else ""))
+        if "--rebuild" in sys.argv:
+            await storage.rebuild()
+        await storage.close()
+
+    asyncio.run(main())
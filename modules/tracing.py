@@ -0,0 +1,178 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+from modules.metrics import LatencyHistogram
+
+# Stage marks of one turn, in the order they normally happen (time.perf_counter() seconds)
+STAGES = (
+    "speech_end",       # last voiced frame (VAD), estimated from the endpoint minus the trailing silence
+    "endpoint",         # VAD closed the utterance
+    "transcript",       # ASR returned the text
+    "llm_request",      # prompt sent (after waiting for the previous turn)
+    "llm_first_token",
+    "llm_done",
+    "tts_first_text",   # first sentence handed to TTS
+    "tts_socket",       # TTS websocket acquired (warm from the pool, or a fresh handshake)
+    "tts_first_byte",   # first audio back from ElevenLabs (or the audio cache)
+    "audio_out",        # first audio written to the output device
+    "playback_done",
+    "saved",            # capture written to brain/
+)
+
+# Summarized on exit: name -> (from stage, to stage)
+INTERVALS = {
+    "endpointing": ( "speech_end", "endpoint" ),
+    "asr": ( "endpoint", "transcript" ),
+    "queued": ( "transcript", "llm_request" ),
+    "llm_first_token": ( "llm_request", "llm_first_token" ),
+    "llm_total": ( "llm_request", "llm_done" ),
+    "tts_socket": ( "tts_first_text", "tts_socket" ),
+    "tts_first_byte": ( "tts_first_text", "tts_first_byte" ),
+    "response": ( "speech_end", "audio_out" ),
+    "playback": ( "audio_out", "playback_done" ),
+    "save": ( "llm_done", "saved" ),
+    "turn": ( "speech_end", "playback_done" ),
+}
+
+class TurnTrace:
+    """
+    Timestamps of one turn. mark() keeps the first time a stage is reached; the record is written
+    once the turn has ended and every watched future (e.g. the write-behind capture) has completed.
+    """
+    def __init__(self, tracer, turn_id: int, text: str):
+        self.tracer = tracer
+        self.id = turn_id
+        self.text = text
+        self.marks: Dict[str, float] = {}
+        self.fields = {}
+        self._open = 1
+        self._written = False
+
+    def mark(self, stage: str, at: Optional[float] = None):
+        if stage not in self.marks:
+            self.marks[stage] = time.perf_counter() if at is None else at
+
+    def set(self, **fields):
+        self.fields.update( fields )
+
+    def watch(self, future, stage: str):
+        """
+        Marks stage when future completes; the trace waits for it before being written.
+        """
+        self._open += 1
+        def done(f):
+            if not f.cancelled() and f.exception() is None:
+                self.mark( stage )
+            self._release()
+        future.add_done_callback( done )
+
+    async def stream(self, chunks, first: str, last: str):
+        """
+        Passes an async iterator through, marking its first item and its end.
+        """
+        async for chunk in chunks:
+            self.mark( first )
+            yield chunk
+        self.mark( last )
+
+    def end(self, status: str = "ok"):
+        self.fields.setdefault( "status", status )
+        self._release()
+
+    def _release(self):
+        self._open -= 1
+        if self._open == 0 and not self._written:
+            self._written = True
+            self.tracer.record( self )
+
+    def intervals(self) -> Dict[str, float]:
+        return {name: self.marks[b] - self.marks[a] for name, ( a, b ) in INTERVALS.items()
+                if a in self.marks and b in self.marks and self.marks[b] >= self.marks[a]}
+
+    def to_dict(self) -> dict:
+        origin = min( self.marks.values() ) if self.marks else 0.0
+        return {
+            "turn": self.id,
+            "text": self.text[:120],
+            # Relative to the turn's first mark; wall-clock time of that mark for lining up with other logs
+            "ts": round( time.time() - ( time.perf_counter() - origin ), 3 ),
+            "marks_ms": {stage: round( ( t - origin ) * 1000, 1 ) for stage, t in sorted( self.marks.items(), key=lambda item: item[1] )},
+            "intervals_ms": {name: round( s * 1000, 1 ) for name, s in self.intervals().items()},
+            **self.fields,
+        }
+
+class Tracer:
+    """
+    Per-turn latency tracing: one TurnTrace per user utterance, written as a JSON line to `path`
+    (TRACE_FILE; none = summary only) and folded into a histogram per interval, printed on close().
+    The file is written by a background thread: record() runs on the event loop and only enqueues.
+    """
+    def __init__(self, path: Optional[str] = None):
+        # Trace file: Arg > Env > Default(none); "" turns the file off
+        self.path = ( path if path is not None else os.getenv( "TRACE_FILE" ) ) or None
+        self._file = None
+        self._queue = None
+        self._thread = None
+        if self.path:
+            os.makedirs( os.path.dirname( self.path ) or ".", exist_ok=True )
+            # Line-buffered: each turn is one write, readable with tail -f while the assistant runs
+            self._file = open( self.path, "a", encoding="utf-8", buffering=1 )
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread( target=self._run, name="trace-writer", daemon=True )
+            self._thread.start()
+        self.histograms = {name: LatencyHistogram( window=1000 ) for name in INTERVALS}
+        self.turns = 0
+        self.statuses = {}
+
+    def begin(self, text: str, **marks) -> TurnTrace:
+        """
+        Starts a turn; marks carries stages already timed upstream (e.g. the ASR's speech_end/endpoint).
+        """
+        self.turns += 1
+        trace = TurnTrace( self, self.turns, text )
+        for stage, at in marks.items():
+            if at is not None:
+                trace.mark( stage, at )
+        return trace
+
+    def record(self, trace: TurnTrace):
+        for name, seconds in trace.intervals().items():
+            self.histograms[name].record( seconds )
+        status = trace.fields.get( "status", "ok" )
+        self.statuses[status] = self.statuses.get( status, 0 ) + 1
+        if self._queue is not None:
+            # to_dict() now (it reads the clock), serializing and the write happen in the thread
+            self._queue.put( trace.to_dict() )
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            try:
+                self._file.write( json.dumps( record, ensure_ascii=False ) + "\n" )
+            except ( OSError, ValueError ) as e:
+                print( f"[TRACE] Write failed: {e}" )
+
+    def summary(self) -> str:
+        lines = [f"[TRACE] {self.turns} turns ({', '.join( f'{n} {s}' for s, n in self.statuses.items() ) or 'none finished'})"]
+        for name, histogram in self.histograms.items():
+            if histogram.count:
+                lines.append( f"[TRACE]   {name:<16} {histogram}" )
+        return "\n".join( lines )
+
+    def close(self):
+        if self.turns:
+            print( self.summary() )
+        if self._thread is not None:
+            # Drains what is queued before closing the file
+            self._queue.put( None )
+            self._thread.join( timeout=5 )
+            self._thread = None
+            self._queue = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
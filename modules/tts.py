@@ -2,29 +2,287 @@ import asyncio
 import websockets
 import json
 import base64
+import binascii
 import os
+import queue
+import threading
+import time
+import wave
 import pyaudio
-import audioop
+from typing import Optional
+from websockets.protocol import State
+from modules.audio import PcmProcessor
+from modules.audio_cache import AudioCache
+from modules.playback import PlaybackThread
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    # Optional: pip install orjson for faster parsing of ElevenLabs frames (json otherwise)
+    loads = json.loads
+
+# ElevenLabs stream-input defaults
+DEFAULT_MODEL_ID = "eleven_flash_v2_5"
+# Request raw PCM 24000Hz (Free Tier compatible)
+DEFAULT_OUTPUT_FORMAT = "pcm_24000"
+SOURCE_RATE = 24000
+DEFAULT_VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.75}
+
+def parse_frame(message):
+    """
+    One ElevenLabs frame -> (pcm or None, the frame's other fields).
+
+    The base64 audio (nearly all of the frame) is decoded straight out of the raw message bytes,
+    never becoming a str; only the small remainder (isFinal, alignment) goes through the JSON parser.
+    Anything unusual (escapes, a null audio field) falls back to parsing the whole frame.
+    """
+    if isinstance( message, str ):
+        message = message.encode( "utf-8" )
+    key = message.find( b'"audio"' )
+    if key < 0:
+        return None, loads( message )
+    value = message.find( b'"', key + 7 ) + 1
+    end = message.find( b'"', value ) if value else -1
+    if end < 0 or message[key + 7:value - 1].strip() != b":" or message.find( b"\\", value, end ) >= 0:
+        data = loads( message )
+        return ( base64.b64decode( data["audio"] ) if data.get( "audio" ) else None ), data
+    pcm = binascii.a2b_base64( memoryview( message )[value:end] ) if end > value else None
+    # {"audio": "", ...}: the rest of the frame without copying the audio around
+    return pcm, loads( message[:value] + message[end:] )
+
+class DebugDump:
+    """
+    --debug copy of everything received from ElevenLabs (24kHz mono PCM), written by a background
+    thread so the receive path only enqueues. The format follows the extension: .wav (playable,
+    header finalized on close), .flac (compressed; needs soundfile, WAV otherwise) or raw .pcm.
+    """
+    def __init__(self, path, rate=24000):
+        self.path = path
+        self.rate = rate
+        self.bytes_written = 0
+        self._queue = queue.SimpleQueue()
+        self._file = self._open()
+        self._thread = threading.Thread( target=self._run, name="tts-debug-dump", daemon=True )
+        self._thread.start()
+
+    def _open(self):
+        ext = os.path.splitext( self.path )[1].lower()
+        if ext == ".flac":
+            try:
+                import soundfile
+                return soundfile.SoundFile( self.path, "w", samplerate=self.rate, channels=1, subtype="PCM_16", format="FLAC" )
+            except ImportError:
+                self.path = os.path.splitext( self.path )[0] + ".wav"
+                print( f"[TTS DEBUG] soundfile not installed, dumping WAV to {self.path}" )
+                ext = ".wav"
+        if ext == ".wav":
+            f = wave.open( self.path, "wb" )
+            f.setnchannels( 1 )
+            f.setsampwidth( 2 )
+            f.setframerate( self.rate )
+            return f
+        return open( self.path, "wb" )
+
+    def write(self, pcm):
+        self._queue.put( pcm )
+
+    def _run(self):
+        while True:
+            pcm = self._queue.get()
+            if pcm is None:
+                break
+            try:
+                if isinstance( self._file, wave.Wave_write ):
+                    self._file.writeframesraw( pcm )
+                elif hasattr( self._file, "buffer_write" ):
+                    self._file.buffer_write( pcm, dtype="int16" )
+                else:
+                    self._file.write( pcm )
+                self.bytes_written += len( pcm )
+            except Exception as e:
+                print( f"[TTS DEBUG] Error writing to debug file: {e}" )
+
+    def close(self):
+        self._queue.put( None )
+        self._thread.join( timeout=5 )
+        self._file.close()
+
+class ConnectionPool:
+    """
+    Keeps pre-opened, BOS-primed ElevenLabs stream-input sockets per voice_id.
+
+    A stream-input socket carries exactly one context (the server closes it after isFinal),
+    so reuse means always having the next socket ready: acquire() hands out a warm socket
+    and immediately starts opening its replacement while the current reply is still playing.
+    Idle sockets get a single-space keep-alive so the server's inactivity timeout never fires.
+    """
+    def __init__(self, api_key, base_url=None, model_id=DEFAULT_MODEL_ID, output_format=DEFAULT_OUTPUT_FORMAT,
+                 voice_settings=None, size=1, keepalive_interval=15.0, inactivity_timeout=60, debug=False):
+        self.api_key = api_key
+        self.base_url = ( base_url or os.getenv( "ELEVENLABS_WS_URL", "wss://api.elevenlabs.io" ) ).rstrip( "/" )
+        self.model_id = model_id
+        self.output_format = output_format
+        self.voice_settings = voice_settings or DEFAULT_VOICE_SETTINGS
+        self.size = size
+        self.keepalive_interval = keepalive_interval
+        self.inactivity_timeout = inactivity_timeout
+        self.debug = debug
+
+        self._idle = {}        # voice_id -> list of [websocket, last_activity]
+        self._pending = {}     # voice_id -> set of in-flight connect tasks
+        self._keepalive_task = None
+        self.stats = {"warm": 0, "cold": 0, "reconnects": 0}
+
+    def uri(self, voice_id):
+        return ( f"{self.base_url}/v1/text-to-speech/{voice_id}/stream-input"
+                 f"?model_id={self.model_id}&output_format={self.output_format}"
+                 f"&inactivity_timeout={self.inactivity_timeout}" )
+
+    async def connect(self, voice_id):
+        """
+        Opens a new socket and sends BOS, so it is ready to take text right away.
+        """
+        websocket = await websockets.connect( self.uri( voice_id ), additional_headers={"xi-api-key": self.api_key} )
+        # BOS: ElevenLabs requires "text": " " (space) as the beginning-of-stream marker
+        bos_payload = {
+            "text": " ",
+            "voice_settings": self.voice_settings
+        }
+        if self.debug:
+            print( f"[TTS DEBUG] Sending BOS: {bos_payload}" )
+        await websocket.send( json.dumps( bos_payload ) )
+        return websocket
+
+    def _take_idle(self, voice_id):
+        idle = self._idle.get( voice_id, [] )
+        while idle:
+            websocket, _ = idle.pop( 0 )
+            if websocket.state is State.OPEN:
+                return websocket
+            self.stats["reconnects"] += 1
+        return None
+
+    async def acquire(self, voice_id):
+        """
+        Returns a primed socket for one context. The caller owns it and closes it when done.
+        """
+        self._ensure_keepalive()
+        websocket = self._take_idle( voice_id )
+
+        pending = self._pending.get( voice_id )
+        if websocket is None and pending:
+            # A warm-up is already in flight: waiting for it beats starting a second handshake.
+            await asyncio.wait( set( pending ) )
+            websocket = self._take_idle( voice_id )
+
+        if websocket is not None:
+            self.stats["warm"] += 1
+        else:
+            self.stats["cold"] += 1
+            websocket = await self.connect( voice_id )
+
+        # Open the next context while this one is in use.
+        self.prewarm( voice_id )
+        return websocket
+
+    def prewarm(self, voice_id):
+        """
+        Tops the idle pool for voice_id back up to `size` in the background.
+        """
+        self._ensure_keepalive()
+        pending = self._pending.setdefault( voice_id, set() )
+        missing = self.size - len( self._idle.get( voice_id, [] ) ) - len( pending )
+        for _ in range( max( 0, missing ) ):
+            task = asyncio.create_task( self._fill( voice_id ) )
+            pending.add( task )
+            task.add_done_callback( pending.discard )
+
+    async def _fill(self, voice_id):
+        try:
+            websocket = await self.connect( voice_id )
+        except Exception as e:
+            print( f"[TTS] Pre-connect failed: {e}" )
+            return
+        self._idle.setdefault( voice_id, [] ).append( [websocket, time.monotonic()] )
+
+    def _ensure_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task( self._keepalive() )
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep( self.keepalive_interval / 2 )
+            now = time.monotonic()
+            # Snapshots: acquire() and _fill() change the pool while a send is in flight, and a socket
+            # acquire() took meanwhile belongs to its session, so dead entries go by identity.
+            for voice_id, idle in list( self._idle.items() ):
+                for entry in list( idle ):
+                    if not self._holds( idle, entry ):
+                        continue  # taken by acquire() during an earlier send
+                    websocket, last = entry
+                    if websocket.state is not State.OPEN:
+                        self._discard( idle, entry )
+                        continue
+                    if now - last >= self.keepalive_interval:
+                        try:
+                            # A lone space keeps the context open without producing audio.
+                            await websocket.send( json.dumps( {"text": " "} ) )
+                            entry[1] = now
+                        except websockets.exceptions.ConnectionClosed:
+                            self._discard( idle, entry )
+                # Transparent reconnect: replace anything the server dropped.
+                if len( idle ) < self.size:
+                    self.prewarm( voice_id )
+
+    @staticmethod
+    def _holds(idle, entry):
+        return any( e is entry for e in idle )
+
+    def _discard(self, idle, entry):
+        for i, e in enumerate( idle ):
+            if e is entry:
+                del idle[i]
+                self.stats["reconnects"] += 1
+                return
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        tasks = [task for pending in self._pending.values() for task in pending]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather( *tasks, return_exceptions=True )
+        for idle in self._idle.values():
+            for websocket, _ in idle:
+                await websocket.close()
+        self._idle.clear()
 
 class TTS:
-    def __init__(self, voice_id=None, device_index=None, channels=None, debug=False):
+    def __init__(self, voice_id=None, device_index=None, channels=None, debug=False, pool=None, sink=None, prebuffer_ms=None, cache=None, cache_max_chars=200,
+                 output_rate=None, gain=None, debug_file=None):
         self.debug = debug
         self.api_key = os.getenv("ELEVENLABS_API_KEY")
         if not self.api_key:
             raise ValueError("ELEVENLABS_API_KEY not found in environment variables.")
-        
+
         # Use provided voice_id, or env var, or default
         if voice_id:
             self.voice_id = voice_id
         else:
             self.voice_id = os.getenv("ELEVENLABS_VOICE_ID", "dyLJ4nCukg4AOgAVlUR7")
 
-        # Request raw PCM 24000Hz (Free Tier compatible)
-        self.uri = f"wss://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/stream-input?model_id=eleven_flash_v2_5&output_format=pcm_24000"
-        
-        # Audio setup
-        self.p = pyaudio.PyAudio()
-        
+        # Warm socket pool, shareable between TTS instances
+        self.pool = pool if pool is not None else ConnectionPool( self.api_key, debug=debug )
+        self.uri = self.pool.uri( self.voice_id )
+        # Set while a reply is playing; interrupt() fires it
+        self._interrupted = None
+
+        # Synthesized-audio cache (optional); only short single-chunk replies are stored
+        self.cache = cache
+        self.cache_max_chars = cache_max_chars
+
         # Device Index: Arg > Env > Default(None = system default)
         if device_index is not None:
             self.device_index = device_index
@@ -47,152 +305,342 @@ class TTS:
             except ValueError:
                 self.channels = 2
 
+        # Output rate: Arg > Env > Default(24kHz, or the device's native rate if it can't do 24kHz)
+        if output_rate is None:
+            try:
+                output_rate = int( os.getenv( "AUDIO_OUTPUT_RATE", "0" ) ) or None
+            except ValueError:
+                output_rate = None
+
+        # Gain: Arg > Env > Default(1.0)
+        if gain is None:
+            try:
+                gain = float( os.getenv( "TTS_GAIN", "1.0" ) )
+            except ValueError:
+                gain = 1.0
+
+        # Audio setup. sink: anything with write(pcm), used instead of a device (benchmarks, tests)
+        self.p = None
+        if sink is not None:
+            self.rate = output_rate or SOURCE_RATE
+            self.stream = sink
+        else:
+            self.p = pyaudio.PyAudio()
+            self.rate = output_rate or self._native_rate()
+            self.stream = self._open_device()
+
+        if self.debug:
+            print( f"[TTS CHECK] Voice: {self.voice_id}, Device: {self.device_index}, Channels: {self.channels}, Rate: {self.rate}" )
+
+        # 24kHz mono from ElevenLabs -> device rate and channel layout
+        self.processor = PcmProcessor( src_rate=SOURCE_RATE, dst_rate=self.rate, channels=self.channels, gain=gain )
+
+        # Playback runs on its own thread behind a jitter buffer: Arg > Env > Default(120ms)
+        if prebuffer_ms is None:
+            try:
+                prebuffer_ms = int( os.getenv( "TTS_PREBUFFER_MS", "120" ) )
+            except ValueError:
+                prebuffer_ms = 120
+        self.player = PlaybackThread( self.stream,
+                                      bytes_per_second=self.rate * 2 * self.channels,
+                                      prebuffer_ms=prebuffer_ms,
+                                      frame_size=2 * self.channels )
+
+        # Debug dump of the received audio: Arg > Env > Default(/tmp/elevenlabs_debug.wav); .wav, .flac or .pcm
+        self.debug_file = debug_file or os.getenv( "TTS_DEBUG_FILE", "/tmp/elevenlabs_debug.wav" )
+        self.dump = None
         if self.debug:
-            print( f"[TTS CHECK] Voice: {self.voice_id}, Device: {self.device_index}, Channels: {self.channels}" )
+            try:
+                self.dump = DebugDump( self.debug_file, SOURCE_RATE )
+                print( f"[TTS DEBUG] dumping received audio to {self.dump.path}" )
+            except Exception as e:
+                print( f"[TTS DEBUG] start file error: {e}" )
 
+    def _native_rate(self):
+        """
+        24kHz if the output device takes it, otherwise its default rate (we resample).
+        """
+        try:
+            self.p.is_format_supported( SOURCE_RATE,
+                                        output_device=self.device_index,
+                                        output_channels=self.channels,
+                                        output_format=pyaudio.paInt16 )
+            return SOURCE_RATE
+        except ( ValueError, OSError, AttributeError ):
+            pass
         try:
-            self.stream = self.p.open( format=pyaudio.paInt16,
-                                       channels=self.channels,
-                                       rate=24000,
-                                       output=True,
-                                       output_device_index=self.device_index )
+            if self.device_index is not None:
+                info = self.p.get_device_info_by_index( self.device_index )
+            else:
+                info = self.p.get_default_output_device_info()
+            rate = int( info["defaultSampleRate"] )
+        except ( OSError, IOError, KeyError ):
+            return SOURCE_RATE
+        print( f"[TTS] Device does not take {SOURCE_RATE}Hz, resampling to {rate}Hz." )
+        return rate
+
+    def _open_device(self):
+        try:
+            return self.p.open( format=pyaudio.paInt16,
+                                channels=self.channels,
+                                rate=self.rate,
+                                output=True,
+                                output_device_index=self.device_index )
         except OSError as e:
             if self.device_index is not None:
                 print( f"[TTS] Device {self.device_index} failed ({e}), falling back to system default." )
                 self.device_index = None
-                self.stream = self.p.open( format=pyaudio.paInt16,
-                                           channels=self.channels,
-                                           rate=24000,
-                                           output=True,
-                                           output_device_index=None )
-            else:
-                raise
-        
-        self.debug_file = "/tmp/elevenlabs_debug.pcm"
-        # Clear debug file on init if debug is enabled
+                return self.p.open( format=pyaudio.paInt16,
+                                    channels=self.channels,
+                                    rate=self.rate,
+                                    output=True,
+                                    output_device_index=None )
+            raise
+
+    async def _process_and_play(self, audio_data, record=None):
+        if record is not None:
+            # Source PCM (before channel mapping) for the audio cache
+            record += audio_data
+
+        # Debug logging: the file write happens on the dump's own thread
         if self.debug:
-            try:
-                with open(self.debug_file, "wb") as f:
-                    pass
-                print(f"[TTS DEBUG] cleared {self.debug_file}")
-            except Exception as e:
-                print(f"[TTS DEBUG] start file error: {e}")
+            print(f"[TTS DEBUG] Received chunk: {len(audio_data)} bytes")
+            if self.dump is not None:
+                self.dump.write(audio_data)
 
-    async def _process_and_play(self, data_json):
-        if data_json.get("audio"):
-            audio_data = base64.b64decode(data_json["audio"])
-            
-            # Debug logging
-            if self.debug:
-                print(f"[TTS DEBUG] Received chunk: {len(audio_data)} bytes (B64: {len(data_json['audio'])})")
-                try:
-                    with open(self.debug_file, "ab") as f:
-                        f.write(audio_data)
-                except Exception as e:
-                    print(f"[TTS DEBUG] Error writing to debug file: {e}")
-
-            # If we decoded MP3, we would need pydub here. But checking header, we requested PCM.
-            # However, if channels=2, upmix mono -> stereo
-            if self.channels == 2:
-                # audioop.tostereo(fragment, width, lfactor, rfactor)
-                # width=2 (16-bit)
-                try:
-                    audio_data = audioop.tostereo(audio_data, 2, 1, 1)
-                except Exception as e:
-                    print(f"Error upmixing: {e}")
-            
-            # If channels > 2, we might be sending mono to multi-channel stream.
-            # Result depends on OS mixing.
-            
-            self.stream.write(audio_data)
-        else:
-            print(f"[TTS DEBUG] Received non-audio message: {data_json.keys()}")
-
-    async def stream_audio(self, text_iterator):
-        """
-        Connects to ElevenLabs WebSocket and streams audio.
-        text_iterator: An async iterator yielding text chunks.
-        """
-        async with websockets.connect(self.uri) as websocket:
-            # Sender task: sends text to WebSocket
-            async def send_text():
-                # Start frame
-                # Start frame
-                payload = {
-                    "voice_settings": {"stability": 0.5, "similarity_boost": 0.8},
-                    "xi_api_key": self.api_key, 
-                }
-                print(f"[TTS DEBUG] Sending init payload: {payload}")
-                await websocket.send(json.dumps(payload))
-
-                async for text in text_iterator:
-                    if text.strip():
-                        print(f"[TTS DEBUG] Streaming text: '{text}'")
-                        await websocket.send(json.dumps({"text": text + " ", "try_trigger_generation": True}))
-                
-                # End of stream
-                print("[TTS DEBUG] Sending EOS")
-                await websocket.send(json.dumps({"text": ""}))
-
-            # Receiver task: plays audio
-            async def receive_audio():
-                while True:
-                    try:
-                        message = await websocket.recv()
-                        data = json.loads(message)
-                        await self._process_and_play(data)
-                        
-                        if data.get("isFinal"):
-                            print("[TTS DEBUG] Received isFinal signal")
-                            break
-                    except websockets.exceptions.ConnectionClosed:
-                        print("[TTS DEBUG] WebSocket connection closed")
-                        break
-            pass
+        await self._play_pcm(audio_data)
 
-    async def speak(self, text: str):
+    async def _play_pcm(self, audio_data):
         """
-        Simple wrapper for single text string.
+        Maps 24kHz mono PCM to the device layout and queues it for playback.
         """
-        if not text or not text.strip():
+        # If we decoded MP3, we would need pydub here. But checking header, we requested PCM.
+        # Resample / gain / fan out mono to every device channel (one vectorized pass)
+        audio_data = self.processor.process( audio_data )
+
+        # Hand off to the playback thread; only waits if the jitter buffer is full.
+        await self.player.write(audio_data)
+
+    async def prewarm(self):
+        """
+        Opens the first socket in the background so the first reply doesn't pay for the handshake.
+        """
+        self.pool.prewarm( self.voice_id )
+
+    @property
+    def speaking(self) -> bool:
+        return self._interrupted is not None
+
+    def interrupt(self):
+        """
+        Barge-in: stops the current reply now. Buffered audio is dropped and
+        stream_audio()/speak() return False instead of waiting for the rest.
+        """
+        if self._interrupted is None:
             return
+        self.player.flush()
+        self._interrupted.set()
 
-        async def text_gen():
-            yield text
-        
-        # Re-implement logic with headers correct for the connection
-        async with websockets.connect( self.uri, additional_headers={"xi-api-key": self.api_key} ) as websocket:
-            # BOS: ElevenLabs requires "text": " " (space) as the beginning-of-stream marker
-            bos_payload = {
-                "text": " ",
-                "voice_settings": {"stability": 0.5, "similarity_boost": 0.75}
-            }
+    async def stream_audio(self, text_iterator, trace=None) -> bool:
+        """
+        Streams text to ElevenLabs and plays the audio as it arrives.
+        text_iterator: An async iterator yielding text chunks (e.g. sentences as the LLM produces them).
+        trace: optional TurnTrace; gets tts_first_text, tts_socket, tts_first_byte, audio_out and playback_done.
+        Returns True if the reply played to the end, False if it was interrupted.
+        """
+        self._interrupted = asyncio.Event()
+        body = asyncio.create_task( self._stream_body( text_iterator, trace ) )
+        stopper = asyncio.create_task( self._interrupted.wait() )
+        try:
+            done, _ = await asyncio.wait( {body, stopper}, return_when=asyncio.FIRST_COMPLETED )
+            if body in done:
+                body.result()
+                return True
             if self.debug:
-                print( f"[TTS DEBUG] Sending BOS: {bos_payload}" )
-            await websocket.send( json.dumps( bos_payload ) )
+                print( "[TTS DEBUG] Interrupted" )
+            return False
+        except asyncio.CancelledError:
+            self.player.flush()
+            raise
+        finally:
+            stopper.cancel()
+            if not body.done():
+                body.cancel()
+                await asyncio.gather( body, return_exceptions=True )
+            if self._interrupted.is_set():
+                # Frames may have landed between interrupt() and the cancel taking effect.
+                self.player.flush()
+            self._interrupted = None
+            if trace is not None and self.player.first_write_at is not None:
+                # Also when cut off by barge-in: the user did hear the start of the reply
+                trace.mark( "audio_out", self.player.first_write_at )
 
-            # Send text
-            if self.debug:
-                print( f"[TTS DEBUG] Sending Text: '{text}'" )
-            await websocket.send( json.dumps( {"text": text + " ", "try_trigger_generation": True} ) )
-            await websocket.send( json.dumps( {"text": ""} ) ) # EOS
+    def _cache_key(self, text):
+        return AudioCache.key( self.voice_id, self.pool.model_id, self.pool.output_format, self.pool.voice_settings, text )
 
+    async def _stream_body(self, text_iterator, trace=None):
+        """
+        Leading chunks found in the audio cache play straight from disk. The first miss takes a
+        warm socket from the pool and everything from there on is synthesized, in order.
+        """
+        websocket = None
+        receiver = None
+        sent = []
+        record = bytearray() if self.cache is not None else None
+        self.processor.reset()
+        self.player.begin()
+
+        # Receiver task: plays audio
+        async def receive_audio(websocket):
             while True:
                 try:
-                    message = await websocket.recv()
-                    data = json.loads(message)
-                    await self._process_and_play(data)
-                    
+                    # Raw bytes: the audio is decoded from them directly (parse_frame), never as a str
+                    pcm, data = parse_frame(await websocket.recv(decode=False))
+                    if pcm:
+                        if trace is not None:
+                            trace.mark("tts_first_byte")
+                        await self._process_and_play(pcm, record)
+                    elif self.debug:
+                        print(f"[TTS DEBUG] Received non-audio message: {data.keys()}")
+
                     if data.get("isFinal"):
                         if self.debug:
                             print("[TTS DEBUG] Stream Complete (isFinal)")
-                        break
+                        return True
                 except websockets.exceptions.ConnectionClosed as e:
                     if self.debug:
                         print(f"[TTS DEBUG] Connection Closed: {e}")
-                    break
+                    # Cut short: what arrived is played, but it is not a whole clip
+                    return False
+
+        try:
+            async for text in text_iterator:
+                if not text.strip():
+                    continue
+                if trace is not None:
+                    trace.mark( "tts_first_text" )
+
+                if websocket is None and self.cache is not None:
+                    pcm = self.cache.get( self._cache_key( text ) )
+                    if pcm is not None:
+                        if self.debug:
+                            print( f"[TTS DEBUG] Cache hit: '{text}'" )
+                        if trace is not None:
+                            trace.mark( "tts_first_byte" )
+                        await self._play_pcm( pcm )
+                        continue
+
+                if self.debug:
+                    print( f"[TTS DEBUG] Streaming text: '{text}'" )
+                payload = json.dumps( {"text": text + " ", "try_trigger_generation": True} )
+                if websocket is None:
+                    websocket = await self.pool.acquire( self.voice_id )
+                    if trace is not None:
+                        trace.mark( "tts_socket" )
+                try:
+                    await websocket.send( payload )
+                except websockets.exceptions.ConnectionClosed:
+                    if receiver is not None:
+                        raise
+                    # The warm socket died while idle: reconnect transparently before any audio was requested.
+                    self.pool.stats["reconnects"] += 1
+                    await websocket.close()
+                    websocket = await self.pool.connect( self.voice_id )
+                    await websocket.send( payload )
+                sent.append( text )
+                if receiver is None:
+                    receiver = asyncio.create_task( receive_audio( websocket ) )
+
+            if receiver is not None:
+                # End of stream
+                if self.debug:
+                    print( "[TTS DEBUG] Sending EOS" )
+                await websocket.send( json.dumps( {"text": ""} ) )
+                complete = await receiver
+                # Only single-chunk contexts that arrived whole (isFinal) map cleanly to one text -> one clip.
+                if complete and len( sent ) == 1 and record and len( sent[0] ) <= self.cache_max_chars:
+                    self.cache.put( self._cache_key( sent[0] ), record )
+            self.player.end_of_stream()
+            # Return only once the reply has actually been heard.
+            await self.player.drain()
+            if trace is not None:
+                trace.mark( "playback_done" )
+            if self.debug:
+                print( f"[TTS DEBUG] Playback stats: {self.player.stats}" )
+        finally:
+            if receiver is not None:
+                receiver.cancel()
+            self.player.end_of_stream()
+            if websocket is not None:
+                await websocket.close()
+
+    async def synthesize(self, text: str) -> Optional[bytes]:
+        """
+        Synthesizes text to 24kHz mono PCM without playing it; None if the stream ended before isFinal.
+        """
+        websocket = await self.pool.acquire( self.voice_id )
+        pcm = bytearray()
+        try:
+            await websocket.send( json.dumps( {"text": text + " ", "try_trigger_generation": True} ) )
+            await websocket.send( json.dumps( {"text": ""} ) )
+            while True:
+                audio, data = parse_frame( await websocket.recv( decode=False ) )
+                if audio:
+                    pcm += audio
+                if data.get( "isFinal" ):
+                    return bytes( pcm )
+        except websockets.exceptions.ConnectionClosed:
+            return None
+        finally:
+            await websocket.close()
+
+    async def prewarm_cache(self, phrases):
+        """
+        Synthesizes common phrases (greetings, error fallbacks) into the cache ahead of time.
+        """
+        if self.cache is None:
+            return
+        for text in phrases:
+            key = self._cache_key( text )
+            if key in self.cache:
+                continue
+            try:
+                pcm = await self.synthesize( text )
+            except Exception as e:
+                print( f"[TTS] Cache pre-warm failed for '{text}': {e}" )
+                continue
+            if pcm is None:
+                # A truncated clip would be replayed on every later hit
+                print( f"[TTS] Cache pre-warm for '{text}' was cut off, not cached" )
+                continue
+            self.cache.put( key, pcm )
+        if self.debug:
+            print( f"[TTS DEBUG] Audio cache: {len( self.cache._index )} entries, {self.cache.total_bytes} bytes" )
+
+    async def speak(self, text: str, trace=None) -> bool:
+        """
+        Simple wrapper for single text string.
+        """
+        if not text or not text.strip():
+            return True
+
+        async def text_gen():
+            yield text
+
+        return await self.stream_audio( text_gen(), trace )
+
+    async def aclose(self):
+        await self.pool.close()
 
     def close(self):
+        self.player.close()
+        if self.dump is not None:
+            self.dump.close()
+            self.dump = None
+        if self.cache is not None:
+            self.cache.close()
+        if self.p is None:
+            return
         self.stream.stop_stream()
         self.stream.close()
         self.p.terminate()
@@ -0,0 +1,452 @@
+import asyncio
+import argparse
+import hashlib
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+from modules.asr import VADSegmenter
+from modules.tts import TTS, ConnectionPool, SOURCE_RATE
+from modules.storage import Storage
+from modules.context import ConversationContext
+from modules.session_store import SessionStore
+from modules.tracing import Tracer
+from modules.loop_monitor import LoopMonitor
+from modules.llm import transport
+import main
+
+load_dotenv()
+
+# User names double as directory names under brain/ and brain/.sessions/
+USER_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def user_token(secret: str, user: str) -> str:
+    """
+    Access token of `user` on a server started with SERVER_SECRET=secret (python server.py token USER).
+    """
+    return hmac.new(secret.encode("utf-8"), user.encode("utf-8"), hashlib.sha256).hexdigest()
+
+class ClientASR:
+    """
+    Speech input of one connected client, in the shape main.pipeline expects from ASR.
+
+    The client's PCM is segmented by a VADSegmenter on the event loop as it arrives; finished
+    utterances are recognized by the shared backend on the server's worker threads. Typed turns
+    skip recognition. At most `max_pending` utterances wait for the pipeline; beyond that new
+    ones are dropped, so a client talking faster than it is answered only delays itself.
+    """
+    def __init__(self, backend, executor, frame_ms=30, max_pending=4):
+        self.backend = backend
+        self.executor = executor
+        self.segmenter = VADSegmenter(sample_rate=backend.sample_rate, frame_ms=frame_ms)
+        self.max_pending = max_pending
+        self.on_speech_start = None
+        self.on_partial = None
+        self.last_timing = {}
+        self.dropped = 0
+        self._queue = asyncio.Queue()
+        self._carry = b""
+        self._stream = None
+        self._announced = False
+        self._loop = asyncio.get_running_loop()
+
+    def _partial(self, text):
+        # From the backend's thread; on_partial (the pipeline's early recall) runs on the loop
+        if self.on_partial:
+            self._loop.call_soon_threadsafe(self.on_partial, text)
+
+    def feed(self, pcm: bytes):
+        """
+        Client audio (16-bit mono at the backend's rate, any chunk size).
+        """
+        frame_bytes = self.segmenter.frame_bytes
+        data = self._carry + pcm if self._carry else pcm
+        whole = len(data) - len(data) % frame_bytes
+        self._carry = data[whole:]
+        for start in range(0, whole, frame_bytes):
+            event, utterance = self.segmenter.feed(data[start:start + frame_bytes])
+            if event == VADSegmenter.START:
+                self._stream = self.backend.open_stream(self._partial)
+                self._stream.accept(utterance)
+            elif event == VADSegmenter.SPEECH:
+                self._stream.accept(utterance)
+            elif event == VADSegmenter.END:
+                now = time.perf_counter()
+                timing = {"speech_end": now - self.segmenter.trailing_silence_ms / 1000, "endpoint": now}
+                self._put(("audio", self._stream, timing))
+                self._stream = None
+                self._announced = False
+            elif event == VADSegmenter.DISCARD:
+                self._stream.cancel()
+                self._stream = None
+                self._announced = False
+            if self._stream is not None and not self._announced and self.segmenter.confirmed:
+                self._announced = True
+                if self.on_speech_start:
+                    self.on_speech_start()
+
+    def text(self, text: str):
+        """
+        A typed turn.
+        """
+        self._put(("text", text, {}))
+
+    def _put(self, item):
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            if item[0] == "audio":
+                item[1].cancel()
+            print(f"[SERVER] Dropped an utterance, {self._queue.qsize()} already waiting")
+            return
+        self._queue.put_nowait(item)
+
+    def finish(self):
+        """
+        No more input: transcripts() ends once what is queued has been handed out.
+        """
+        if self._stream is not None:
+            self._stream.cancel()
+            self._stream = None
+        self._queue.put_nowait(None)
+
+    async def transcripts(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            kind, payload, timing = item
+            if kind == "text":
+                text = payload
+            else:
+                text = await loop.run_in_executor(self.executor, payload.finish)
+            if text:
+                self.last_timing = {**timing, "transcript": time.perf_counter()}
+                yield text
+
+class ClientSink:
+    """
+    Audio sink (PlaybackThread side) sending the reply PCM to the client.
+
+    Each write waits until the socket has taken the chunk (websockets' write buffer limit), then
+    paces itself to real time with `lead` seconds of head start for the client's jitter buffer.
+    A slow client therefore stalls its own playback ring and TTS receive, nobody else's.
+    """
+    def __init__(self, websocket, loop, bytes_per_second=SOURCE_RATE * 2, lead=0.25):
+        self.websocket = websocket
+        self.loop = loop
+        self.bytes_per_second = bytes_per_second
+        self.lead = lead
+        self.closed = False
+        self.bytes_sent = 0
+        self._due = 0.0
+
+    def write(self, pcm):
+        if self.closed:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.websocket.send(pcm), self.loop)
+        try:
+            future.result(timeout=10)
+        except Exception:
+            # Gone or stuck: drop the rest of this client's audio
+            self.closed = True
+            future.cancel()
+            return
+        self.bytes_sent += len(pcm)
+        now = time.perf_counter()
+        self._due = max(self._due, now) + len(pcm) / self.bytes_per_second
+        ahead = self._due - now - self.lead
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class ScopedStorage:
+    """
+    One user's view of the shared Storage writer: notes land in <base>/<user>/, under the
+    filename the model chose but never outside that directory.
+    """
+    def __init__(self, storage, user):
+        self.storage = storage
+        self.user = user
+        self.base_path = os.path.join(storage.base_path, user)
+
+    def submit(self, filename, content, mode="a", meta=None):
+        name = os.path.basename(filename.replace("\\", "/"))
+        if name in ("", ".", ".."):
+            name = "notes.md"
+        return self.storage.submit(f"{self.user}/{name}", content, mode, {**(meta or {}), "user": self.user})
+
+    async def save(self, filename, content, mode="a", meta=None):
+        return await self.submit(filename, content, mode, meta)
+
+class SessionTracer(Tracer):
+    """
+    Turn traces of one session: each goes to the client ("transcript" when it starts, "turn"
+    with the stage timings when it ends) and into the server-wide tracer.
+    """
+    def __init__(self, server_tracer, session_id, send):
+        super().__init__("")
+        self.server_tracer = server_tracer
+        self.session_id = session_id
+        self.send = send
+
+    def begin(self, text, **marks):
+        trace = super().begin(text, **marks)
+        self.server_tracer.turns += 1
+        trace.set(session=self.session_id)
+        self.send({"type": "transcript", "text": text})
+        return trace
+
+    def record(self, trace):
+        super().record(trace)
+        self.server_tracer.record(trace)
+        self.send({"type": "turn", **trace.to_dict()})
+
+    def close(self):
+        # The server prints the aggregate
+        pass
+
+class Server:
+    """
+    Many voice clients in one process, one WebSocket per conversation (ws://host:port/?user=NAME&token=TOKEN).
+
+    Each connection runs its own main.pipeline with its own history, filename lock, TTS player
+    and turn traces; the LLM client, the ElevenLabs connection pool, the storage writer, the
+    recognizer and the tracer are shared. Beyond `max_sessions` new connections are turned away.
+
+    The user name selects whose notes and saved conversation (?resume=1) a connection gets. With a
+    `secret` every connection must prove it with user_token(secret, user), as ?token= or an
+    "Authorization: Bearer" header; anything else is refused before the upgrade (HTTP 401). Without
+    one anybody who can connect can be anybody, so cli() then only listens on a loopback address.
+
+    Protocol:
+      server -> client  {"type": "ready", "session", "input_rate", "output_rate"} on connect
+      client -> server  binary: 16-bit mono PCM at input_rate (mic audio, any chunk size)
+                        {"type": "text", "text": "..."}: a typed turn; {"type": "bye"}: hang up
+      server -> client  binary: 16-bit mono PCM at output_rate (the replies)
+                        {"type": "transcript", "text"} and {"type": "turn", "status", "intervals_ms", ...}
+    """
+    def __init__(self, llm, pool, storage, asr_backend, tracer, voice_id=None, max_sessions=50, asr_workers=8,
+                 barge_in=True, context_tokens=None, sessions_dir=None, secret=None):
+        self.llm = llm
+        self.pool = pool
+        self.storage = storage
+        self.asr_backend = asr_backend
+        self.tracer = tracer
+        self.voice_id = voice_id
+        self.max_sessions = max_sessions
+        self.barge_in = barge_in
+        self.context_tokens = context_tokens
+        self.sessions_dir = sessions_dir
+        self.secret = secret
+        self.executor = ThreadPoolExecutor(max_workers=asr_workers, thread_name_prefix="asr")
+        self.sessions = {}
+        self.stats = {"accepted": 0, "rejected": 0, "unauthorized": 0, "dropped_utterances": 0}
+        self._ids = itertools.count(1)
+
+    def authorize(self, connection, request):
+        """
+        websockets process_request hook: checks the user name and, with a secret, its token.
+        """
+        query = parse_qs(urlparse(request.path).query)
+        user = query.get("user", [""])[0]
+        if user and not USER_NAME.fullmatch(user):
+            return connection.respond(400, "User names are 1-64 letters, digits, '-' or '_'\n")
+        if self.secret is None:
+            return None
+        token = query.get("token", [""])[0]
+        if not token and request.headers.get("Authorization", "").startswith("Bearer "):
+            token = request.headers["Authorization"][len("Bearer "):].strip()
+        if not user or not hmac.compare_digest(token, user_token(self.secret, user)):
+            self.stats["unauthorized"] += 1
+            return connection.respond(401, "Unauthorized\n")
+        return None
+
+    async def handler(self, websocket):
+        query = parse_qs(urlparse(websocket.request.path).query)
+        session_id = f"s{next(self._ids)}"
+        # Checked by authorize(); anonymous (no secret only): a fresh user per connection
+        user = query.get("user", [""])[0] or session_id
+        if len(self.sessions) >= self.max_sessions:
+            self.stats["rejected"] += 1
+            await websocket.close(1013, "Server full, try again later")
+            return
+        self.stats["accepted"] += 1
+        loop = asyncio.get_running_loop()
+
+        def send(event):
+            async def deliver():
+                try:
+                    await websocket.send(json.dumps(event))
+                except ConnectionClosed:
+                    pass
+            loop.create_task(deliver())
+
+        asr = ClientASR(self.asr_backend, self.executor)
+        sink = ClientSink(websocket, loop)
+        tts = TTS(voice_id=self.voice_id, channels=1, pool=self.pool, sink=sink, output_rate=SOURCE_RATE)
+        session, resumed = None, None
+        if self.sessions_dir:
+            session = SessionStore(os.path.join(self.sessions_dir, user))
+            # File IO: off the loop the other sessions run on
+            if query.get("resume"):
+                resumed = await asyncio.to_thread(session.resume)
+            if resumed is None:
+                await asyncio.to_thread(session.start)
+        conversation = asyncio.create_task(main.pipeline(
+            asr, self.llm, tts, ScopedStorage(self.storage, user), barge_in=self.barge_in,
+            context=ConversationContext(self.llm, max_tokens=self.context_tokens), session=session, resumed=resumed,
+            tracer=SessionTracer(self.tracer, session_id, send), shared=True))
+        self.sessions[session_id] = conversation
+        # Said "exit": hang up on the client once the goodbye has been sent
+        conversation.add_done_callback(lambda _: loop.create_task(websocket.close()))
+        print(f"[SERVER] {session_id} connected (user {user}), {len(self.sessions)} active")
+        await websocket.send(json.dumps({"type": "ready", "session": session_id, "input_rate": self.asr_backend.sample_rate,
+                                         "output_rate": SOURCE_RATE}))
+        hung_up = True
+        try:
+            async for message in websocket:
+                if isinstance(message, bytes):
+                    asr.feed(message)
+                    continue
+                try:
+                    event = json.loads(message)
+                except ValueError:
+                    continue
+                if event.get("type") == "text" and event.get("text"):
+                    asr.text(event["text"])
+                elif event.get("type") == "bye":
+                    hung_up = False
+                    break
+        except ConnectionClosed:
+            pass
+        finally:
+            asr.finish()
+            if hung_up:
+                # Nobody is listening any more: stop the turn in progress instead of finishing it
+                conversation.cancel()
+            await asyncio.gather(conversation, return_exceptions=True)
+            sink.close()
+            # The player thread may be waiting on this loop to send: join it from elsewhere
+            await asyncio.to_thread(tts.close)
+            del self.sessions[session_id]
+            self.stats["dropped_utterances"] += asr.dropped
+            print(f"[SERVER] {session_id} closed, {len(self.sessions)} active")
+
+    async def close(self):
+        for conversation in list(self.sessions.values()):
+            conversation.cancel()
+        await asyncio.gather(*self.sessions.values(), return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def listen(server, host, port):
+    """
+    The WebSocket server for `server` (async context manager, see websockets' serve()).
+    """
+    # write_limit: how much reply audio may sit unsent per client before its sink waits
+    return serve(server.handler, host, port, process_request=server.authorize, max_size=2 ** 20, write_limit=256 * 1024)
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+async def run(args):
+    # Access tokens: Env only (a secret on the command line shows up in ps)
+    secret = os.getenv("SERVER_SECRET") or None
+    if secret is None:
+        if not is_loopback(args.host):
+            raise SystemExit(f"Refusing to listen on {args.host} without SERVER_SECRET: any client could open any user's notes and sessions.")
+        print("[SERVER] No SERVER_SECRET: connections are not authenticated, every local process can act as any user")
+    monitor = None
+    if args.profile_loop:
+        monitor = LoopMonitor(args.loop_block_ms, report_path=os.path.join(args.dir, ".traces", "server-loop.json"))
+        monitor.start()
+    if args.asr_backend == "vosk":
+        from modules.asr_backends.vosk import VoskBackend
+        asr_backend = VoskBackend(model_path=args.vosk_model)
+    else:
+        from modules.asr_backends.google import GoogleBackend
+        asr_backend = GoogleBackend()
+    api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not api_key:
+        raise SystemExit("ELEVENLABS_API_KEY not found in environment variables.")
+    pool = ConnectionPool(api_key, size=args.tts_pool)
+    storage = Storage(base_path=args.dir)
+    llm, _ = await asyncio.gather(asyncio.to_thread(main.build_llm, args), storage.open())
+    # Trace file: Arg > Env > Default(<dir>/.traces/server.jsonl); "" = summary only
+    trace_file = args.trace_file if args.trace_file is not None else os.getenv("TRACE_FILE", os.path.join(args.dir, ".traces", "server.jsonl"))
+    tracer = Tracer(trace_file or "")
+    server = Server(llm, pool, storage, asr_backend, tracer, voice_id=args.voice_id, max_sessions=args.max_sessions,
+                    asr_workers=args.asr_workers, barge_in=args.barge_in, context_tokens=args.context_tokens,
+                    sessions_dir=os.path.join(args.dir, ".sessions") if args.session else None, secret=secret)
+    try:
+        async with listen(server, args.host, args.port) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            print(f"[SERVER] {llm.name} serving up to {args.max_sessions} sessions on ws://{args.host}:{port}")
+            await asyncio.Future()
+    finally:
+        await server.close()
+        await llm.aclose()
+        await transport.aclose_all()
+        await pool.close()
+        await storage.close()
+        print(f"[SERVER] {server.stats}")
+        tracer.close()
+        if monitor is not None:
+            monitor.close()
+
+def cli():
+    if sys.argv[1:2] == ["token"]:
+        # python server.py token USER: the token USER connects with (needs the server's SERVER_SECRET)
+        if len(sys.argv) != 3 or not USER_NAME.fullmatch(sys.argv[2]):
+            raise SystemExit("usage: server.py token USER (1-64 letters, digits, '-' or '_')")
+        if not os.getenv("SERVER_SECRET"):
+            raise SystemExit("SERVER_SECRET not found in environment variables.")
+        print(user_token(os.getenv("SERVER_SECRET"), sys.argv[2]))
+        return
+
+    parser = argparse.ArgumentParser(description="Second Brain server: many voice clients over WebSocket",
+                                     epilog="Without SERVER_SECRET there is no authentication: only loopback hosts are allowed. "
+                                            "Subcommand: server.py token USER prints a user's access token.")
+    main.add_llm_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1", help="Anything but loopback requires SERVER_SECRET")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--max-sessions", type=int, default=50, help="Concurrent conversations; more are refused (close code 1013)")
+    parser.add_argument("--dir", default="brain", help="Notes directory (one subdirectory per user)")
+    parser.add_argument("--voice-id", type=str, help="ElevenLabs Voice ID")
+    parser.add_argument("--tts-pool", type=int, default=4, help="Warm ElevenLabs sockets kept ready")
+    parser.add_argument("--asr-backend", choices=["google", "vosk"], default="google", help="Speech recognition engine")
+    parser.add_argument("--vosk-model", type=str, help="Path to a Vosk model directory (or VOSK_MODEL_PATH)")
+    parser.add_argument("--asr-workers", type=int, default=8, help="Threads recognizing finished utterances")
+    parser.add_argument("--barge-in", action=argparse.BooleanOptionalAction, default=True, help="Stop a reply when its client starts talking")
+    parser.add_argument("--context-tokens", type=int, help="History budget per prompt in tokens (or CONTEXT_MAX_TOKENS)")
+    parser.add_argument("--session", action=argparse.BooleanOptionalAction, default=True, help="Save each conversation to <dir>/.sessions/<user> (?resume=1 continues it)")
+    parser.add_argument("--trace-file", type=str, help="Per-turn stage timings as JSON lines (or TRACE_FILE, default <dir>/.traces/server.jsonl; '' = off)")
+    parser.add_argument("--profile-loop", action="store_true", help="Measure event-loop lag and flag blocking callbacks")
+    parser.add_argument("--loop-block-ms", type=float, help="With --profile-loop: stall threshold in ms (or LOOP_BLOCK_MS, default 50)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+if __name__ == "__main__":
+    cli()
@@ -5,22 +5,19 @@ from dotenv import load_dotenv
 from modules.asr import ASR
 from modules.tts import TTS
 from modules.storage import Storage
+from modules.llm import registry, transport
 import json
 
 # Load environment variables
 load_dotenv()
 
+_llms = {}
+
 def get_llm(provider="gemini"):
-    if provider == "gemini":
-        from modules.llm.gemini import GeminiProvider
-        return GeminiProvider()
-    elif provider == "anthropic":
-        from modules.llm.anthropic import AnthropicProvider
-        return AnthropicProvider()
-    elif provider == "openai":
-        from modules.llm.openai import OpenAIProvider
-        return OpenAIProvider()
-    return None
+    # One provider per run: tests reuse its client and warm connections
+    if provider not in _llms:
+        _llms[provider] = registry.create(provider)
+    return _llms[provider]
 
 async def test_single_turn(provider="gemini"):
     """Test 1: Single Turn Full Loop (Mic -> AI -> TTS)"""
@@ -236,7 +233,7 @@ async def test_concurrent_loop(provider="gemini"):
                             
                         if filename:
                             print(f"[STORAGE] Saving to {filename}...")
-                            asyncio.create_task(storage.save(filename, content))
+                            storage.submit(filename, content)
                 
                 # Update history
                 history.append({"role": "model", "content": voice_text})
@@ -259,12 +256,16 @@ async def test_concurrent_loop(provider="gemini"):
     # Wait for them to finish (they finish when 'exit' is spoken)
     await asyncio.gather(producer, consumer)
     
+    await storage.close()
     tts.close()
 
 async def main():
     parser = argparse.ArgumentParser(description="Second Brain Test Suite")
-    parser.add_argument("--provider", default="gemini", choices=["gemini", "anthropic", "openai"])
+    parser.add_argument("--provider", default="gemini", choices=registry.names())
     args = parser.parse_args()
+
+    # Connect to the provider while the menu is up
+    warmup = asyncio.create_task(get_llm(args.provider).warmup())
     
     while True:
         print("\n--- TEST MENU ---")
@@ -273,7 +274,7 @@ async def main():
         print("3. Concurrent Duplex Loop (Simultaneous Listen/Speak)")
         print("q. Quit")
         
-        choice = input("Select an option: ").strip().lower()
+        choice = (await asyncio.to_thread(input, "Select an option: ")).strip().lower()
         
         if choice == '1':
             await test_single_turn(args.provider)
@@ -286,6 +287,9 @@ async def main():
         else:
             print("Invalid choice.")
 
+    warmup.cancel()
+    await transport.aclose_all()
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+ASR offline against a WAV fixture: VAD segmentation of the file, a streaming backend's partial
+hypotheses delivered on the event loop while an utterance is open, and one transcript per utterance.
+"""
+import asyncio
+import math
+import struct
+import threading
+import wave
+import pytest
+from modules.asr import ASR
+from modules.asr_backends.base import ASRBackend, RecognitionStream
+
+LINES = ["first idea", "second idea"]
+SAMPLE_RATE = 16000
+
+class PartialStream(RecognitionStream):
+    """
+    Emits the transcript word by word as partials while audio arrives, like a streaming engine.
+    """
+    def __init__(self, backend, on_partial):
+        self.backend = backend
+        self.on_partial = on_partial
+        self.line = backend.lines[len(backend.streams)]
+        self.frames = 0
+
+    def accept(self, pcm: bytes):
+        self.frames += 1
+        words = self.line.split()[:1 + self.frames // 10]
+        if self.on_partial:
+            self.on_partial(" ".join(words))
+
+    def finish(self) -> str:
+        return self.line
+
+    def cancel(self):
+        pass
+
+class PartialBackend(ASRBackend):
+    def __init__(self, lines):
+        self.lines = lines + ["exit"]
+        self.streams = []
+
+    def open_stream(self, on_partial=None) -> RecognitionStream:
+        stream = PartialStream(self, on_partial)
+        self.streams.append(stream)
+        return stream
+
+@pytest.fixture
+def wav(tmp_path):
+    """
+    Half a second of silence, then one syllable-modulated tone burst per line plus one for "exit",
+    each followed by a second of silence (the shape benchmarks/pipeline.py records).
+    """
+    path = str(tmp_path / "speech.wav")
+    burst = struct.pack(f"<{SAMPLE_RATE}h", *(int(7000 * (0.6 + 0.4 * math.sin(2 * math.pi * 4 * i / SAMPLE_RATE))
+                                                  * math.sin(2 * math.pi * 180 * i / SAMPLE_RATE)) for i in range(SAMPLE_RATE)))
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(bytes(SAMPLE_RATE))
+        for _ in range(len(LINES) + 1):
+            f.writeframes(burst + bytes(SAMPLE_RATE * 2))
+    return path
+
+def test_wav_fixture_partials_and_transcripts(wav):
+    async def listen():
+        loop_thread = threading.get_ident()
+        events = []
+
+        def on_partial(text):
+            assert threading.get_ident() == loop_thread
+            events.append(("partial", text))
+
+        asr = ASR(backend=PartialBackend(list(LINES)), input_wav=wav, input_speed=20.0, on_partial=on_partial)
+        try:
+            async for text in asr.transcripts():
+                events.append(("final", text))
+                assert {"speech_end", "endpoint", "transcript"} <= set(asr.last_timing)
+        finally:
+            asr.close()
+        return events
+
+    events = asyncio.run(asyncio.wait_for(listen(), 30))
+    finals = [text for kind, text in events if kind == "final"]
+    assert finals == LINES + ["exit"]
+    # Every utterance had partials before its transcript, growing towards it
+    for line in finals:
+        end = events.index(("final", line))
+        partials = [text for kind, text in events[:end] if kind == "partial" and line.startswith(text)]
+        assert partials
+        assert partials[0] == line.split()[0]
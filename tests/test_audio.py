@@ -0,0 +1,81 @@
+"""
+The playback path's pure stages: PcmProcessor (modules.audio) and PcmRingBuffer (modules.playback).
+"""
+import numpy as np
+from modules.audio import PcmProcessor
+from modules.playback import PcmRingBuffer
+
+def tone(n, rate=24000, freq=440.0, amplitude=8000):
+    t = np.arange(n) / rate
+    return (np.sin(2 * np.pi * freq * t) * amplitude).astype("<i2").tobytes()
+
+def chunked(processor, pcm, size):
+    return b"".join(bytes(processor.process(pcm[i:i + size])) for i in range(0, len(pcm), size))
+
+def test_passthrough_returns_the_input():
+    pcm = tone(100)
+    processor = PcmProcessor()
+    assert processor.passthrough
+    assert processor.process(pcm) is pcm
+
+def test_upsampling_doubles_the_samples():
+    out = np.frombuffer(bytes(PcmProcessor(24000, 48000).process(tone(2400))), dtype="<i2")
+    assert abs(len(out) - 4800) <= 2
+    # Every other output sample is an input sample
+    assert np.array_equal(out[:4000:2], np.frombuffer(tone(2400), dtype="<i2")[:2000])
+
+def test_resampling_is_seamless_across_chunks():
+    pcm = tone(4800)
+    whole = bytes(PcmProcessor(24000, 44100).process(pcm))
+    # Odd chunk sizes also split samples in half: the carried byte must rejoin them
+    pieces = chunked(PcmProcessor(24000, 44100), pcm, 333)
+    a = np.frombuffer(whole, dtype="<i2").astype(int)
+    b = np.frombuffer(pieces, dtype="<i2").astype(int)
+    n = min(len(a), len(b))
+    assert abs(len(a) - len(b)) <= 1
+    assert np.max(np.abs(a[:n] - b[:n])) <= 1
+
+def test_odd_byte_is_carried_to_the_next_chunk():
+    processor = PcmProcessor(gain=0.5)
+    pcm = np.array([1000, -2000, 3000], dtype="<i2").tobytes()
+    out = bytes(processor.process(pcm[:3])) + bytes(processor.process(pcm[3:]))
+    assert np.frombuffer(out, dtype="<i2").tolist() == [500, -1000, 1500]
+
+def test_gain_clips_instead_of_wrapping():
+    pcm = np.array([20000, -20000, 100], dtype="<i2").tobytes()
+    out = np.frombuffer(bytes(PcmProcessor(gain=2.0).process(pcm)), dtype="<i2")
+    assert out.tolist() == [32767, -32768, 200]
+
+def test_channel_fan_out_and_gains():
+    pcm = np.array([1000, -1000], dtype="<i2").tobytes()
+    stereo = np.frombuffer(bytes(PcmProcessor(channels=2).process(pcm)), dtype="<i2")
+    assert stereo.tolist() == [1000, 1000, -1000, -1000]
+    panned = np.frombuffer(bytes(PcmProcessor(channels=2, channel_gains=[1.0, 0.0]).process(pcm)), dtype="<i2")
+    assert panned.tolist() == [1000, 0, -1000, 0]
+
+def test_reset_forgets_the_carried_byte():
+    processor = PcmProcessor(gain=0.5)
+    processor.process(b"\x01")
+    processor.reset()
+    assert bytes(processor.process(np.array([400], dtype="<i2").tobytes())) == np.array([200], dtype="<i2").tobytes()
+
+def test_ring_wraps_around():
+    ring = PcmRingBuffer(8)
+    assert ring.write_nowait(b"abcdef") == 6
+    out = bytearray(4)
+    assert ring.read_into(memoryview(out)) == 4
+    assert bytes(out) == b"abcd"
+    # Wraps: 2 bytes at the end of the buffer, 4 at the start
+    assert ring.write_nowait(b"ghijkl") == 6
+    assert len(ring) == 8 and ring.free == 0
+    out = bytearray(8)
+    assert ring.read_into(memoryview(out)) == 8
+    assert bytes(out) == b"efghijkl"
+
+def test_ring_full_and_empty():
+    ring = PcmRingBuffer(4)
+    assert ring.write_nowait(b"abcdef") == 4
+    assert ring.write_nowait(b"x") == 0
+    assert ring.clear() == 4
+    assert ring.read_into(memoryview(bytearray(4))) == 0
+    assert ring.free == 4
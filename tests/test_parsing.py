@@ -0,0 +1,53 @@
+"""
+Reply parsing (modules.llm.parsing) against the malformed-response corpus and the streaming helpers.
+"""
+import json
+import os
+import pytest
+from modules.llm.parsing import JSONStringStreamer, SentenceChunker, extract_json, parse_response, repair_json
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus", "malformed_responses.jsonl")
+
+with open(CORPUS, encoding="utf-8") as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+@pytest.mark.parametrize("case", CASES, ids=[case["case"] for case in CASES])
+def test_corpus(case):
+    if case["text"] is None:
+        # Nothing usable in it: must be refused, not invented
+        with pytest.raises(ValueError):
+            parse_response(case["raw"])
+        return
+    data = parse_response(case["raw"])
+    assert data["voice_output"]["text"] == case["text"]
+    assert (data.get("data_management") or {}).get("will_capture") is case["will_capture"]
+
+def test_repair_reports_truncation():
+    info = {}
+    repaired = repair_json('{"voice_output": {"text": "Hi"}, "data_management": {"will_capture": true, "content": "half', info)
+    assert info.get("truncated") is True
+    assert json.loads(repaired)["voice_output"]["text"] == "Hi"
+
+def test_repair_leaves_a_whole_document_untruncated():
+    info = {}
+    repair_json('{"voice_output": {"text": "Hi",},}', info)
+    assert not info.get("truncated")
+
+def test_truncated_reply_drops_its_capture():
+    data = extract_json('{"voice_output": {"text": "Saved."}, "data_management": {"will_capture": true, "capture_payload": {"content": "hal')
+    assert data["voice_output"]["text"] == "Saved."
+    assert data["data_management"] == {"will_capture": False}
+    assert data["truncated"] is True
+
+def test_streamer_yields_voice_text_across_chunks():
+    streamer = JSONStringStreamer()
+    raw = '{"voice_output": {"text": "Line one.\\nSay \\"hi\\" \\u00e9"}, "data_management": {"will_capture": false}}'
+    text = "".join(streamer.feed(raw[i:i + 7]) for i in range(0, len(raw), 7))
+    assert text == 'Line one.\nSay "hi" é'
+
+def test_sentence_chunker_splits_on_sentence_ends():
+    chunker = SentenceChunker(min_chars=5)
+    out = chunker.feed("First sentence here. Second one")
+    out += chunker.feed(" ends now! Tail")
+    assert out == ["First sentence here.", "Second one ends now!"]
+    assert chunker.flush() == "Tail"
@@ -0,0 +1,78 @@
+"""
+SessionStore (modules.session_store): per-turn deltas and snapshots load back to the state they recorded.
+"""
+import copy
+import os
+from modules.session_store import SessionStore, apply_delta
+
+def turn(state, n, window=None):
+    """
+    One exchange; with a window, messages beyond it are evicted from the front like ConversationContext does.
+    """
+    state = copy.deepcopy(state)
+    state["messages"].append({"role": "user", "content": f"question {n}"})
+    state["messages"].append({"role": "model", "content": f"answer {n}"})
+    state["turn"] = n
+    if window is not None and len(state["messages"]) > window:
+        over = len(state["messages"]) - window
+        state["messages"] = state["messages"][over:]
+        state["evicted"] = state.get("evicted", 0) + over
+        state["summary"] = f"summary up to {n}"
+    return state
+
+def test_diff_round_trip():
+    store = SessionStore(directory="unused")
+    store._last = {"messages": [{"c": 1}, {"c": 2}, {"c": 3}], "evicted": 0, "turn": 1}
+    new = {"messages": [{"c": 2}, {"c": 3}, {"c": 4}], "evicted": 1, "turn": 2}
+    delta = store.diff(new)
+    assert delta == {"drop": 1, "keep": 2, "append": [{"c": 4}], "set": {"evicted": 1, "turn": 2}}
+    assert apply_delta(copy.deepcopy(store._last), delta) == new
+
+def test_resume_replays_deltas(tmp_path):
+    store = SessionStore(directory=str(tmp_path), snapshot_every=100)
+    session_id = store.start()
+    state = {"messages": []}
+    for n in range(1, 6):
+        state = turn(state, n, window=4)
+        store.record(copy.deepcopy(state))
+    # No close(): as after a crash, only the deltas are on disk
+    store._log.close()
+    store._log = None
+    assert not os.path.exists(os.path.join(str(tmp_path), f"{session_id}.snap"))
+    assert SessionStore(directory=str(tmp_path)).resume(session_id) == state
+
+def test_snapshot_folds_the_log(tmp_path):
+    store = SessionStore(directory=str(tmp_path), snapshot_every=3)
+    session_id = store.start()
+    state = {"messages": []}
+    for n in range(1, 8):
+        state = turn(state, n, window=6)
+        store.record(copy.deepcopy(state))
+    store._log.close()
+    store._log = None
+    resumed = SessionStore(directory=str(tmp_path))
+    assert resumed.resume(session_id) == state
+    # Snapshot after turn 6, so one delta left to replay
+    assert resumed._deltas == 1
+    # Recording continues in the resumed session
+    state = turn(state, 8, window=6)
+    resumed.record(copy.deepcopy(state))
+    resumed.close(copy.deepcopy(state))
+    assert SessionStore(directory=str(tmp_path)).resume() == state
+
+def test_unchanged_turn_writes_nothing(tmp_path):
+    store = SessionStore(directory=str(tmp_path))
+    store.start()
+    state = turn({"messages": []}, 1)
+    store.record(copy.deepcopy(state))
+    seq = store._log.seq
+    store.record(copy.deepcopy(state))
+    assert store._log.seq == seq
+    store.close()
+
+def test_empty_session_is_removed(tmp_path):
+    store = SessionStore(directory=str(tmp_path))
+    session_id = store.start()
+    store.close({"messages": []})
+    assert session_id not in SessionStore(directory=str(tmp_path)).sessions()
+    assert SessionStore(directory=str(tmp_path)).resume() is None
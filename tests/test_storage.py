@@ -0,0 +1,194 @@
+"""
+Crash recovery of modules.storage: the journal, checkpoints and replay into the markdown views.
+A "crash" stops the writer without the final fsync and checkpoint close() would do.
+"""
+import asyncio
+import json
+import os
+import struct
+import zlib
+from modules.storage import Journal, Storage
+
+def run(coro):
+    return asyncio.run(coro)
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+async def crash_after(base, checkpointed, unchecked, filename="n.md"):
+    """
+    Saves `checkpointed`, checkpoints them, saves `unchecked` (in the view, not in the checkpoint) and dies.
+    """
+    storage = Storage(base, fsync_interval=1000)
+    await storage.open()
+    for content in checkpointed:
+        await storage.save(filename, content)
+    await storage.flush()
+    for content in unchecked:
+        await storage.save(filename, content)
+    storage._writer.cancel()
+    try:
+        await storage._writer
+    except asyncio.CancelledError:
+        pass
+    for handle in storage._files.values():
+        handle.close()
+    storage.journal.close()
+
+async def reopen(base, rebuild=False):
+    storage = Storage(base, fsync_interval=1000)
+    await storage.open()
+    if rebuild:
+        await storage.rebuild()
+    await storage.close()
+    return storage
+
+def append_record(base, record):
+    """
+    Commits a record to the journal without applying it: a crash between journal and view.
+    """
+    journal = Journal(os.path.join(base, ".journal", "journal.log"))
+    journal.open()
+    journal.append([record])
+    journal.close()
+
+def test_torn_tail_is_dropped(tmp_path):
+    base = str(tmp_path)
+    run(crash_after(base, ["## one"], []))
+    log = os.path.join(base, ".journal", "journal.log")
+    intact = os.path.getsize(log)
+    with open(log, "ab") as f:
+        # Header of a 100 byte record, only 3 bytes of it made it
+        f.write(struct.pack("<II", 100, 0) + b'{"s')
+    storage = run(reopen(base))
+    assert os.path.getsize(log) == intact
+    assert read(os.path.join(base, "n.md")) == b"## one\n"
+    assert storage.stats["errors"] == 0
+
+def test_crc_mismatch_ends_the_log(tmp_path):
+    base = str(tmp_path)
+    run(crash_after(base, ["## one", "## two"], []))
+    log = os.path.join(base, ".journal", "journal.log")
+    data = bytearray(read(log))
+    data[-3] ^= 0xFF  # inside the payload of the last record
+    with open(log, "wb") as f:
+        f.write(data)
+    records, valid, total = Journal.read(log)
+    assert [r["content"] for r in records] == ["## one"]
+    assert valid < total
+    length, crc = struct.unpack_from("<II", data, 0)
+    assert zlib.crc32(bytes(data[8:8 + length])) == crc
+
+def test_replay_after_checkpoint(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, ["## one"], ["## two"]))
+    # Committed to the journal, never reached the view
+    append_record(base, {"ts": 0, "file": "n.md", "mode": "a", "content": "## three"})
+    storage = run(reopen(base))
+    assert read(path) == b"## one\n## two\n## three\n"
+    assert storage.stats["replayed"] == 2
+    # Everything is checkpointed now: a second start has nothing to do
+    assert run(reopen(base)).stats["replayed"] == 0
+    assert read(path) == b"## one\n## two\n## three\n"
+
+def test_torn_view_is_rolled_back_to_the_checkpoint(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, ["## one"], ["## two"]))
+    with open(path, "ab") as f:
+        f.write(b"## thr")
+    run(reopen(base))
+    assert read(path) == b"## one\n## two\n"
+
+def test_view_shorter_than_journal(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, ["## one", "## two"], ["## three"]))
+    # Lost its tail after the checkpoint (restored from an old copy): never cut, only completed
+    with open(path, "wb") as f:
+        f.write(b"## one\n")
+    run(reopen(base))
+    assert read(path) == b"## one\n## three\n"
+
+def test_repeated_capture_survives_merge(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, [], ["same line", "same line"]))
+    # No checkpoint and the second copy never reached the view
+    os.remove(os.path.join(base, ".journal", "views.json"))
+    with open(path, "wb") as f:
+        f.write(b"same line\n")
+    run(reopen(base))
+    assert read(path) == b"same line\nsame line\n"
+
+def test_merge_without_checkpoint_adds_nothing_twice(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, ["## one"], ["## two"]))
+    with open(os.path.join(base, ".journal", "views.json"), "w") as f:
+        f.write("{garbage")
+    run(reopen(base))
+    assert read(path) == b"## one\n## two\n"
+
+def test_rebuild_keeps_notes_from_before_the_journal(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    with open(path, "w") as f:
+        f.write("# Old notes\n")
+
+    async def session():
+        storage = Storage(base)
+        await storage.open()
+        await storage.save("n.md", "## new")
+        await storage.close()
+
+    run(session())
+    with open(path, "ab") as f:
+        f.write(b"garbage\n")
+    run(reopen(base, rebuild=True))
+    assert read(path) == b"# Old notes\n## new\n"
+
+def test_rewrite_defines_the_file_on_rebuild(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+
+    async def session():
+        storage = Storage(base)
+        await storage.open()
+        await storage.save("n.md", "a")
+        await storage.save("n.md", "fresh", mode="w")
+        await storage.save("n.md", "b")
+        await storage.close()
+
+    run(session())
+    run(reopen(base, rebuild=True))
+    assert read(path) == b"fresh\nb\n"
+
+def test_legacy_checkpoint_with_sizes_only(tmp_path):
+    base = str(tmp_path)
+    path = os.path.join(base, "n.md")
+    run(crash_after(base, ["## one"], ["## two"]))
+    checkpoint_path = os.path.join(base, ".journal", "views.json")
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    checkpoint["files"] = {name: entry["size"] for name, entry in checkpoint["files"].items()}
+    with open(checkpoint_path, "w") as f:
+        json.dump(checkpoint, f)
+    run(reopen(base))
+    assert read(path) == b"## one\n## two\n"
+
+def test_unencodable_text_does_not_stop_the_writer(tmp_path):
+    base = str(tmp_path)
+
+    async def session():
+        storage = Storage(base)
+        await storage.open()
+        results = [await asyncio.wait_for(storage.save("n.md", "broken \ud83d"), 5),
+                   await asyncio.wait_for(storage.save("n.md", "next"), 5)]
+        await storage.close()
+        return results
+
+    assert run(session()) == [True, True]
+    assert read(os.path.join(base, "n.md")) == b"broken ?\nnext\n"
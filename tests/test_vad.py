@@ -0,0 +1,78 @@
+"""
+VADSegmenter (modules.asr) on synthetic 16 kHz frames: quiet hiss for silence, a loud square wave for speech.
+"""
+from array import array
+from modules.asr import VADSegmenter
+
+FRAME_SAMPLES = 480  # 30 ms at 16 kHz
+
+def frame(amplitude):
+    return array("h", [amplitude if i % 2 else -amplitude for i in range(FRAME_SAMPLES)]).tobytes()
+
+SILENCE = frame(40)
+SPEECH = frame(4000)
+
+def feed(vad, frames):
+    events = []
+    for f in frames:
+        event, pcm = vad.feed(f)
+        if event is not None:
+            events.append((event, pcm))
+    return events
+
+def calibrated():
+    vad = VADSegmenter()
+    assert feed(vad, [SILENCE] * vad.calibration_frames) == []
+    assert vad.calibrated
+    return vad
+
+def test_calibration_sets_the_noise_floor():
+    vad = calibrated()
+    assert vad.noise_floor == 40
+    assert vad.threshold == vad.min_threshold
+
+def test_utterance_start_includes_pre_roll():
+    vad = calibrated()
+    events = feed(vad, [SILENCE] * 5 + [SPEECH] * vad.start_frames)
+    assert [e for e, _ in events] == [VADSegmenter.START]
+    pcm = events[0][1]
+    # The whole pre-roll (300 ms, silence before the speech included) leads the utterance
+    assert len(pcm) == vad.pre_roll.maxlen * vad.frame_bytes
+    assert pcm.startswith(SILENCE)
+    assert pcm.endswith(SPEECH * vad.start_frames)
+
+def test_utterance_ends_after_the_hangover():
+    vad = calibrated()
+    speech = [SPEECH] * 20
+    events = feed(vad, speech + [SILENCE] * vad.hangover_frames)
+    kinds = [e for e, _ in events]
+    assert kinds[0] == VADSegmenter.START
+    assert kinds[-1] == VADSegmenter.END
+    assert set(kinds[1:-1]) == {VADSegmenter.SPEECH}
+    end_pcm = events[-1][1]
+    assert SPEECH * 20 in end_pcm
+    assert end_pcm.endswith(SILENCE * vad.hangover_frames)
+    assert vad.trailing_silence_ms == vad.hangover_frames * vad.frame_ms
+    assert not vad.confirmed
+
+def test_short_blip_is_discarded():
+    vad = calibrated()
+    events = feed(vad, [SPEECH] * vad.start_frames + [SILENCE] * vad.hangover_frames)
+    assert events[0][0] == VADSegmenter.START
+    assert events[-1][0] == VADSegmenter.DISCARD
+
+def test_long_utterance_is_cut_at_the_limit():
+    vad = VADSegmenter(max_utterance_s=1)
+    feed(vad, [SILENCE] * vad.calibration_frames)
+    events = feed(vad, [SPEECH] * (vad.max_frames + 10))
+    ends = [pcm for e, pcm in events if e == VADSegmenter.END]
+    assert ends
+    assert len(ends[0]) <= vad.max_frames * vad.frame_bytes
+
+def test_noise_floor_adapts_only_to_silence():
+    vad = calibrated()
+    feed(vad, [frame(80)] * 50)
+    assert 40 < vad.noise_floor <= 80
+    floor = vad.noise_floor
+    feed(vad, [SPEECH] * 20)
+    assert vad.noise_floor == floor